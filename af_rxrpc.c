@@ -9,12 +9,13 @@
  * 2 of the Licence, or (at your option) any later version.
  */
 
-#define _XOPEN_SOURCE
+#define _XOPEN_SOURCE 700
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
 #include <unistd.h>
 #include <poll.h>
+#include <time.h>
 #include <errno.h>
 #include <limits.h>
 #include <sys/socket.h>
@@ -27,8 +28,148 @@
 
 #define debug(fmt, ...) do { if (0) printf(fmt, ## __VA_ARGS__); } while (0)
 
+/* How often, in milliseconds, to check on calls whose replies are being read
+ * by another thread whilst we wait on sockets of our own.
+ */
+#define RXRPC_BUSY_RECHECK	10
+
 uint32_t rxgen_dec_padding_sink;
 
+/*
+ * Drop the caller's lock around a blocking operation and retake it afterwards.
+ */
+static inline void *rxrpc_unlock_caller(struct rx_connection *z_conn)
+{
+	return z_conn->unlock_caller ? z_conn->unlock_caller() : NULL;
+}
+
+static inline void rxrpc_relock_caller(struct rx_connection *z_conn, void *cookie)
+{
+	int saved_errno = errno;
+
+	if (z_conn->relock_caller)
+		z_conn->relock_caller(cookie);
+	errno = saved_errno;
+}
+
+/*
+ * Map a buffer size onto its index in the pool.
+ */
+static unsigned rxrpc_buf_size_index(unsigned size)
+{
+	unsigned ix = 0;
+
+	while (size > RXGEN_BUFFER_SIZE) {
+		size >>= 1;
+		ix++;
+	}
+	return ix;
+}
+
+/*
+ * Get a buffer of the given size, preferably from the connection's pool.
+ */
+static struct rx_buf *rxrpc_get_buf(struct rx_connection *z_conn, unsigned size)
+{
+	struct rx_buf *buf;
+	unsigned ix = rxrpc_buf_size_index(size);
+
+	pthread_mutex_lock(&z_conn->pool_lock);
+	buf = z_conn->pool[ix];
+	if (buf) {
+		z_conn->pool[ix] = buf->next;
+		z_conn->pool_stats.pooled--;
+		z_conn->pool_stats.pooled_bytes -= buf->size;
+		z_conn->pool_stats.reused++;
+		pthread_mutex_unlock(&z_conn->pool_lock);
+		buf->magic = RXGEN_BUF_MAGIC;
+		buf->io_cursor = 0;
+		buf->next = NULL;
+		return buf;
+	}
+	z_conn->pool_stats.allocated++;
+	pthread_mutex_unlock(&z_conn->pool_lock);
+
+	buf = calloc(1, sizeof(struct rx_buf));
+	if (!buf)
+		return NULL;
+	buf->buf = malloc(size);
+	if (!buf->buf) {
+		free(buf);
+		return NULL;
+	}
+	buf->magic = RXGEN_BUF_MAGIC;
+	buf->size = size;
+	return buf;
+}
+
+/*
+ * Return a spent buffer to the connection's pool, freeing it if the pool is
+ * full.
+ */
+static void rxrpc_put_buf(struct rx_connection *z_conn, struct rx_buf *buf)
+{
+	unsigned ix = rxrpc_buf_size_index(buf->size);
+
+	buf->magic = RXGEN_BUF_DEAD;
+
+	pthread_mutex_lock(&z_conn->pool_lock);
+	if (z_conn->pool_stats.pooled_bytes + buf->size <= RXGEN_BUF_POOL_MAX) {
+		buf->next = z_conn->pool[ix];
+		z_conn->pool[ix] = buf;
+		z_conn->pool_stats.pooled++;
+		z_conn->pool_stats.pooled_bytes += buf->size;
+		z_conn->pool_stats.released++;
+		pthread_mutex_unlock(&z_conn->pool_lock);
+		return;
+	}
+	z_conn->pool_stats.freed++;
+	pthread_mutex_unlock(&z_conn->pool_lock);
+
+	free(buf->buf);
+	free(buf);
+}
+
+/*
+ * Work out how big the next buffer added to a call should be.  This will be
+ * big enough to hold what the decoder has said it's expecting, within limits.
+ */
+static unsigned rxrpc_next_buf_size(const struct rx_call *call)
+{
+	unsigned size = call->buffer_size;
+
+	while (size < call->size_hint && size < RXGEN_BUFFER_MAX)
+		size <<= 1;
+	return size;
+}
+
+/*
+ * Note that a buffer has been added to a call and that some amount of data
+ * has been put into it.  The buffers grow geometrically as the call transfers
+ * more data so that a large transfer ends up in a few big buffers.
+ */
+static void rxrpc_buf_added(struct rx_call *call, const struct rx_buf *buf,
+			    unsigned used)
+{
+	unsigned size = buf->size > call->buffer_size ? buf->size : call->buffer_size;
+
+	call->buffer_size = size < RXGEN_BUFFER_MAX ? size << 1 : size;
+	if (call->size_hint > used)
+		call->size_hint -= used;
+	else
+		call->size_hint = 0;
+}
+
+/*
+ * Get a snapshot of the buffer pool statistics for a connection.
+ */
+void rx_get_buf_stats(struct rx_connection *z_conn, struct rx_buf_stats *stats)
+{
+	pthread_mutex_lock(&z_conn->pool_lock);
+	*stats = z_conn->pool_stats;
+	pthread_mutex_unlock(&z_conn->pool_lock);
+}
+
 /*
  * dump the control messages
  */
@@ -137,6 +278,10 @@ struct rx_connection *rx_new_connection(const struct sockaddr *sa,
 	z_conn = calloc(1, sizeof(*z_conn));
 	if (!z_conn)
 		return NULL;
+	pthread_mutex_init(&z_conn->recv_lock, NULL);
+	pthread_cond_init(&z_conn->recv_wait, NULL);
+	pthread_mutex_init(&z_conn->pool_lock, NULL);
+	z_conn->recv_buf_size = RXGEN_BUFFER_SIZE;
 
 	z_conn->peer.srx_family = AF_RXRPC;
 	z_conn->peer.srx_service = service;
@@ -233,17 +378,39 @@ inval:
 error_fd:
 	close(z_conn->fd);
 error_conn:
+	pthread_mutex_destroy(&z_conn->pool_lock);
+	pthread_cond_destroy(&z_conn->recv_wait);
+	pthread_mutex_destroy(&z_conn->recv_lock);
 	free(z_conn);
 	return NULL;
 }
 
 /*
  * Close an RxRPC client connection.  This will cause all outstanding
- * operations to be aborted by the kernel..
+ * operations to be aborted by the kernel, after which the kernel holds none of
+ * the calls we were keeping for it.
  */
 void rx_close_connection(struct rx_connection *z_conn)
 {
+	struct rx_call *call;
+	struct rx_buf *buf;
+	int ix;
+
 	close(z_conn->fd);
+	while ((call = z_conn->zombies)) {
+		z_conn->zombies = call->next_zombie;
+		free(call);
+	}
+	for (ix = 0; ix < RXGEN_BUF_NR_SIZES; ix++) {
+		while ((buf = z_conn->pool[ix])) {
+			z_conn->pool[ix] = buf->next;
+			free(buf->buf);
+			free(buf);
+		}
+	}
+	pthread_mutex_destroy(&z_conn->pool_lock);
+	pthread_cond_destroy(&z_conn->recv_wait);
+	pthread_mutex_destroy(&z_conn->recv_lock);
 	free(z_conn);
 }
 
@@ -261,24 +428,15 @@ struct rx_call *rxrpc_alloc_call(struct rx_connection *z_conn,
 	if (!call)
 		return NULL;
 
-	buf = calloc(1, sizeof(struct rx_buf));
+	buf = rxrpc_get_buf(z_conn, RXGEN_BUFFER_SIZE);
 	if (!buf) {
 		free(call);
 		return NULL;
 	}
-
-	data = malloc(RXGEN_BUFFER_SIZE);
-	if (!data) {
-		free(buf);
-		free(call);
-		return NULL;
-	}
+	data = buf->buf;
 
 	debug("Alloc: buf=%p data=%p\n", buf, data);
 
-	buf->magic = RXGEN_BUF_MAGIC;
-	buf->buf = data;
-
 	if (incoming_call)
 		call->state = rx_call_sv_not_started;
 	else
@@ -294,6 +452,8 @@ struct rx_call *rxrpc_alloc_call(struct rx_connection *z_conn,
 	call->data_cursor = data;
 	call->data_stop = incoming_call ? data : data + RXGEN_BUFFER_SIZE;
 	call->buffer_space = RXGEN_BUFFER_SIZE;
+	call->buffer_size = RXGEN_BUFFER_SIZE;
+	rxrpc_set_call_timeout(call, z_conn->call_timeout);
 	return call;
 }
 
@@ -302,7 +462,7 @@ static void rxrpc_check_buf(const struct rx_buf *buf)
 	if (0) {
 		if ((buf->magic ^ RXGEN_BUF_MAGIC) & 0xffff0000U)
 			abort();
-		if (buf->io_cursor > RXGEN_BUFFER_SIZE)
+		if (buf->io_cursor > buf->size)
 			abort();
 	}
 }
@@ -324,34 +484,22 @@ static void rxrpc_check_call(const struct rx_call *call)
 }
 
 /*
- * Send buffered data.
+ * Transmit everything that's pending in the buffer chain, followed by size
+ * bytes of the caller's data (if any), directly out of the buffers concerned.
+ * As much as possible is handed to the kernel in each sendmsg() call.
  */
-int rxrpc_send_data(struct rx_call *call)
+static int rxrpc_transmit(struct rx_call *call, const uint8_t *data, size_t size)
 {
 	struct rx_buf *cursor;
 	struct msghdr msg;
 	size_t ctrllen;
 	unsigned char control[128];
-	struct iovec iov[16];
+	struct iovec iov[RXGEN_SEND_IOV_MAX];
 	unsigned more;
-	int ioc, ret, i;
-
-	debug("-->rxrpc_send_data(%u,0x%x)\n", call->state, call->data_count);
-
-	rxrpc_check_call(call);
-
-	/* Switch into encode state */
-	switch (call->state) {
-	case rx_call_cl_not_started:
-	case rx_call_sv_processing:
-		call->state++;
-	case rx_call_cl_encoding_params:
-	case rx_call_sv_encoding_response:
-		break;
-	default:
-		fprintf(stderr, "RxRPC: Send in bad call state (%d)\n", call->state);
-		abort();
-	}
+	void *cookie;
+	ssize_t ret;
+	bool whole_chain;
+	int ioc, i;
 
 more_to_send:
 	/* Request an operation */
@@ -370,39 +518,54 @@ more_to_send:
 	 * allowed to be empty at any point.
 	 */
 	cursor = call->buffer_head;
-	if (cursor->io_cursor == RXGEN_BUFFER_SIZE) {
+	if (cursor->io_cursor == cursor->size && cursor != call->buffer_tail) {
 		struct rx_buf *sent = cursor;
-		if (sent == call->buffer_tail)
-			abort();
 		call->buffer_head = cursor = sent->next;
-		sent->magic = RXGEN_BUF_DEAD;
-		free(sent->buf);
-		free(sent);
+		rxrpc_put_buf(call->conn, sent);
 	}
 
+	/* Gather the whole of the pending chain, keeping one slot back for the
+	 * caller's buffer.
+	 */
 	more = MSG_MORE;
-	for (ioc = 0; ioc < 16; ioc++) {
-		rxrpc_check_buf(cursor);
+	ioc = 0;
+	whole_chain = call->data_count == 0;
+	if (!whole_chain) {
+		for (; ioc < RXGEN_SEND_IOV_MAX - 1; ioc++) {
+			rxrpc_check_buf(cursor);
 
-		unsigned io_cursor = cursor->io_cursor;
-		unsigned end = RXGEN_BUFFER_SIZE;
+			unsigned io_cursor = cursor->io_cursor;
+			unsigned end = cursor->size;
 
-		if (io_cursor == RXGEN_BUFFER_SIZE)
-			abort();
-		if (cursor == call->buffer_tail)
-			end = call->data_cursor - cursor->buf;
+			if (io_cursor == cursor->size)
+				abort();
+			if (cursor == call->buffer_tail)
+				end = call->data_cursor - cursor->buf;
 
-		debug("BUF[%02u] %04x %04x\n", ioc, io_cursor, end);
+			debug("BUF[%02u] %04x %04x\n", ioc, io_cursor, end);
 
-		iov[ioc].iov_base = cursor->buf + io_cursor;
-		iov[ioc].iov_len = end - io_cursor;
-		if (cursor == call->buffer_tail) {
-			if (!call->more_send)
-				more = 0;
+			iov[ioc].iov_base = cursor->buf + io_cursor;
+			iov[ioc].iov_len = end - io_cursor;
+			if (cursor == call->buffer_tail) {
+				whole_chain = true;
+				ioc++;
+				break;
+			}
+			cursor = cursor->next;
+		}
+	}
+
+	if (whole_chain) {
+		/* The chain fits, so the caller's data can go in the same
+		 * message.
+		 */
+		if (size > 0) {
+			iov[ioc].iov_base = (void *)data;
+			iov[ioc].iov_len = size;
 			ioc++;
-			break;
 		}
-		cursor = cursor->next;
+		if (!call->more_send)
+			more = 0;
 	}
 	msg.msg_iovlen = ioc;
 
@@ -413,42 +576,72 @@ more_to_send:
 		debug("IOV[%02u] %04zu %p\n",
 		      i, msg.msg_iov[i].iov_len, msg.msg_iov[i].iov_base);
 
+	cookie = rxrpc_unlock_caller(call->conn);
 	ret = sendmsg(call->conn->fd, &msg, more);
-	debug("SENDMSG: %d%s\n", ret, more ? " [more]" : "");
+	rxrpc_relock_caller(call->conn, cookie);
+	debug("SENDMSG: %zd%s\n", ret, more ? " [more]" : "");
 	if (ret == -1)
 		return -1;
 
 	call->bytes_sent += ret;
-	call->data_count -= ret;
 	call->known_to_kernel = 1;
 
 	/* Free up any completely sent buffers, without completely emptying the
-	 * queue.
+	 * queue.  The kernel may not have taken everything we offered.
 	 */
 	cursor = call->buffer_head;
-	do {
+	while (ret > 0 && call->data_count > 0) {
 		struct rx_buf *sent = cursor;
-		unsigned count = RXGEN_BUFFER_SIZE - cursor->io_cursor;
+		unsigned end = cursor->size;
+		unsigned count;
 
+		if (cursor == call->buffer_tail)
+			end = call->data_cursor - cursor->buf;
+		count = end - cursor->io_cursor;
 		if (count > ret)
 			count = ret;
 		cursor->io_cursor += count;
+		call->data_count -= count;
 		ret -= count;
-		if (cursor == call->buffer_tail)
+		if (cursor == call->buffer_tail || cursor->io_cursor < end)
 			break;
-		sent = cursor;
 		cursor = cursor->next;
 		call->buffer_head = cursor;
 		rxrpc_check_buf(sent);
-		sent->magic = RXGEN_BUF_DEAD;
-		free(sent->buf);
-		free(sent);
-	} while (ret > 0);
+		rxrpc_put_buf(call->conn, sent);
+	}
+
+	/* Anything left over came out of the caller's buffer */
+	data += ret;
+	size -= ret;
 
 	rxrpc_check_call(call);
 
-	if (call->data_count > 0)
+	if (call->data_count > 0 || size > 0)
 		goto more_to_send;
+	return 0;
+}
+
+static void rxrpc_begin_send(struct rx_call *call)
+{
+	rxrpc_check_call(call);
+
+	/* Switch into encode state */
+	switch (call->state) {
+	case rx_call_cl_not_started:
+	case rx_call_sv_processing:
+		call->state++;
+	case rx_call_cl_encoding_params:
+	case rx_call_sv_encoding_response:
+		break;
+	default:
+		fprintf(stderr, "RxRPC: Send in bad call state (%d)\n", call->state);
+		abort();
+	}
+}
+
+static void rxrpc_end_send(struct rx_call *call)
+{
 	if (call->data_count == 0 && !call->more_send)
 		call->state++;
 
@@ -465,14 +658,83 @@ more_to_send:
 		call->buffer_head->io_cursor = 0;
 		call->data_count = 0;
 	}
+}
 
+/*
+ * Send buffered data.
+ */
+int rxrpc_send_data(struct rx_call *call)
+{
+	debug("-->rxrpc_send_data(%u,0x%x)\n", call->state, call->data_count);
+
+	rxrpc_begin_send(call);
+	if (rxrpc_transmit(call, NULL, 0) < 0)
+		return -1;
+	rxrpc_end_send(call);
 	return 0;
 }
 
 /*
- * Receive data from a socket.
+ * Send buffered data followed by the contents of the caller's buffer.  The
+ * caller's data is transmitted straight out of their buffer rather than being
+ * copied into the call's buffer chain, so it must be already be correctly
+ * padded or be followed by further data that pads it.  If more is false, this
+ * is the last data to be sent for this call.
  */
-int rxrpc_recv_data(struct rx_connection *z_conn, bool nowait)
+int rxrpc_send_buffer(struct rx_call *call, const void *data, size_t size,
+		      bool more)
+{
+	debug("-->rxrpc_send_buffer(%u,0x%x,%zu)\n",
+	      call->state, call->data_count, size);
+
+	if (call->error_code) {
+		errno = call->error_code;
+		return -1;
+	}
+
+	rxrpc_begin_send(call);
+	if (!more)
+		call->more_send = 0;
+	if (rxrpc_transmit(call, data, size) < 0)
+		return -1;
+	rxrpc_end_send(call);
+	return 0;
+}
+
+/*
+ * Free a terminated call now that the kernel has given us its final message
+ * and so won't mention the call's ID again.
+ */
+static void rxrpc_free_zombie(struct rx_connection *z_conn, struct rx_call *call)
+{
+	struct rx_call **pp;
+
+	for (pp = &z_conn->zombies; *pp; pp = &(*pp)->next_zombie) {
+		if (*pp == call) {
+			*pp = call->next_zombie;
+			break;
+		}
+	}
+	call->magic = 0x7a7b7c7d;
+	free(call);
+}
+
+/*
+ * Receive the next message from a socket and attach its data and metadata to
+ * the call it belongs to.  The caller must have claimed the socket and must
+ * hold their own lock, which is only dropped whilst we're in recvmsg() so that
+ * calls are never changed without it.
+ *
+ * We don't know which call a message belongs to until we've read it, so the
+ * data is received into fresh buffers from the connection's pool and those
+ * that get used are then appended to the call's buffer chain.  This means the
+ * data and the control messages can be read with a single syscall.
+ *
+ * Returns 0 and the call to be dispatched in *_call, which is NULL if the
+ * message was for a call that has been terminated, or -1 on error.
+ */
+static int rxrpc_recv_msg(struct rx_connection *z_conn, bool nowait,
+			  struct rx_call **_call)
 {
 	struct rx_call *call;
 	struct rx_buf *bufs[4] = { NULL }, *cursor;
@@ -481,26 +743,43 @@ int rxrpc_recv_data(struct rx_connection *z_conn, bool nowait)
 	struct msghdr msg;
 	struct iovec iov[4];
 	unsigned char control[128];
-	uint32_t tmpbuf[1];
+	void *cookie;
 	int ioc, ret;
 
-	/* Peek at the next message */
-	iov[0].iov_base = &tmpbuf;
-	iov[0].iov_len = sizeof(tmpbuf);
+	/* Set up some buffers */
+	for (ioc = 0; ioc < 4; ioc++) {
+		bufs[ioc] = rxrpc_get_buf(z_conn, z_conn->recv_buf_size);
+		if (!bufs[ioc]) {
+			while (--ioc >= 0)
+				rxrpc_put_buf(z_conn, bufs[ioc]);
+			return -1;
+		}
+		iov[ioc].iov_base = bufs[ioc]->buf;
+		iov[ioc].iov_len = bufs[ioc]->size;
+	}
 
 	memset(&msg, 0, sizeof(msg));
 	msg.msg_iov	= iov;
-	msg.msg_iovlen	= 1;
+	msg.msg_iovlen	= 4;
 	msg.msg_name	= &srx;
 	msg.msg_namelen	= sizeof(srx);
 	msg.msg_control	= control;
 	msg.msg_controllen = sizeof(control);
 	msg.msg_flags	= 0;
 
-	ret = recvmsg(z_conn->fd, &msg, MSG_PEEK | (nowait ? MSG_DONTWAIT : 0));
-	debug("RECVMSG PEEK: %d\n", ret);
-	if (ret == -1)
+	cookie = rxrpc_unlock_caller(z_conn);
+	ret = recvmsg(z_conn->fd, &msg, nowait ? MSG_DONTWAIT : 0);
+	rxrpc_relock_caller(z_conn, cookie);
+	debug("RECVMSG: %d\n", ret);
+	if (ret == -1) {
+		for (ioc = 0; ioc < 4; ioc++)
+			rxrpc_put_buf(z_conn, bufs[ioc]);
 		return -1;
+	}
+
+	debug("RECV: %d [fl:%x]\n", ret, msg.msg_flags);
+	debug("CMSG: %zu\n", msg.msg_controllen);
+	debug("IOV: %zu [0]=%zu\n", msg.msg_iovlen, iov[0].iov_len);
 
 	/* Find the call ID. */
 	call = NULL;
@@ -518,95 +797,53 @@ int rxrpc_recv_data(struct rx_connection *z_conn, bool nowait)
 	if (!call)
 		abort();
 
-	/* Now actually retrieve that message */
-	memset(&msg, 0, sizeof(msg));
-	msg.msg_iov	= iov;
-	msg.msg_iovlen	= 0;
-	msg.msg_name	= &srx;
-	msg.msg_namelen	= sizeof(srx);
-	msg.msg_control	= control;
-	msg.msg_controllen = sizeof(control);
-	msg.msg_flags	= 0;
+	/* Once we've aborted a call, such as when it timed out, we're only
+	 * waiting for the kernel to finish with it, so anything it's sent is
+	 * discarded.  In particular, the abort reported back mustn't override
+	 * the reason we gave.  A terminated call is freed on its final message.
+	 */
+	if (call->dead || call->state == rx_call_locally_aborted) {
+		for (ioc = 0; ioc < 4; ioc++)
+			rxrpc_put_buf(z_conn, bufs[ioc]);
+		if (msg.msg_flags & MSG_EOR) {
+			call->known_to_kernel = 0;
+			if (call->dead)
+				rxrpc_free_zombie(z_conn, call);
+		}
+		*_call = NULL;
+		return 0;
+	}
 
 	debug("Recv: buf[0]=%p data[0]=%p (io=%u)\n",
 	      call->buffer_tail, call->buffer_tail->buf, call->buffer_tail->io_cursor);
 
 	rxrpc_check_call(call);
 
-	/* Set up some buffers */
-	if (call->buffer_tail->io_cursor < RXGEN_BUFFER_SIZE) {
-		bufs[0] = call->buffer_tail;
-		iov[0].iov_base = bufs[0]->buf + bufs[0]->io_cursor;
-		iov[0].iov_len = RXGEN_BUFFER_SIZE - bufs[0]->io_cursor;
-		msg.msg_iovlen = 1;
-	} else {
-		msg.msg_iovlen = 0;
-	}
+	call->bytes_received += ret;
 
-	for (ioc = msg.msg_iovlen; ioc < 4; ioc++) {
-		bufs[ioc] = calloc(1, sizeof(struct rx_buf));
-		bufs[ioc]->magic = RXGEN_BUF_MAGIC;
-		if (!bufs[ioc]) {
-			while (--ioc >= msg.msg_iovlen) {
-				bufs[ioc]->magic = RXGEN_BUF_DEAD;
-				free(bufs[ioc]->buf);
-				free(bufs[ioc]);
-			}
-			return -1;
-		}
-		bufs[ioc]->buf = malloc(RXGEN_BUFFER_SIZE);
-		if (!bufs[ioc]->buf) {
-			bufs[ioc]->magic = RXGEN_BUF_DEAD;
-			free(bufs[ioc]);
-			while (--ioc >= msg.msg_iovlen) {
-				bufs[ioc]->magic = RXGEN_BUF_DEAD;
-				free(bufs[ioc]->buf);
-				free(bufs[ioc]);
-			}
-			return -1;
-		}
-		iov[ioc].iov_base = bufs[ioc]->buf;
-		iov[ioc].iov_len = RXGEN_BUFFER_SIZE;
+	/* Attach any used buffers to the call and return the rest to the
+	 * pool.
+	 */
+	for (ioc = 0; ioc < 4 && ret > 0; ioc++) {
+		unsigned added = bufs[ioc]->size;
+		debug("xfer[%d] space=%u rem=%d\n", ioc, added, ret);
+		if (added > ret)
+			added = ret;
+		bufs[ioc]->io_cursor = added;
+		call->data_count += added;
+		ret -= added;
+		call->buffer_tail->next = bufs[ioc];
+		call->buffer_tail = bufs[ioc];
+		rxrpc_buf_added(call, bufs[ioc], added);
 	}
-	msg.msg_iovlen = 4;
 
-	ret = recvmsg(z_conn->fd, &msg, 0);
-	debug("RECVMSG: %d\n", ret);
-	if (ret == -1)
-		return -1;
-
-	debug("RECV: %d [fl:%x]\n", ret, msg.msg_flags);
-	debug("CMSG: %zu\n", msg.msg_controllen);
-	debug("IOV: %zu [0]=%zu\n", msg.msg_iovlen, iov[0].iov_len);
+	for (; ioc < 4; ioc++)
+		rxrpc_put_buf(z_conn, bufs[ioc]);
 
-	call->bytes_received += ret;
-
-	/* Attach any used buffers to the call and discard the rest */
-	if (ret > 0) {
-		for (ioc = 0; ioc < 4 && ret > 0; ioc++) {
-			unsigned added = RXGEN_BUFFER_SIZE - bufs[ioc]->io_cursor;
-			debug("xfer[%d] space=%u rem=%d\n", ioc, added, ret);
-			if (added > ret)
-				added = ret;
-			bufs[ioc]->io_cursor += added;
-			call->data_count += added;
-			ret -= added;
-			if (call->buffer_tail == bufs[ioc])
-				continue;
-			call->buffer_tail->next = bufs[ioc];
-			call->buffer_tail = bufs[ioc];
-			if (ret <= 0) {
-				ioc++;
-				break;
-			}
-		}
-
-		for (; ioc < 4; ioc++) {
-			bufs[ioc]->magic = RXGEN_BUF_DEAD;
-			free(bufs[ioc]->buf);
-			free(bufs[ioc]);
-		}
-	}
+	/* Size the buffers for the next message on the basis of what this call
+	 * is expecting.
+	 */
+	z_conn->recv_buf_size = rxrpc_next_buf_size(call);
 
 	rxrpc_check_call(call);
 
@@ -685,6 +922,18 @@ int rxrpc_recv_data(struct rx_connection *z_conn, bool nowait)
 		}
 	}
 
+	*_call = call;
+	return 0;
+}
+
+/*
+ * Process the data and metadata that have been received for a call.  This
+ * must be done under the caller's lock as the decoder may need it.
+ */
+static int rxrpc_dispatch(struct rx_call *call)
+{
+	int ret;
+
 	/* Switch into appropriate decode state */
 loop:
 	switch (call->state) {
@@ -739,7 +988,7 @@ loop:
 			if (call->state == rx_call_sv_processing) {
 				/* Prepare to encode the response */
 				call->data_cursor = call->data_start = call->buffer_head->buf;
-				call->data_stop = call->buffer_head->buf + RXGEN_BUFFER_SIZE;
+				call->data_stop = call->buffer_head->buf + call->buffer_head->size;
 				call->buffer_head->io_cursor = 0;
 				call->data_count = 0;
 				call->buffer_space = 0;
@@ -768,7 +1017,116 @@ loop:
 }
 
 /*
- * Abort a call.
+ * Wait for another thread that's polling a connection to dispatch what it
+ * receives.  The receive lock must be held.
+ */
+static void rxrpc_wait_for_poller(struct rx_connection *z_conn, int timeout)
+{
+	struct timespec deadline;
+
+	if (timeout < 0) {
+		pthread_cond_wait(&z_conn->recv_wait, &z_conn->recv_lock);
+		return;
+	}
+
+	clock_gettime(CLOCK_REALTIME, &deadline);
+	deadline.tv_sec += timeout / 1000;
+	deadline.tv_nsec += (timeout % 1000) * 1000000L;
+	if (deadline.tv_nsec >= 1000000000L) {
+		deadline.tv_sec++;
+		deadline.tv_nsec -= 1000000000L;
+	}
+	pthread_cond_timedwait(&z_conn->recv_wait, &z_conn->recv_lock, &deadline);
+}
+
+/*
+ * Claim the right to read from a connection's socket.  If another thread
+ * already has it, we wait for that thread to dispatch what it gets instead
+ * (unless the timeout is 0) and return false.
+ *
+ * The receive lock is only held briefly here and the caller's lock is never
+ * taken under it, but the caller's lock must be dropped if we might wait.
+ */
+static bool rxrpc_claim_socket(struct rx_connection *z_conn, int timeout)
+{
+	bool claimed = false;
+
+	pthread_mutex_lock(&z_conn->recv_lock);
+	if (!z_conn->polling) {
+		z_conn->polling = true;
+		claimed = true;
+	} else if (timeout != 0) {
+		rxrpc_wait_for_poller(z_conn, timeout);
+	}
+	pthread_mutex_unlock(&z_conn->recv_lock);
+	return claimed;
+}
+
+/*
+ * Give up the socket and wake up anyone waiting for what we received.
+ */
+static void rxrpc_release_socket(struct rx_connection *z_conn)
+{
+	int saved_errno = errno;
+
+	pthread_mutex_lock(&z_conn->recv_lock);
+	z_conn->polling = false;
+	pthread_cond_broadcast(&z_conn->recv_wait);
+	pthread_mutex_unlock(&z_conn->recv_lock);
+	errno = saved_errno;
+}
+
+/*
+ * Process everything queued on a socket that we've claimed, dispatching each
+ * message to the call it belongs to.  Returns the number of messages processed
+ * or -1 on error.
+ */
+static int rxrpc_drain_socket(struct rx_connection *z_conn)
+{
+	struct rx_call *call;
+	int n = 0;
+
+	for (;;) {
+		if (rxrpc_recv_msg(z_conn, true, &call) == -1) {
+			if (errno == EAGAIN || errno == EWOULDBLOCK)
+				break;
+			fprintf(stderr, "rxrpc_recv_data failed: %m\n");
+			return -1;
+		}
+
+		if (call)
+			rxrpc_dispatch(call);
+		n++;
+	}
+	return n;
+}
+
+/*
+ * Receive data from a socket.
+ */
+int rxrpc_recv_data(struct rx_connection *z_conn, bool nowait)
+{
+	struct rx_call *call;
+	void *cookie;
+	bool claimed;
+	int ret;
+
+	cookie = rxrpc_unlock_caller(z_conn);
+	claimed = rxrpc_claim_socket(z_conn, nowait ? 0 : -1);
+	rxrpc_relock_caller(z_conn, cookie);
+	if (!claimed)
+		return 0;
+
+	ret = rxrpc_recv_msg(z_conn, nowait, &call);
+	if (ret == 0 && call)
+		ret = rxrpc_dispatch(call);
+	rxrpc_release_socket(z_conn);
+	return ret;
+}
+
+/*
+ * Abort a call.  The kernel still holds the call's ID until it has given us
+ * the call's final message, so the call stays known to it until then.
  */
 void rxrpc_abort_call(struct rx_call *call, uint32_t abort_code)
 {
@@ -791,56 +1149,110 @@ void rxrpc_abort_call(struct rx_call *call, uint32_t abort_code)
 		msg.msg_flags		= 0;
 
 		sendmsg(call->conn->fd, &msg, 0);
-		call->known_to_kernel = 0;
 	}
 	call->state = rx_call_locally_aborted;
 }
 
 /*
- * Terminate a call, aborting it if necessary.
+ * Terminate a call, aborting it if necessary.  If the kernel still has the
+ * call, it will yet give us a final message tagged with the call's address, so
+ * the call is parked on its connection until that turns up rather than being
+ * freed.
  */
 void rxrpc_terminate_call(struct rx_call *call, uint32_t abort_code)
 {
+	struct rx_connection *z_conn = call->conn;
 	struct rx_buf *cursor, *next;
 
 	rxrpc_check_call(call);
-	if (call->known_to_kernel)
+	if (!rxrpc_call_is_complete(call))
 		rxrpc_abort_call(call, abort_code);
-	call->magic = 0x7a7b7c7d;
 	for (cursor = call->buffer_head; cursor; cursor = next) {
 		rxrpc_check_buf(cursor);
 		next = cursor->next;
-		cursor->magic = RXGEN_BUF_DEAD;
-		free(cursor->buf);
-		free(cursor);
+		rxrpc_put_buf(z_conn, cursor);
 	}
+	call->buffer_head = NULL;
+	call->buffer_tail = NULL;
 	if (call->decoder_cleanup)
 		call->decoder_cleanup(call);
+
+	if (call->known_to_kernel) {
+		call->dead = 1;
+		call->next_zombie = z_conn->zombies;
+		z_conn->zombies = call;
+		return;
+	}
+
+	call->magic = 0x7a7b7c7d;
 	free(call);
 }
 
 /*
- * Run a single call synchronously.
+ * Wait for incoming messages on a connection and process all of those that are
+ * queued, dispatching each one to the call it belongs to by its user call ID.
+ * Any number of calls may be in progress on the connection at once.
+ *
+ * The caller's lock is dropped whilst waiting and whilst talking to the
+ * kernel, being retaken only to decode what was received.  If another thread
+ * is already polling the connection, we wait for it to dispatch what it gets
+ * rather than competing for the socket.
+ *
+ * The timeout is in milliseconds, as for poll(); -1 waits indefinitely and 0
+ * just collects whatever is already queued.  Returns the number of messages
+ * processed, 0 if none arrived before the timeout or -1 on error.
  */
-int rxrpc_run_sync_call(struct rx_call *call)
+int rxrpc_poll_connection(struct rx_connection *z_conn, int timeout)
 {
 	struct pollfd fds[1];
+	void *cookie;
+	int n = 0, ret;
 
-	while (call->known_to_kernel) {
-		fds[0].fd = call->conn->fd;
-		fds[0].events = POLLIN;
-		fds[0].revents = 0;
+	cookie = rxrpc_unlock_caller(z_conn);
+	if (!rxrpc_claim_socket(z_conn, timeout)) {
+		rxrpc_relock_caller(z_conn, cookie);
+		return 0;
+	}
 
-		if (poll(fds, 1, -1) == -1) {
-			fprintf(stderr, "Poll failed: %m\n");
-			return -1;
-		}
-		if (rxrpc_recv_data(call->conn, false)) {
-			fprintf(stderr, "rxrpc_recv_data failed: %m\n");
-			return -1;
-		}
+	fds[0].fd = z_conn->fd;
+	fds[0].events = POLLIN;
+	fds[0].revents = 0;
+
+	ret = poll(fds, 1, timeout);
+	rxrpc_relock_caller(z_conn, cookie);
+	if (ret == -1) {
+		fprintf(stderr, "Poll failed: %m\n");
+		n = -1;
+		goto out;
 	}
 
+	/* Drain the socket so that replies to other calls don't sit in the
+	 * queue until someone waits on them.
+	 */
+	if (ret > 0)
+		n = rxrpc_drain_socket(z_conn);
+
+out:
+	rxrpc_release_socket(z_conn);
+	return n;
+}
+
+/*
+ * Determine whether a call has run to completion, successfully or otherwise.
+ * A call we've aborted is complete as far as the caller is concerned, even
+ * though the kernel may not have finished with it yet.
+ */
+bool rxrpc_call_is_complete(const struct rx_call *call)
+{
+	return !call->known_to_kernel || call->state == rx_call_locally_aborted;
+}
+
+/*
+ * Collect the outcome of a call that has been run to completion.  Returns 0 if
+ * the call succeeded and -1 with errno set if it failed.
+ */
+int rxrpc_call_outcome(struct rx_call *call)
+{
 	switch (call->state) {
 	case rx_call_cl_complete:
 		debug("Call complete\n");
@@ -855,6 +1267,228 @@ int rxrpc_run_sync_call(struct rx_call *call)
 	}
 }
 
+/*
+ * Set the time limit on a call, in milliseconds from now.  If the timeout is
+ * 0 or negative, the call may wait indefinitely.
+ */
+void rxrpc_set_call_timeout(struct rx_call *call, int timeout)
+{
+	if (timeout <= 0) {
+		call->deadline.tv_sec = 0;
+		call->deadline.tv_nsec = 0;
+		return;
+	}
+
+	clock_gettime(CLOCK_MONOTONIC, &call->deadline);
+	call->deadline.tv_sec += timeout / 1000;
+	call->deadline.tv_nsec += (timeout % 1000) * 1000000L;
+	if (call->deadline.tv_nsec >= 1000000000L) {
+		call->deadline.tv_sec++;
+		call->deadline.tv_nsec -= 1000000000L;
+	}
+}
+
+/*
+ * Get the time left before a call times out as a poll() timeout in
+ * milliseconds.  -1 is returned if the call has no time limit and 0 if it has
+ * run out of time.
+ */
+int rxrpc_call_time_remaining(const struct rx_call *call)
+{
+	struct timespec now;
+	long long remaining;
+
+	if (!call->deadline.tv_sec && !call->deadline.tv_nsec)
+		return -1;
+
+	clock_gettime(CLOCK_MONOTONIC, &now);
+	remaining  = (call->deadline.tv_sec - now.tv_sec) * 1000000000LL;
+	remaining += call->deadline.tv_nsec - now.tv_nsec;
+	if (remaining <= 0)
+		return 0;
+	remaining = (remaining + 999999) / 1000000;
+	return remaining > INT_MAX ? INT_MAX : remaining;
+}
+
+/*
+ * Abort a call that has run out of time.  The call then counts as complete,
+ * but the kernel keeps hold of it until it has given us its final message,
+ * which rxrpc_terminate_call() allows for.
+ */
+void rxrpc_time_out_call(struct rx_call *call)
+{
+	rxrpc_abort_call(call, RX_CALL_TIMEOUT);
+	call->error_code = ETIMEDOUT;
+}
+
+/*
+ * Wait for a call to run to completion, aborting it if it runs out of time.
+ * Replies to other calls outstanding on the same connection are processed as
+ * they turn up.  Returns -1 if we couldn't poll the connection.
+ */
+int rxrpc_wait_for_call(struct rx_call *call)
+{
+	int timeout;
+
+	while (!rxrpc_call_is_complete(call)) {
+		timeout = rxrpc_call_time_remaining(call);
+		if (timeout == 0) {
+			rxrpc_time_out_call(call);
+			break;
+		}
+		if (rxrpc_poll_connection(call->conn, timeout) == -1)
+			return -1;
+	}
+	return 0;
+}
+
+/*
+ * Wait for a set of calls, which may be spread over several connections, to
+ * run to completion.  All the connections are watched at once so that replies
+ * are processed as they turn up from whichever server and each call is
+ * aborted if it runs out of time.  NULL entries in the list are skipped.
+ *
+ * We claim each socket before watching it, as for rxrpc_poll_connection().
+ * Replies arriving on a socket that another thread has claimed are dispatched
+ * by that thread, so we just need to look at our calls again once it has done
+ * so.
+ *
+ * If any is true, we stop as soon as one of the calls has completed
+ * successfully and return its index; otherwise, or if none of them succeed,
+ * nr is returned once they're all complete.  Returns -1 if we couldn't poll
+ * the connections.
+ */
+static int rxrpc_wait_calls(struct rx_call **calls, unsigned nr, bool any)
+{
+	struct rx_connection **conns, **claimed, *busy;
+	struct rx_call *call;
+	struct pollfd *fds;
+	unsigned i, j, nconns, nclaimed;
+	void *cookie;
+	int timeout, t, ret = nr;
+
+	fds = calloc(nr ?: 1, sizeof(*fds));
+	conns = calloc(nr ?: 1, sizeof(*conns));
+	claimed = calloc(nr ?: 1, sizeof(*claimed));
+	if (!fds || !conns || !claimed) {
+		errno = ENOMEM;
+		ret = -1;
+		goto out;
+	}
+
+	for (;;) {
+		/* Gather the connections that still have calls in progress
+		 * and work out how long we can wait.
+		 */
+		nconns = 0;
+		timeout = -1;
+		for (i = 0; i < nr; i++) {
+			call = calls[i];
+			if (!call)
+				continue;
+			if (rxrpc_call_is_complete(call)) {
+				if (any && call->state == rx_call_cl_complete) {
+					ret = i;
+					goto out;
+				}
+				continue;
+			}
+
+			t = rxrpc_call_time_remaining(call);
+			if (t == 0) {
+				rxrpc_time_out_call(call);
+				continue;
+			}
+			if (t > 0 && (timeout < 0 || t < timeout))
+				timeout = t;
+
+			for (j = 0; j < nconns; j++)
+				if (conns[j] == call->conn)
+					break;
+			if (j == nconns)
+				conns[nconns++] = call->conn;
+		}
+
+		if (nconns == 0)
+			break;
+
+		cookie = rxrpc_unlock_caller(conns[0]);
+
+		nclaimed = 0;
+		busy = NULL;
+		for (j = 0; j < nconns; j++) {
+			if (!rxrpc_claim_socket(conns[j], 0)) {
+				busy = conns[j];
+				continue;
+			}
+			claimed[nclaimed] = conns[j];
+			fds[nclaimed].fd = conns[j]->fd;
+			fds[nclaimed].events = POLLIN;
+			fds[nclaimed].revents = 0;
+			nclaimed++;
+		}
+
+		if (nclaimed == 0) {
+			/* Everything is being read by other threads, so sleep
+			 * until one of them has dispatched what it got.
+			 */
+			if (rxrpc_claim_socket(busy, timeout))
+				rxrpc_release_socket(busy);
+			t = 0;
+		} else {
+			if (busy && (timeout < 0 || timeout > RXRPC_BUSY_RECHECK))
+				timeout = RXRPC_BUSY_RECHECK;
+			t = poll(fds, nclaimed, timeout);
+		}
+
+		rxrpc_relock_caller(conns[0], cookie);
+		if (t == -1)
+			fprintf(stderr, "Poll failed: %m\n");
+
+		for (j = 0; j < nclaimed; j++) {
+			if (t > 0 && fds[j].revents &&
+			    rxrpc_drain_socket(claimed[j]) == -1)
+				t = -1;
+			rxrpc_release_socket(claimed[j]);
+		}
+		if (t == -1) {
+			ret = -1;
+			break;
+		}
+	}
+
+out:
+	free(claimed);
+	free(conns);
+	free(fds);
+	return ret;
+}
+
+int rxrpc_wait_for_calls(struct rx_call **calls, unsigned nr)
+{
+	return rxrpc_wait_calls(calls, nr, false) == -1 ? -1 : 0;
+}
+
+/*
+ * Wait for the first of a set of calls to complete successfully.  Returns its
+ * index, nr if they all failed or -1 if we couldn't poll the connections.
+ */
+int rxrpc_wait_for_any_call(struct rx_call **calls, unsigned nr)
+{
+	return rxrpc_wait_calls(calls, nr, true);
+}
+
+/*
+ * Run a single call synchronously.
+ */
+int rxrpc_run_sync_call(struct rx_call *call)
+{
+	if (rxrpc_wait_for_call(call) == -1)
+		return -1;
+
+	return rxrpc_call_outcome(call);
+}
+
 /*
  * Discard excess received data
  */
@@ -870,9 +1504,7 @@ int rxgen_dec_discard_excess(struct rx_call *call)
 	       ) {
 		spent = cursor;
 		call->buffer_head = cursor->next;
-		spent->magic = RXGEN_BUF_DEAD;
-		free(spent->buf);
-		free(spent);
+		rxrpc_put_buf(call->conn, spent);
 	}
 
 	rxrpc_check_call(call);
@@ -920,24 +1552,20 @@ int rxrpc_enc_blob(struct rx_call *call, const void *data, size_t size)
 		if (rxrpc_post_enc(call) < 0)
 			return -1;
 
-		new = calloc(1, sizeof(struct rx_buf));
+		new = rxrpc_get_buf(call->conn, rxrpc_next_buf_size(call));
 		if (!new)
 			goto handle_oom;
-		new->buf = buf = malloc(RXGEN_BUFFER_SIZE);
-		if (!buf)
-			goto handle_oom_buf;
+		buf = new->buf;
+		rxrpc_buf_added(call, new, 0);
 
-		new->magic = RXGEN_BUF_MAGIC;
 		cursor = call->buffer_tail;
 		cursor->next = new;
 		call->data_cursor = call->data_start = buf;
-		call->data_stop = buf + RXGEN_BUFFER_SIZE;
-		call->buffer_space += RXGEN_BUFFER_SIZE;
+		call->data_stop = buf + new->size;
+		call->buffer_space += new->size;
 		call->buffer_tail = new;
 	}
 
-handle_oom_buf:
-	free(new);
 handle_oom:
 	call->error_code = ENOMEM;
 	return -1;
@@ -1004,11 +1632,11 @@ void rxrpc_dec_advance_buffer(struct rx_call *call)
 	segment = cursor->io_cursor;
 	new_stop = cursor->buf + segment;
 	if (call->data_stop >= new_stop) {
-		/* This buffer must then be completely used as we're required to check
-		 * amount received before reading it.
+		/* This buffer has then been used up, though it may not be full
+		 * as each message is received into fresh buffers.  We're
+		 * required to check the amount received before reading it, so
+		 * there must be another buffer.
 		 */
-		if (new_stop != cursor->buf + RXGEN_BUFFER_SIZE)
-			abort(); /* Didn't completely consume a buffer */
 		if (call->buffer_tail == cursor)
 			abort(); /* Unexpectedly out of data */
 
@@ -1024,9 +1652,7 @@ void rxrpc_dec_advance_buffer(struct rx_call *call)
 			abort();
 		new_stop = cursor->buf + segment;
 
-		spent->magic = RXGEN_BUF_DEAD;
-		free(spent->buf);
-		free(spent);
+		rxrpc_put_buf(call->conn, spent);
 	}
 
 	call->data_stop = new_stop;
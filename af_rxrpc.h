@@ -35,6 +35,16 @@
 #define RXKADDATALEN		19270411	/* user data too long */
 #define RXKADILLEGALLEVEL	19270412	/* caller not authorised to use encrypted conns */
 
+/*
+ * Rx protocol abort codes
+ */
+#define RX_CALL_DEAD		(-1)	/* call dead */
+#define RX_INVALID_OPERATION	(-2)	/* invalid operation */
+#define RX_CALL_TIMEOUT		(-3)	/* call timeout exceeded */
+#define RX_EOF			(-4)	/* unexpected end of data on read op */
+#define RX_PROTOCOL_ERROR	(-5)	/* low-level protocol error */
+#define RX_USER_ABORT		(-6)	/* generic user abort */
+
 /*
  * AF_RXRPC socket address type. 
  */
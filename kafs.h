@@ -17,7 +17,6 @@
  */
 extern PyTypeObject vlocationType;
 extern PyObject *kafs_new_vlocation(PyObject *_self, PyObject *args);
-extern PyObject *kafs_VL_GetEntryByName(PyObject *_self, PyObject *args);
 
 
 #endif /* _KAFS_H */
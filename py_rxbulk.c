@@ -0,0 +1,356 @@
+/* Python lazily-wrapped struct array object
+ *
+ * Copyright (C) 2014 Red Hat, Inc. All Rights Reserved.
+ * Written by David Howells (dhowells@redhat.com)
+ *
+ * This program is free software; you can redistribute it and/or
+ * modify it under the terms of the GNU General Public Licence
+ * as published by the Free Software Foundation; either version
+ * 2 of the Licence, or (at your option) any later version.
+ */
+
+#include <Python.h>
+#include "structmember.h"
+#include <arpa/inet.h>
+#include "py_rxgen.h"
+#include "rxgen.h"
+
+/*
+ * Create a struct array with room for num elements of the given size.  The
+ * elements are decoded into the raw C array and only get wrapped as Python
+ * objects when they're accessed.
+ */
+PyObject *py_rxgen_new_struct_array(size_t num, size_t size,
+				    PyObject *(*data_to_type)(const void *elem))
+{
+	struct py_rx_struct_array *obj;
+
+	obj = (struct py_rx_struct_array *)_PyObject_New(&py_rx_struct_arrayType);
+	if (!obj)
+		return PyErr_NoMemory();
+
+	obj->num = num;
+	obj->size = size;
+	obj->borrowed = false;
+	obj->cache = NULL;
+	obj->data_to_type = data_to_type;
+	obj->data = calloc(num ?: 1, size);
+	if (!obj->data) {
+		Py_DECREF(obj);
+		return PyErr_NoMemory();
+	}
+	return (PyObject *)obj;
+}
+
+/*
+ * Attach a NumPy dtype description of the raw C struct to a struct wrapper
+ * type as its dtype attribute.  The description is a dict of names, formats,
+ * offsets and itemsize, so NumPy itself isn't required.  This consumes the
+ * reference on dtype.
+ */
+int py_rxgen_set_dtype(PyTypeObject *type, PyObject *dtype)
+{
+	int ret;
+
+	if (!dtype)
+		return -1;
+
+	ret = PyDict_SetItemString(type->tp_dict, "dtype", dtype);
+	Py_DECREF(dtype);
+	PyType_Modified(type);
+	return ret;
+}
+
+/*
+ * Get a view of a struct array embedded in another object.  The array is
+ * accessed in place rather than being copied.  The view is cached by the owner
+ * so that the element wrappers get reused, and the owner must call
+ * py_rxgen_detach_structs() on it when it is deallocated.
+ */
+PyObject *py_rxgen_get_structs(void *data, size_t num, size_t size,
+			       PyObject **cache,
+			       PyObject *(*data_to_type)(const void *elem))
+{
+	struct py_rx_struct_array *obj;
+
+	if (*cache) {
+		Py_INCREF(*cache);
+		return *cache;
+	}
+
+	obj = (struct py_rx_struct_array *)_PyObject_New(&py_rx_struct_arrayType);
+	if (!obj)
+		return PyErr_NoMemory();
+
+	obj->data = data;
+	obj->num = num;
+	obj->size = size;
+	obj->borrowed = true;
+	obj->cache = NULL;
+	obj->data_to_type = data_to_type;
+
+	Py_INCREF(obj);
+	*cache = (PyObject *)obj;
+	return (PyObject *)obj;
+}
+
+static void py_rx_struct_array_clear_cache(struct py_rx_struct_array *self)
+{
+	size_t i;
+
+	if (self->cache) {
+		for (i = 0; i < self->num; i++)
+			Py_XDECREF(self->cache[i]);
+		free(self->cache);
+		self->cache = NULL;
+	}
+}
+
+/*
+ * Detach a view from the object that owns the array it looks at as the owner
+ * is going away.  If anyone else still holds the view, it's given a private
+ * copy of the data; otherwise the owner's reference is the last and the view
+ * is simply emptied as it's about to be released.
+ */
+void py_rxgen_detach_structs(PyObject *cache)
+{
+	struct py_rx_struct_array *self = (struct py_rx_struct_array *)cache;
+	void *data = NULL;
+
+	if (!cache || Py_TYPE(cache) != &py_rx_struct_arrayType || !self->borrowed)
+		return;
+
+	if (Py_REFCNT(cache) > 1) {
+		data = malloc(self->num * self->size ?: 1);
+		if (data)
+			memcpy(data, self->data, self->num * self->size);
+	}
+
+	if (!data) {
+		/* We can't leave the view pointing into the owner, so just
+		 * empty it.
+		 */
+		py_rx_struct_array_clear_cache(self);
+		self->num = 0;
+	}
+	self->data = data;
+	self->borrowed = false;
+}
+
+/*
+ * Get the Python wrapper for an element, creating it on first access.
+ */
+static PyObject *py_rx_struct_array_item(PyObject *_self, Py_ssize_t i)
+{
+	struct py_rx_struct_array *self = (struct py_rx_struct_array *)_self;
+	PyObject *obj;
+
+	if (i < 0 || i >= self->num) {
+		PyErr_SetString(PyExc_IndexError, "struct array index out of range");
+		return NULL;
+	}
+
+	if (!self->cache) {
+		self->cache = calloc(self->num, sizeof(PyObject *));
+		if (!self->cache)
+			return PyErr_NoMemory();
+	}
+
+	obj = self->cache[i];
+	if (!obj) {
+		obj = self->data_to_type(self->data + i * self->size);
+		if (!obj)
+			return NULL;
+		self->cache[i] = obj;
+	}
+
+	Py_INCREF(obj);
+	return obj;
+}
+
+static Py_ssize_t py_rx_struct_array_len(PyObject *_self)
+{
+	struct py_rx_struct_array *self = (struct py_rx_struct_array *)_self;
+
+	return self->num;
+}
+
+/*
+ * Replace an element.  The new value's type is checked when the array is
+ * marshalled.
+ */
+static int py_rx_struct_array_ass_item(PyObject *_self, Py_ssize_t i, PyObject *val)
+{
+	struct py_rx_struct_array *self = (struct py_rx_struct_array *)_self;
+
+	if (i < 0 || i >= self->num) {
+		PyErr_SetString(PyExc_IndexError, "struct array assignment index out of range");
+		return -1;
+	}
+	if (!val) {
+		PyErr_SetString(PyExc_TypeError, "struct array elements can't be deleted");
+		return -1;
+	}
+
+	if (!self->cache) {
+		self->cache = calloc(self->num, sizeof(PyObject *));
+		if (!self->cache) {
+			PyErr_NoMemory();
+			return -1;
+		}
+	}
+
+	Py_INCREF(val);
+	Py_XDECREF(self->cache[i]);
+	self->cache[i] = val;
+	return 0;
+}
+
+/*
+ * Handle array[index] and array[slice].  Slices are returned as lists.
+ */
+static PyObject *py_rx_struct_array_subscript(PyObject *_self, PyObject *key)
+{
+	struct py_rx_struct_array *self = (struct py_rx_struct_array *)_self;
+	Py_ssize_t i, start, stop, step, n, j;
+	PyObject *list, *item;
+
+	if (PyIndex_Check(key)) {
+		i = PyNumber_AsSsize_t(key, PyExc_IndexError);
+		if (i == -1 && PyErr_Occurred())
+			return NULL;
+		if (i < 0)
+			i += self->num;
+		return py_rx_struct_array_item(_self, i);
+	}
+
+	if (!PySlice_Check(key)) {
+		PyErr_Format(PyExc_TypeError,
+			     "struct array indices must be integers or slices");
+		return NULL;
+	}
+
+	if (PySlice_Unpack(key, &start, &stop, &step) < 0)
+		return NULL;
+	n = PySlice_AdjustIndices(self->num, &start, &stop, step);
+
+	list = PyList_New(n);
+	if (!list)
+		return NULL;
+	for (i = start, j = 0; j < n; i += step, j++) {
+		item = py_rx_struct_array_item(_self, i);
+		if (!item) {
+			Py_DECREF(list);
+			return NULL;
+		}
+		PyList_SET_ITEM(list, j, item);
+	}
+	return list;
+}
+
+static int py_rx_struct_array_ass_subscript(PyObject *_self, PyObject *key,
+					     PyObject *val)
+{
+	struct py_rx_struct_array *self = (struct py_rx_struct_array *)_self;
+	Py_ssize_t i;
+
+	if (!PyIndex_Check(key)) {
+		PyErr_Format(PyExc_TypeError,
+			     "struct array indices must be integers");
+		return -1;
+	}
+
+	i = PyNumber_AsSsize_t(key, PyExc_IndexError);
+	if (i == -1 && PyErr_Occurred())
+		return -1;
+	if (i < 0)
+		i += self->num;
+	return py_rx_struct_array_ass_item(_self, i, val);
+}
+
+static PySequenceMethods py_rx_struct_array_as_sequence = {
+	.sq_length	= py_rx_struct_array_len,
+	.sq_item	= py_rx_struct_array_item,
+	.sq_ass_item	= py_rx_struct_array_ass_item,
+};
+
+/*
+ * Export the raw C array so that it can be viewed as a NumPy structured array
+ * without copying, eg:
+ *
+ *	numpy.frombuffer(ret.blkentries, dtype=kafs.nvldbentry.dtype)
+ *
+ * Views of arrays embedded in other objects can't be exported as the data
+ * gets moved if the owner goes away.  Neither can arrays that have had any of
+ * their elements wrapped or replaced: the wrappers are copies, so the raw
+ * array may no longer reflect what the caller has been given or stored.
+ */
+static int py_rx_struct_array_getbuffer(PyObject *_self, Py_buffer *view, int flags)
+{
+	struct py_rx_struct_array *self = (struct py_rx_struct_array *)_self;
+	Py_ssize_t i;
+
+	if (self->borrowed) {
+		PyErr_SetString(PyExc_BufferError,
+				"Embedded struct arrays can't be exported");
+		view->obj = NULL;
+		return -1;
+	}
+
+	if (self->cache) {
+		for (i = 0; i < self->num; i++) {
+			if (self->cache[i]) {
+				PyErr_SetString(PyExc_BufferError,
+						"Struct arrays can't be exported once elements have been accessed");
+				view->obj = NULL;
+				return -1;
+			}
+		}
+	}
+
+	return PyBuffer_FillInfo(view, _self, self->data, self->num * self->size,
+				 1, flags);
+}
+
+static PyBufferProcs py_rx_struct_array_as_buffer = {
+	.bf_getbuffer	= py_rx_struct_array_getbuffer,
+};
+
+static PyMappingMethods py_rx_struct_array_as_mapping = {
+	.mp_length	= py_rx_struct_array_len,
+	.mp_subscript	= py_rx_struct_array_subscript,
+	.mp_ass_subscript = py_rx_struct_array_ass_subscript,
+};
+
+static void
+py_rx_struct_array_dealloc(struct py_rx_struct_array *self)
+{
+	py_rx_struct_array_clear_cache(self);
+	if (!self->borrowed)
+		free(self->data);
+	Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+PyTypeObject py_rx_struct_arrayType = {
+	PyVarObject_HEAD_INIT(NULL, 0)
+	"kafs.struct_array",		/*tp_name*/
+	sizeof(struct py_rx_struct_array), /*tp_basicsize*/
+	0,				/*tp_itemsize*/
+	(destructor)py_rx_struct_array_dealloc, /*tp_dealloc*/
+	0,				/*tp_print*/
+	0,				/*tp_getattr*/
+	0,				/*tp_setattr*/
+	0,				/*tp_as_async*/
+	0,				/*tp_repr*/
+	0,				/*tp_as_number*/
+	&py_rx_struct_array_as_sequence, /*tp_as_sequence*/
+	&py_rx_struct_array_as_mapping,	/*tp_as_mapping*/
+	0,				/*tp_hash */
+	0,				/*tp_call*/
+	0,				/*tp_str*/
+	0,				/*tp_getattro*/
+	0,				/*tp_setattro*/
+	&py_rx_struct_array_as_buffer,	/*tp_as_buffer*/
+	Py_TPFLAGS_DEFAULT,		/*tp_flags*/
+	"Array of structs, wrapped on access", /* tp_doc */
+};
@@ -0,0 +1,670 @@
+/* Python RxRPC call handle object
+ *
+ * Copyright (C) 2014 Red Hat, Inc. All Rights Reserved.
+ * Written by David Howells (dhowells@redhat.com)
+ *
+ * This program is free software; you can redistribute it and/or
+ * modify it under the terms of the GNU General Public Licence
+ * as published by the Free Software Foundation; either version
+ * 2 of the Licence, or (at your option) any later version.
+ */
+
+#include <Python.h>
+#include "structmember.h"
+#include <arpa/inet.h>
+#include "py_rxgen.h"
+#include "rxgen.h"
+
+/*
+ * Convert a timeout in seconds from Python into milliseconds.  None or a
+ * non-positive value means there's no time limit, for which 0 is returned.
+ */
+int py_rxgen_parse_timeout(PyObject *obj, int *_timeout)
+{
+	double timeout;
+
+	*_timeout = 0;
+	if (obj == Py_None)
+		return 0;
+
+	timeout = PyFloat_AsDouble(obj);
+	if (timeout == -1.0 && PyErr_Occurred())
+		return -1;
+	if (timeout <= 0)
+		return 0;
+	if (timeout > INT_MAX / 1000) {
+		PyErr_SetString(PyExc_OverflowError, "Timeout too large");
+		return -1;
+	}
+	*_timeout = (int)(timeout * 1000);
+	if (*_timeout == 0)
+		*_timeout = 1;
+	return 0;
+}
+
+/*
+ * Parse the keyword arguments applicable to all RPC calls:
+ *
+ *	timeout=<seconds>	- Time limit on the call or None for no limit.
+ *	bulk_array=<bool>	- Decode bulk arrays in the reply compactly
+ *				  rather than as lists: 32-bit integers go into
+ *				  array.array objects and structs into
+ *				  struct_arrays that wrap elements on access.
+ *				  A struct_array can be handed to
+ *				  numpy.frombuffer() with the struct type's
+ *				  dtype attribute, provided that none of its
+ *				  elements have been accessed first.
+ *	records=<bool>		- Decode structs in the reply as immutable
+ *				  records rather than as mutable wrappers.
+ *
+ * The timeout is set to -1 if not given, meaning that the connection's default
+ * should be used.
+ */
+int py_rxgen_parse_call_kwds(PyObject *kwds, int *_timeout, unsigned *_flags)
+{
+	PyObject *timeout, *bulk_array, *records;
+	Py_ssize_t nr = 0;
+	int ret;
+
+	*_timeout = -1;
+	*_flags = 0;
+	if (!kwds)
+		return 0;
+
+	timeout = PyDict_GetItemString(kwds, "timeout");
+	if (timeout)
+		nr++;
+	bulk_array = PyDict_GetItemString(kwds, "bulk_array");
+	if (bulk_array)
+		nr++;
+	records = PyDict_GetItemString(kwds, "records");
+	if (records)
+		nr++;
+	if (PyDict_Size(kwds) != nr) {
+		PyErr_SetString(PyExc_TypeError,
+				"RPC calls only take 'timeout', 'bulk_array' and 'records' keyword arguments");
+		return -1;
+	}
+
+	if (bulk_array) {
+		ret = PyObject_IsTrue(bulk_array);
+		if (ret < 0)
+			return -1;
+		if (ret)
+			*_flags |= PY_RXGEN_BULK_ARRAY;
+	}
+
+	if (records) {
+		ret = PyObject_IsTrue(records);
+		if (ret < 0)
+			return -1;
+		if (ret)
+			*_flags |= PY_RXGEN_RECORDS;
+	}
+
+	if (timeout)
+		return py_rxgen_parse_timeout(timeout, _timeout);
+	return 0;
+}
+
+/*
+ * Set a Python exception to describe why a call failed and then dispose of
+ * the call.  errno must indicate the reason for failure.  Always returns NULL.
+ */
+PyObject *py_rxgen_call_failed(struct rx_call *call)
+{
+	PyObject *res;
+
+	if (errno == ENOMEM)
+		res = PyErr_NoMemory();
+	else if (errno == ECONNABORTED)
+		res = py_rxgen_received_abort(call);
+	else if (errno == ETIMEDOUT)
+		res = PyErr_SetFromErrno(PyExc_TimeoutError);
+	else
+		res = PyErr_SetFromErrno(PyExc_IOError);
+	rxrpc_terminate_call(call, ENOMEM);
+	return res;
+}
+
+/*
+ * Run a call that has been transmitted to completion and return the response
+ * object that it decoded into.  The call is disposed of.
+ */
+PyObject *py_rxgen_run_sync_call(struct rx_call *call, PyObject *resp)
+{
+	if (rxrpc_run_sync_call(call) == -1) {
+		Py_DECREF(resp);
+		return py_rxgen_call_failed(call);
+	}
+
+	rxrpc_terminate_call(call, 0);
+	return resp;
+}
+
+/*
+ * Get the value of the exception that's pending.
+ */
+static PyObject *py_rxgen_fetch_exception(void)
+{
+	PyObject *type, *value, *tb;
+
+	PyErr_Fetch(&type, &value, &tb);
+	PyErr_NormalizeException(&type, &value, &tb);
+	if (tb) {
+		PyException_SetTraceback(value, tb);
+		Py_DECREF(tb);
+	}
+	Py_DECREF(type);
+	return value;
+}
+
+/*
+ * Reap a completed call, turning its outcome into either a result or an
+ * exception.  Either is kept so that it can be given again if asked for.
+ */
+static PyObject *py_rx_call_reap(struct py_rx_call *self)
+{
+	struct rx_call *call = self->x;
+
+	self->x = NULL;
+	if (rxrpc_call_outcome(call) == -1) {
+		Py_CLEAR(self->resp);
+		py_rxgen_call_failed(call);
+		self->error = py_rxgen_fetch_exception();
+		Py_INCREF(self->error);
+		PyErr_SetObject((PyObject *)Py_TYPE(self->error), self->error);
+		return NULL;
+	}
+
+	rxrpc_terminate_call(call, 0);
+	self->result = self->resp;
+	self->resp = NULL;
+	Py_INCREF(self->result);
+	return self->result;
+}
+
+/*
+ * Determine whether a call has completed: done = call.done()
+ *
+ * Any replies already queued on the connection are processed first, but this
+ * doesn't wait.
+ */
+static PyObject *py_rx_call_done(PyObject *_self, PyObject *args)
+{
+	struct py_rx_call *self = (struct py_rx_call *)_self;
+
+	if (!self->x)
+		Py_RETURN_TRUE;
+
+	if (!rxrpc_call_is_complete(self->x) &&
+	    rxrpc_poll_connection(self->conn->x, 0) == -1)
+		return PyErr_SetFromErrno(PyExc_OSError);
+
+	return PyBool_FromLong(rxrpc_call_is_complete(self->x));
+}
+
+/*
+ * Wait for a call to complete and get its response: resp = call.result()
+ *
+ * Replies to other calls made on the same connection are dispatched to them
+ * whilst we wait.  An exception is raised if the call failed; TimeoutError is
+ * raised if it ran out of time.
+ */
+static PyObject *py_rx_call_result(PyObject *_self, PyObject *args)
+{
+	struct py_rx_call *self = (struct py_rx_call *)_self;
+
+	if (!self->x) {
+		if (self->result) {
+			Py_INCREF(self->result);
+			return self->result;
+		}
+		if (self->error) {
+			PyErr_SetObject((PyObject *)Py_TYPE(self->error), self->error);
+			return NULL;
+		}
+		PyErr_SetString(PyExc_RuntimeError, "RPC call has already been reaped");
+		return NULL;
+	}
+
+	if (rxrpc_wait_for_call(self->x) == -1)
+		return PyErr_SetFromErrno(PyExc_OSError);
+
+	return py_rx_call_reap(self);
+}
+
+/*
+ * Await a call from a coroutine: resp = await call
+ *
+ * Rather than blocking in poll(), the connection's socket is handed to the
+ * running asyncio event loop to watch and we yield a future that it will
+ * complete when replies arrive.
+ */
+static PyObject *py_rx_call_await(PyObject *_self)
+{
+	Py_INCREF(_self);
+	return _self;
+}
+
+static PyObject *py_rx_call_iternext(PyObject *_self)
+{
+	struct py_rx_call *self = (struct py_rx_call *)_self;
+	PyObject *res;
+	int timeout;
+
+	if (self->x && !rxrpc_call_is_complete(self->x)) {
+		timeout = rxrpc_call_time_remaining(self->x);
+		if (timeout != 0)
+			return py_rx_connection_async_wait(self->conn, timeout);
+		rxrpc_time_out_call(self->x);
+	}
+
+	res = py_rx_call_result(_self, NULL);
+	if (!res)
+		return NULL;
+
+	/* The response is never a tuple or an exception, so it can be used
+	 * directly as the StopIteration value.
+	 */
+	PyErr_SetObject(PyExc_StopIteration, res);
+	Py_DECREF(res);
+	return NULL;
+}
+
+static PyAsyncMethods py_rx_call_as_async = {
+	.am_await	= py_rx_call_await,
+};
+
+/*
+ * Abort a call that's in progress: call.abort([abort_code])
+ */
+static PyObject *py_rx_call_abort(PyObject *_self, PyObject *args)
+{
+	struct py_rx_call *self = (struct py_rx_call *)_self;
+	int abort_code = RX_USER_ABORT;
+
+	if (!PyArg_ParseTuple(args, "|i", &abort_code))
+		return NULL;
+
+	if (self->x && !rxrpc_call_is_complete(self->x)) {
+		rxrpc_abort_call(self->x, abort_code);
+		self->x->error_code = ECANCELED;
+	}
+	Py_RETURN_NONE;
+}
+
+/*
+ * Methods applicable to RxRPC call handles
+ */
+static PyMethodDef py_rx_call_methods[] = {
+	{"done", (PyCFunction)py_rx_call_done, METH_NOARGS,
+	 "Return True if the call has completed." },
+	{"result", (PyCFunction)py_rx_call_result, METH_NOARGS,
+	 "Wait for the call to complete and return its response." },
+	{"abort", (PyCFunction)py_rx_call_abort, METH_VARARGS,
+	 "Abort the call." },
+	{}
+};
+
+/*
+ * RxRPC call handle.
+ */
+static int
+py_rx_call_init(PyObject *_self, PyObject *args, PyObject *kwds)
+{
+	struct py_rx_call *self = (struct py_rx_call *)_self;
+	self->x = NULL;
+	self->conn = NULL;
+	self->resp = NULL;
+	self->result = NULL;
+	self->error = NULL;
+	return 0;
+}
+
+static void
+py_rx_call_dealloc(struct py_rx_call *self)
+{
+	if (self->x) {
+		rxrpc_terminate_call(self->x, RX_USER_ABORT);
+		self->x = NULL;
+	}
+	Py_XDECREF(self->resp);
+	Py_XDECREF(self->result);
+	Py_XDECREF(self->error);
+	Py_XDECREF(self->conn);
+	Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+PyTypeObject py_rx_callType = {
+	PyVarObject_HEAD_INIT(NULL, 0)
+	"kafs.rx_call",			/*tp_name*/
+	sizeof(struct py_rx_call),	/*tp_basicsize*/
+	0,				/*tp_itemsize*/
+	(destructor)py_rx_call_dealloc, /*tp_dealloc*/
+	0,				/*tp_print*/
+	0,				/*tp_getattr*/
+	0,				/*tp_setattr*/
+	&py_rx_call_as_async,		/*tp_as_async*/
+	0,				/*tp_repr*/
+	0,				/*tp_as_number*/
+	0,				/*tp_as_sequence*/
+	0,				/*tp_as_mapping*/
+	0,				/*tp_hash */
+	0,				/*tp_call*/
+	0,				/*tp_str*/
+	0,				/*tp_getattro*/
+	0,				/*tp_setattro*/
+	0,				/*tp_as_buffer*/
+	Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE, /*tp_flags*/
+	"RxRPC call handle",		/* tp_doc */
+	0,				/* tp_traverse */
+	0,				/* tp_clear */
+	0,				/* tp_richcompare */
+	0,				/* tp_weaklistoffset */
+	PyObject_SelfIter,		/* tp_iter */
+	py_rx_call_iternext,		/* tp_iternext */
+	py_rx_call_methods,		/* tp_methods */
+	0,				/* tp_members */
+	0,				/* tp_getset */
+	0,				/* tp_base */
+	0,				/* tp_dict */
+	0,				/* tp_descr_get */
+	0,				/* tp_descr_set */
+	0,				/* tp_dictoffset */
+	py_rx_call_init,		/* tp_init */
+	0,				/* tp_alloc */
+	0,				/* tp_new */
+};
+
+/*
+ * Wrap a call that has been transmitted in a handle so that Python can
+ * collect the result later, leaving the connection free for further calls to
+ * be made in the meantime.
+ */
+PyObject *py_rxgen_new_call(struct py_rx_connection *z_conn,
+			    struct rx_call *call, PyObject *resp)
+{
+	struct py_rx_call *obj;
+
+	obj = (struct py_rx_call *)_PyObject_New(&py_rx_callType);
+	if (!obj) {
+		Py_DECREF(resp);
+		rxrpc_terminate_call(call, RX_USER_ABORT);
+		return PyErr_NoMemory();
+	}
+	py_rx_call_init((PyObject *)obj, NULL, NULL);
+
+	Py_INCREF(z_conn);
+	obj->conn = z_conn;
+	obj->x = call;
+	obj->resp = resp;
+	return (PyObject *)obj;
+}
+
+/*
+ * Find the asynchronous flavour of an RPC wrapper function, so that
+ * kafs.multi() can be given any of the forms.  The _async and _begin forms
+ * are the same function.
+ */
+static PyObject *py_rxgen_get_begin_func(PyObject *rpc)
+{
+	PyObject *module, *name, *begin_name, *begin;
+	const char *n;
+
+	name = PyObject_GetAttrString(rpc, "__name__");
+	if (!name)
+		return NULL;
+	n = PyUnicode_AsUTF8(name);
+	if (!n) {
+		Py_DECREF(name);
+		return NULL;
+	}
+
+	if ((strlen(n) > 6 && strcmp(n + strlen(n) - 6, "_begin") == 0) ||
+	    (strlen(n) > 6 && strcmp(n + strlen(n) - 6, "_async") == 0)) {
+		Py_DECREF(name);
+		Py_INCREF(rpc);
+		return rpc;
+	}
+
+	module = PyObject_GetAttrString(rpc, "__self__");
+	if (!module) {
+		Py_DECREF(name);
+		PyErr_Clear();
+		PyErr_Format(PyExc_TypeError, "%R is not an RPC", rpc);
+		return NULL;
+	}
+
+	begin_name = PyUnicode_FromFormat("%s_begin", n);
+	Py_DECREF(name);
+	if (!begin_name) {
+		Py_DECREF(module);
+		return NULL;
+	}
+
+	begin = PyObject_GetAttr(module, begin_name);
+	Py_DECREF(begin_name);
+	Py_DECREF(module);
+	if (!begin) {
+		PyErr_Clear();
+		PyErr_Format(PyExc_TypeError, "%R is not an RPC", rpc);
+	}
+	return begin;
+}
+
+/*
+ * Collect whatever is already queued on the connections, such as the final
+ * messages for calls that have just been abandoned, so that those calls can be
+ * freed rather than lingering until the connection is next used.
+ */
+static void py_rxgen_drain_conns(PyObject *conns, bool conn_list)
+{
+	struct py_rx_connection *c;
+	PyObject *conn;
+	Py_ssize_t i, n;
+
+	n = conn_list ? PySequence_Fast_GET_SIZE(conns) : 1;
+	for (i = 0; i < n; i++) {
+		conn = conn_list ? PySequence_Fast_GET_ITEM(conns, i) : conns;
+		if (!PyObject_TypeCheck(conn, &py_rx_connectionType))
+			continue;
+		c = (struct py_rx_connection *)conn;
+		if (c->x)
+			rxrpc_poll_connection(c->x, 0);
+	}
+}
+
+/*
+ * Make the same RPC many times and run the calls concurrently:
+ *
+ *	results = kafs.multi(rpc, conns, args[, timeout=..., bulk_array=...])
+ *
+ * where rpc is an RPC wrapper such as kafs.VOLSER_ListVolumes.  Either conns
+ * is a sequence of connections and args is a tuple of arguments to pass on
+ * each, or conns is a single connection and args is a sequence of argument
+ * tuples, or both are sequences of the same length to be paired up.  Any
+ * keyword arguments are passed on each call.
+ *
+ * All the calls are transmitted before any replies are waited for, and then
+ * replies are processed as they arrive on any of the connections.  A list is
+ * returned containing, for each call in order, either its response or the
+ * exception that it raised.
+ *
+ * If first is true, we only wait for the first call to succeed and return a
+ * tuple of its index and response, abandoning the others; if none of them
+ * succeed, the exception raised by the first call is raised.
+ */
+static PyObject *py_rxgen_multi(PyObject *args, PyObject *kwds, bool first)
+{
+	struct rx_call **calls = NULL;
+	PyObject *rpc, *conns, *arglist, *begin = NULL;
+	PyObject *handles = NULL, *results = NULL, *ret;
+	PyObject *conn, *a, *call_args, *handle;
+	Py_ssize_t nr_conns = -1, nr_args = -1, nr, i, j, n;
+	bool conn_list, arg_list;
+	int winner;
+
+	if (!PyArg_ParseTuple(args, "OOO", &rpc, &conns, &arglist))
+		return NULL;
+
+	conn_list = !PyObject_TypeCheck(conns, &py_rx_connectionType);
+	arg_list = !PyTuple_Check(arglist);
+
+	if (conn_list) {
+		conns = PySequence_Fast(conns, "Expected a connection or sequence of connections");
+		if (!conns)
+			return NULL;
+		nr_conns = PySequence_Fast_GET_SIZE(conns);
+	} else {
+		Py_INCREF(conns);
+	}
+
+	if (arg_list) {
+		arglist = PySequence_Fast(arglist, "Expected an argument tuple or sequence of tuples");
+		if (!arglist)
+			goto error;
+		nr_args = PySequence_Fast_GET_SIZE(arglist);
+	} else {
+		Py_INCREF(arglist);
+	}
+
+	if (conn_list && arg_list && nr_conns != nr_args) {
+		PyErr_SetString(PyExc_ValueError,
+				"Connection and argument lists differ in length");
+		goto error;
+	}
+	nr = conn_list ? nr_conns : arg_list ? nr_args : 1;
+
+	begin = py_rxgen_get_begin_func(rpc);
+	if (!begin)
+		goto error;
+
+	handles = PyList_New(nr);
+	results = PyList_New(nr);
+	calls = calloc(nr ?: 1, sizeof(*calls));
+	if (!handles || !results || !calls) {
+		if (!calls)
+			PyErr_NoMemory();
+		goto error;
+	}
+
+	/* Launch all the calls.  Failure to launch one is recorded as its
+	 * result.
+	 */
+	for (i = 0; i < nr; i++) {
+		conn = conn_list ? PySequence_Fast_GET_ITEM(conns, i) : conns;
+		a = arg_list ? PySequence_Fast_GET_ITEM(arglist, i) : arglist;
+		if (!PyTuple_Check(a)) {
+			PyErr_SetString(PyExc_TypeError, "Expected a tuple of arguments");
+			goto error;
+		}
+
+		n = PyTuple_GET_SIZE(a);
+		call_args = PyTuple_New(n + 1);
+		if (!call_args)
+			goto error;
+		Py_INCREF(conn);
+		PyTuple_SET_ITEM(call_args, 0, conn);
+		for (j = 0; j < n; j++) {
+			Py_INCREF(PyTuple_GET_ITEM(a, j));
+			PyTuple_SET_ITEM(call_args, j + 1, PyTuple_GET_ITEM(a, j));
+		}
+
+		handle = PyObject_Call(begin, call_args, kwds);
+		Py_DECREF(call_args);
+		if (handle && PyObject_TypeCheck(handle, &py_rx_callType)) {
+			calls[i] = ((struct py_rx_call *)handle)->x;
+			PyList_SET_ITEM(handles, i, handle);
+		} else {
+			if (handle) {
+				Py_DECREF(handle);
+				PyErr_SetString(PyExc_TypeError, "RPC didn't return a call handle");
+			}
+			PyList_SET_ITEM(results, i, py_rxgen_fetch_exception());
+		}
+	}
+
+	/* Drive them all to completion together */
+	if (first) {
+		if (nr == 0) {
+			PyErr_SetString(PyExc_ValueError, "No calls to make");
+			goto error;
+		}
+		winner = rxrpc_wait_for_any_call(calls, nr);
+		if (winner == -1) {
+			PyErr_SetFromErrno(PyExc_OSError);
+			goto error;
+		}
+		if (winner < nr) {
+			handle = PyList_GET_ITEM(handles, winner);
+			a = py_rx_call_reap((struct py_rx_call *)handle);
+			if (!a)
+				goto error;
+			ret = Py_BuildValue("(iN)", winner, a);
+			goto out;
+		}
+	} else if (rxrpc_wait_for_calls(calls, nr) == -1) {
+		PyErr_SetFromErrno(PyExc_OSError);
+		goto error;
+	}
+
+	for (i = 0; i < nr; i++) {
+		handle = PyList_GET_ITEM(handles, i);
+		if (!handle)
+			continue;
+		a = py_rx_call_reap((struct py_rx_call *)handle);
+		if (!a)
+			a = py_rxgen_fetch_exception();
+		PyList_SET_ITEM(results, i, a);
+	}
+
+	if (first) {
+		/* None of them succeeded */
+		a = PyList_GET_ITEM(results, 0);
+		PyErr_SetObject((PyObject *)Py_TYPE(a), a);
+		goto error;
+	}
+
+	ret = results;
+	results = NULL;
+out:
+	/* Any calls still in progress get aborted as the handles are released.
+	 * The kernel still has them until it sends their final messages.
+	 */
+	free(calls);
+	if (first && handles) {
+		Py_DECREF(handles);
+		py_rxgen_drain_conns(conns, conn_list);
+	} else {
+		Py_XDECREF(handles);
+	}
+	Py_XDECREF(results);
+	Py_XDECREF(begin);
+	Py_XDECREF(arglist);
+	Py_XDECREF(conns);
+	return ret;
+
+error:
+	ret = NULL;
+	goto out;
+}
+
+PyObject *kafs_py_multi(PyObject *_self, PyObject *args, PyObject *kwds)
+{
+	return py_rxgen_multi(args, kwds, false);
+}
+
+/*
+ * Make the same RPC many times concurrently and take the first successful
+ * response:
+ *
+ *	index, resp = kafs.first(rpc, conns, args[, timeout=..., bulk_array=...])
+ *
+ * The arguments are as for kafs.multi().  The calls that are still in progress
+ * when one succeeds are aborted.
+ */
+PyObject *kafs_py_first(PyObject *_self, PyObject *args, PyObject *kwds)
+{
+	return py_rxgen_multi(args, kwds, true);
+}
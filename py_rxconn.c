@@ -15,26 +15,218 @@
 #include "py_rxgen.h"
 #include "rxgen.h"
 
-#if 0
 /*
- * Send an RPC call.
+ * Process replies to calls in progress on a connection:
+ *	n = conn.poll([timeout])
+ *
+ * The timeout is in seconds; if negative, we wait until at least one message
+ * arrives.  The number of messages processed is returned.
  */
-static PyObject *py_rx_conn_send(PyObject *_self, PyObject *args)
+static PyObject *py_rx_conn_poll(PyObject *_self, PyObject *args)
 {
 	struct py_rx_connection *self = (struct py_rx_connection *)_self;
-	self->x = NULL;
-	return 0;
+	double timeout = -1;
+	int ret;
+
+	if (!PyArg_ParseTuple(args, "|d", &timeout))
+		return NULL;
+
+	ret = rxrpc_poll_connection(self->x, timeout < 0 ? -1 : (int)(timeout * 1000));
+	if (ret == -1)
+		return PyErr_SetFromErrno(PyExc_OSError);
+	return PyLong_FromLong(ret);
+}
+
+/*
+ * Get the buffer pool statistics for a connection: stats = conn.buffer_stats()
+ */
+static PyObject *py_rx_conn_buffer_stats(PyObject *_self, PyObject *args)
+{
+	struct py_rx_connection *self = (struct py_rx_connection *)_self;
+	struct rx_buf_stats stats;
+
+	rx_get_buf_stats(self->x, &stats);
+	return Py_BuildValue("{sKsKsKsKsIsI}",
+			     "allocated", stats.allocated,
+			     "reused", stats.reused,
+			     "released", stats.released,
+			     "freed", stats.freed,
+			     "pooled", stats.pooled,
+			     "pooled_bytes", stats.pooled_bytes);
+}
+
+/*
+ * Get the asyncio event loop running in this thread.
+ */
+static PyObject *py_rx_get_running_loop(void)
+{
+	static PyObject *get_running_loop;
+	PyObject *asyncio;
+
+	if (!get_running_loop) {
+		asyncio = PyImport_ImportModule("asyncio");
+		if (!asyncio)
+			return NULL;
+		get_running_loop = PyObject_GetAttrString(asyncio, "get_running_loop");
+		Py_DECREF(asyncio);
+		if (!get_running_loop)
+			return NULL;
+	}
+	return PyObject_CallObject(get_running_loop, NULL);
+}
+
+/*
+ * Get a future that will be completed by the running event loop when the
+ * connection's socket next becomes readable.  The socket is registered with
+ * the loop when the first waiter turns up.  If a timeout is given (in
+ * milliseconds), the future is also completed when that expires so that the
+ * waiter can time out its call.
+ */
+PyObject *py_rx_connection_async_wait(struct py_rx_connection *self,
+				      int timeout)
+{
+	PyObject *loop, *fut, *ready = NULL, *ret;
+
+	loop = py_rx_get_running_loop();
+	if (!loop)
+		return NULL;
+
+	if (self->async_loop && self->async_loop != loop) {
+		Py_DECREF(loop);
+		PyErr_SetString(PyExc_RuntimeError,
+				"Connection is being awaited from another event loop");
+		return NULL;
+	}
+
+	fut = PyObject_CallMethod(loop, "create_future", NULL);
+	if (!fut)
+		goto error;
+
+	/* Tell the task that's driving us to wait for the future, just as
+	 * Future.__await__() does.
+	 */
+	if (PyObject_SetAttrString(fut, "_asyncio_future_blocking", Py_True) < 0)
+		goto error_fut;
+
+	ready = PyObject_GetAttrString((PyObject *)self, "_async_ready");
+	if (!ready)
+		goto error_fut;
+
+	if (timeout > 0) {
+		ret = PyObject_CallMethod(loop, "call_later", "dO",
+					  timeout / 1000.0, ready);
+		if (!ret)
+			goto error_fut;
+		Py_DECREF(ret);
+	}
+
+	if (self->async_waiters) {
+		Py_DECREF(ready);
+		Py_DECREF(loop);
+		if (PyList_Append(self->async_waiters, fut) < 0)
+			goto error_fut_only;
+		return fut;
+	}
+
+	self->async_waiters = PyList_New(0);
+	if (!self->async_waiters ||
+	    PyList_Append(self->async_waiters, fut) < 0)
+		goto error_waiters;
+
+	ret = PyObject_CallMethod(loop, "add_reader", "iO", self->x->fd, ready);
+	if (!ret)
+		goto error_waiters;
+	Py_DECREF(ret);
+	Py_DECREF(ready);
+
+	self->async_loop = loop;
+	return fut;
+
+error_waiters:
+	Py_CLEAR(self->async_waiters);
+error_fut:
+	Py_XDECREF(ready);
+	Py_DECREF(fut);
+error:
+	Py_DECREF(loop);
+	return NULL;
+
+error_fut_only:
+	Py_DECREF(fut);
+	return NULL;
+}
+
+/*
+ * Process the replies that have arrived on a connection when the event loop
+ * sees the socket become readable and then wake up everything that was
+ * waiting.  Each waiter rechecks its own call when it resumes.
+ */
+static PyObject *py_rx_conn_async_ready(PyObject *_self, PyObject *args)
+{
+	struct py_rx_connection *self = (struct py_rx_connection *)_self;
+	PyObject *waiters = self->async_waiters, *loop = self->async_loop;
+	PyObject *exc = NULL, *ret, *result = NULL;
+	Py_ssize_t i;
+	int done;
+
+	if (!waiters)
+		Py_RETURN_NONE;
+	self->async_waiters = NULL;
+	self->async_loop = NULL;
+
+	ret = PyObject_CallMethod(loop, "remove_reader", "i", self->x->fd);
+	if (!ret)
+		goto out;
+	Py_DECREF(ret);
+
+	if (rxrpc_poll_connection(self->x, 0) == -1) {
+		exc = PyObject_CallFunction(PyExc_OSError, "is",
+					    errno, strerror(errno));
+		if (!exc)
+			goto out;
+	}
+
+	for (i = 0; i < PyList_GET_SIZE(waiters); i++) {
+		PyObject *fut = PyList_GET_ITEM(waiters, i);
+
+		ret = PyObject_CallMethod(fut, "done", NULL);
+		if (!ret)
+			goto out;
+		done = PyObject_IsTrue(ret);
+		Py_DECREF(ret);
+		if (done)
+			continue;
+
+		if (exc)
+			ret = PyObject_CallMethod(fut, "set_exception", "O", exc);
+		else
+			ret = PyObject_CallMethod(fut, "set_result", "O", Py_None);
+		if (!ret)
+			goto out;
+		Py_DECREF(ret);
+	}
+
+	Py_INCREF(Py_None);
+	result = Py_None;
+out:
+	Py_XDECREF(exc);
+	Py_DECREF(waiters);
+	Py_DECREF(loop);
+	return result;
 }
 
 /*
  * Methods applicable to RxRPC connections
  */
 static PyMethodDef py_rx_connection_methods[] = {
-	{"send", (PyCFunction)py_rx_conn_send, METH_VARARGS,
-	"" },
+	{"poll", (PyCFunction)py_rx_conn_poll, METH_VARARGS,
+	 "Process replies to calls in progress on the connection." },
+	{"buffer_stats", (PyCFunction)py_rx_conn_buffer_stats, METH_NOARGS,
+	 "Get the buffer pool statistics for the connection." },
+	{"_async_ready", (PyCFunction)py_rx_conn_async_ready, METH_NOARGS,
+	 "Event loop callback for when the socket becomes readable." },
 	{}
 };
-#endif
 
 /*
  * RxRPC connection container.
@@ -44,12 +236,16 @@ py_rx_connection_init(PyObject *_self, PyObject *args, PyObject *kwds)
 {
 	struct py_rx_connection *self = (struct py_rx_connection *)_self;
 	self->x = NULL;
+	self->async_loop = NULL;
+	self->async_waiters = NULL;
 	return 0;
 }
 
 static void
 py_rx_connection_dealloc(struct py_rx_connection *self)
 {
+	Py_XDECREF(self->async_waiters);
+	Py_XDECREF(self->async_loop);
 	if (self->x) {
 		rx_close_connection(self->x);
 		self->x = NULL;
@@ -85,7 +281,7 @@ PyTypeObject py_rx_connectionType = {
 	0,				/* tp_weaklistoffset */
 	0,				/* tp_iter */
 	0,				/* tp_iternext */
-	0,				/* tp_methods */
+	py_rx_connection_methods,	/* tp_methods */
 	0,				/* tp_members */
 	0,				/* tp_getset */
 	0,				/* tp_base */
@@ -98,6 +294,20 @@ PyTypeObject py_rx_connectionType = {
 	0,				/* tp_new */
 };
 
+/*
+ * Release the GIL whilst the RxRPC driver waits on or talks to the kernel so
+ * that other threads can make progress.
+ */
+static void *py_rx_release_gil(void)
+{
+	return PyEval_SaveThread();
+}
+
+static void py_rx_reacquire_gil(void *cookie)
+{
+	PyEval_RestoreThread(cookie);
+}
+
 /*
  * Set up an RxRPC connection.
  */
@@ -111,14 +321,19 @@ kafs_py_rx_new_connection(PyObject *_self, PyObject *args)
 		struct sockaddr_in sin;
 		struct sockaddr_in6 sin6;
 	} sa;
+	PyObject *py_timeout = Py_None;
 	const char *address = NULL, *key = NULL;
 	socklen_t salen;
 	uint16_t port, service, local_port = 0, local_service = 0;
-	int exclusive = 0, security = 0;
+	int exclusive = 0, security = 0, timeout;
 
-	if (!PyArg_ParseTuple(args, "sHHzi|HHp",
+	if (!PyArg_ParseTuple(args, "sHHzi|HHpO",
 			      &address, &port, &service, &key, &security,
-			      &local_port, &local_service, &exclusive))
+			      &local_port, &local_service, &exclusive,
+			      &py_timeout))
+		return NULL;
+
+	if (py_rxgen_parse_timeout(py_timeout, &timeout) < 0)
 		return NULL;
 
 	memset(&sa, 0, sizeof(sa));
@@ -149,6 +364,9 @@ kafs_py_rx_new_connection(PyObject *_self, PyObject *args)
 		return errno == ENOMEM ? PyExc_MemoryError :
 			PyErr_SetFromErrno(PyExc_IOError);
 	}
+	z_conn->call_timeout = timeout;
+	z_conn->unlock_caller = py_rx_release_gil;
+	z_conn->relock_caller = py_rx_reacquire_gil;
 	obj->x = z_conn;
 	return (PyObject *)obj;
 }
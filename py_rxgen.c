@@ -558,44 +558,35 @@ error:
 	return -1;
 }
 
-PyObject *py_rxgen_get_structs(const void *data, size_t num, size_t size,
-			       PyObject **cache,
-			       PyObject *(*data_to_type)(const void *elem))
-{
-	PyObject *list, *obj;
-	int i;
-
-	if (*cache) {
-		Py_INCREF(*cache);
-		return *cache;
-	}
-
-	list = PyList_New(num);
-	if (!list)
-		return NULL;
-
-	for (i = 0; i < num; i++) {
-		obj = data_to_type(data + num * size);
-		if (!obj) {
-			Py_DECREF(list);
-			return NULL;
-		}
-		PyList_SetItem(list, i, obj);
-	}
-
-	Py_INCREF(list);
-	*cache = list;
-	return list;
-}
-
 int py_rxgen_premarshal_structs(void *array,
 				size_t n, size_t size, size_t offs,
 				PyObject *cache,
 				int (*premarshal)(PyObject *object))
 {
+	struct py_rx_struct_array *view = (struct py_rx_struct_array *)cache;
 	PyObject *list;
 	Py_ssize_t i, c;
 
+	if (!cache)
+		return 0;
+
+	/* If we're looking at the array in place, only elements that have been
+	 * wrapped may have changed.
+	 */
+	if (Py_TYPE(cache) == &py_rx_struct_arrayType && view->data == array) {
+		if (!view->cache)
+			return 0;
+		for (i = 0; i < n; i++) {
+			PyObject *p = view->cache[i];
+			if (!p)
+				continue;
+			if (premarshal(p) < 0)
+				return -1;
+			memcpy(array + i * size, (void *)p + offs, size);
+		}
+		return 0;
+	}
+
 	list = PySequence_Fast(cache, "Expecting list or tuple of structs");
 	if (!list)
 		return -1;
@@ -1206,6 +1197,157 @@ int py_dec_init_string(struct rx_call *call, PyObject **_str)
 	return 1;
 }
 
+/*
+ * Create an array.array of the given type code with room for count integers,
+ * ready for a bulk reply to be decoded into.
+ */
+PyObject *py_rxgen_new_int_array(const char *typecode, unsigned count)
+{
+	static PyObject *array_type;
+	PyObject *template, *array;
+
+	if (!array_type) {
+		PyObject *mod = PyImport_ImportModule("array");
+		if (!mod)
+			return NULL;
+		array_type = PyObject_GetAttrString(mod, "array");
+		Py_DECREF(mod);
+		if (!array_type)
+			return NULL;
+	}
+
+	template = PyObject_CallFunction(array_type, "s[i]", typecode, 0);
+	if (!template)
+		return NULL;
+	array = PySequence_Repeat(template, count);
+	Py_DECREF(template);
+	return array;
+}
+
+/*
+ * Get a view of an integer array, checking that it can hold at least the
+ * given number of 32-bit integers.
+ */
+static int py_get_int32_view(PyObject *obj, Py_buffer *view, int flags,
+			     unsigned min_count)
+{
+#if __BYTE_ORDER__ == __ORDER_LITTLE_ENDIAN__
+	static const char native_order = '<';
+#else
+	static const char native_order = '>';
+#endif
+	const char *fmt;
+
+	if (PyObject_GetBuffer(obj, view, flags | PyBUF_FORMAT | PyBUF_C_CONTIGUOUS) < 0)
+		return -1;
+
+	fmt = view->format;
+	if (fmt && (*fmt == '@' || *fmt == '=' || *fmt == native_order))
+		fmt++;
+	if (view->itemsize != 4 || (fmt && (!*fmt || !strchr("iIlL", *fmt)))) {
+		PyErr_Format(PyExc_TypeError,
+			     "Bulk array must have 32-bit integer elements");
+		goto error;
+	}
+	if (view->len / 4 < min_count) {
+		PyErr_Format(PyExc_ValueError,
+			     "Bulk array too small for %u elements", min_count);
+		goto error;
+	}
+	return 0;
+
+error:
+	PyBuffer_Release(view);
+	return -1;
+}
+
+/*
+ * Decode 32-bit integers from a bulk reply into an array.array or other
+ * writable buffer object.  As many elements as are available are byte-swapped
+ * straight out of the receive buffers in one pass rather than being turned
+ * into individual Python ints.  call->bulk_index is advanced past them.
+ *
+ * Returns 0 if the array is complete, 1 if more data is needed and -1 on
+ * error.
+ */
+int py_dec_into_int32_array(struct rx_call *call, PyObject *obj)
+{
+	Py_buffer view;
+	const uint8_t *src;
+	net_xdr_t x;
+	uint32_t *p;
+	unsigned n, i;
+
+	if (call->error_code)
+		return -1;
+
+	if (py_get_int32_view(obj, &view, PyBUF_WRITABLE, call->bulk_count) < 0)
+		return -1;
+	p = view.buf;
+
+	while (call->bulk_index < call->bulk_count) {
+		n = (call->data_stop - call->data_cursor) / 4;
+		if (n > 0) {
+			/* Whole words available in the current buffer */
+			if (n > call->bulk_count - call->bulk_index)
+				n = call->bulk_count - call->bulk_index;
+			src = call->data_cursor;
+			for (i = 0; i < n; i++) {
+				memcpy(&x, src + i * 4, 4);
+				p[call->bulk_index + i] = ntohl(x);
+			}
+			call->data_cursor += n * 4;
+			call->bulk_index += n;
+			continue;
+		}
+
+		/* The next word is in the next buffer or straddles two. */
+		if (rxrpc_post_dec(call) < 0)
+			break;
+		if (call->data_count < 4)
+			break;
+		p[call->bulk_index++] = rxrpc_dec(call);
+	}
+
+	PyBuffer_Release(&view);
+	if (rxrpc_post_dec(call) < 0)
+		return -1;
+	return call->bulk_index < call->bulk_count ? 1 : 0;
+}
+
+/*
+ * Encode a bulk array of 32-bit integers from an array.array or other buffer
+ * object, byte-swapping them in chunks rather than converting each from a
+ * Python int.
+ */
+int py_enc_int32_array(struct rx_call *call, PyObject *obj)
+{
+	Py_buffer view;
+	net_xdr_t chunk[256];
+	const uint32_t *p;
+	unsigned count, n, i;
+
+	if (py_get_int32_view(obj, &view, PyBUF_SIMPLE, 0) < 0)
+		return -1;
+
+	p = view.buf;
+	count = view.len / 4;
+	rxrpc_enc(call, count);
+
+	while (count > 0) {
+		n = count < 256 ? count : 256;
+		for (i = 0; i < n; i++)
+			chunk[i] = htonl(p[i]);
+		if (rxrpc_enc_blob(call, chunk, n * 4) < 0)
+			break;
+		p += n;
+		count -= n;
+	}
+
+	PyBuffer_Release(&view);
+	return rxrpc_post_enc(call);
+}
+
 /*
  * Comparator for binary searching the abort code table
  */
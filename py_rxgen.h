@@ -17,13 +17,27 @@
 struct py_rx_connection {
 	PyObject_HEAD
 	struct rx_connection *x;
+	PyObject *async_loop;		/* Event loop watching the socket */
+	PyObject *async_waiters;	/* Futures awaiting socket readiness */
 };
 
 struct py_rx_call {
 	PyObject_HEAD
 	struct rx_call *x;
-	struct py_rx_request *req;
-	struct py_rx_response *resp;
+	struct py_rx_connection *conn;	/* Connection the call was made on */
+	PyObject *resp;			/* Response object being decoded into */
+	PyObject *result;		/* Result once the call has been reaped */
+	PyObject *error;		/* Or the exception it raised */
+};
+
+struct py_rx_struct_array {
+	PyObject_HEAD
+	void		*data;		/* Raw C array of decoded structs */
+	size_t		num;		/* Number of elements */
+	size_t		size;		/* Size of an element */
+	bool		borrowed;	/* Data belongs to another object */
+	PyObject	**cache;	/* Python wrappers for accessed elements */
+	PyObject *(*data_to_type)(const void *elem);
 };
 
 struct py_rx_request {
@@ -48,12 +62,20 @@ struct py_rx_split_info {
 	enum py_rx_split_state split_state;
 	unsigned state;
 	bool receiving_data;
+	bool sink_padded;		/* Sink data is padded to 32-bit boundary */
+	int sink_fd;			/* File to write received data to (or -1) */
+	unsigned long long sink_size;	/* Amount of data to write to sink_fd */
+	unsigned long long sink_remaining; /* Amount of that still to write */
 };
 
 extern PyTypeObject py_rx_connectionType;
+extern PyTypeObject py_rx_callType;
+extern PyTypeObject py_rx_struct_arrayType;
 
 extern PyObject *kafs_py_rx_new_connection(PyObject *, PyObject *);
 extern PyObject *kafs_py_string_to_key(PyObject *, PyObject *);
+extern PyObject *kafs_py_multi(PyObject *, PyObject *, PyObject *);
+extern PyObject *kafs_py_first(PyObject *, PyObject *, PyObject *);
 
 extern int py_rxgen_initialise_members(PyObject *obj, PyObject *kw);
 extern void py_rxgen_decoder_cleanup(struct rx_call *call);
@@ -106,13 +128,78 @@ extern int py_rxgen_premarshal_int32(void *_array, size_t n, PyObject *cache);
 /*
  * Embedded struct array handling
  */
-extern PyObject *py_rxgen_get_structs(const void *data, size_t num, size_t size,
+extern PyObject *py_rxgen_get_structs(void *data, size_t num, size_t size,
 				      PyObject **cache,
 				      PyObject *(*data_to_type)(const void *elem));
+extern void py_rxgen_detach_structs(PyObject *cache);
 extern int py_rxgen_premarshal_structs(void *array, size_t n, size_t size, size_t offs,
 				       PyObject *cache,
 				       int (*premarshal)(PyObject *object));
 
+/*
+ * Bulk integer array handling
+ */
+#define PY_RXGEN_BULK_ARRAY	0x01	/* Decode bulk arrays compactly */
+
+extern PyObject *py_rxgen_new_int_array(const char *typecode, unsigned count);
+extern int py_dec_into_int32_array(struct rx_call *call, PyObject *obj);
+extern int py_enc_int32_array(struct rx_call *call, PyObject *obj);
+
+/*
+ * Bulk struct array handling
+ */
+extern PyObject *py_rxgen_new_struct_array(size_t num, size_t size,
+					   PyObject *(*data_to_type)(const void *elem));
+extern int py_rxgen_set_dtype(PyTypeObject *type, PyObject *dtype);
+
+static inline void *py_rxgen_struct_array_elem(PyObject *_array, size_t i)
+{
+	struct py_rx_struct_array *array = (struct py_rx_struct_array *)_array;
+
+	return array->data + i * array->size;
+}
+
+/*
+ * Immutable record handling
+ */
+#define PY_RXGEN_RECORDS	0x02	/* Decode structs as immutable records */
+
+enum py_rx_record_kind {
+	py_rx_record_string,
+	py_rx_record_int8,
+	py_rx_record_int16,
+	py_rx_record_int32,
+	py_rx_record_uint8,
+	py_rx_record_uint16,
+	py_rx_record_uint32,
+	py_rx_record_struct,
+	py_rx_record_structs,
+};
+
+struct py_rx_record_field {
+	size_t		offset;		/* Offset of member in record object */
+	size_t		num;		/* Number of elements */
+	size_t		size;		/* Size of an element */
+	enum py_rx_record_kind kind;
+	PyObject *(*data_to_record)(const void *elem);
+};
+
+extern void py_rxgen_record_dealloc(PyObject *self);
+extern PyObject *py_rxgen_record_get(PyObject *self, void *closure);
+
+/*
+ * Call handling
+ */
+extern PyObject *py_rxgen_call_failed(struct rx_call *call);
+extern PyObject *py_rxgen_run_sync_call(struct rx_call *call, PyObject *resp);
+extern PyObject *py_rxgen_new_call(struct py_rx_connection *z_conn,
+				   struct rx_call *call, PyObject *resp);
+extern PyObject *py_rx_connection_async_wait(struct py_rx_connection *self,
+					      int timeout);
+extern int py_rxgen_parse_timeout(PyObject *obj, int *_timeout);
+extern int py_rxgen_parse_call_kwds(PyObject *kwds, int *_timeout,
+				    unsigned *_flags);
+
 /*
  * Abort mapping
  */
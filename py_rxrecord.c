@@ -0,0 +1,87 @@
+/* Python immutable record support for decoded structs
+ *
+ * Copyright (C) 2014 Red Hat, Inc. All Rights Reserved.
+ * Written by David Howells (dhowells@redhat.com)
+ *
+ * This program is free software; you can redistribute it and/or
+ * modify it under the terms of the GNU General Public Licence
+ * as published by the Free Software Foundation; either version
+ * 2 of the Licence, or (at your option) any later version.
+ */
+
+#include <Python.h>
+#include "structmember.h"
+#include <arpa/inet.h>
+#include "py_rxgen.h"
+#include "rxgen.h"
+
+/*
+ * A record is just a Python object header followed by a copy of the raw C
+ * struct, so there's nothing to release other than the object itself.
+ */
+void py_rxgen_record_dealloc(PyObject *self)
+{
+	Py_TYPE(self)->tp_free(self);
+}
+
+static PyObject *py_rxgen_record_get_elem(const struct py_rx_record_field *field,
+					  const void *p, size_t i)
+{
+	switch (field->kind) {
+	case py_rx_record_int8:
+		return PyLong_FromLong(((const int8_t *)p)[i]);
+	case py_rx_record_int16:
+		return PyLong_FromLong(((const int16_t *)p)[i]);
+	case py_rx_record_int32:
+		return PyLong_FromLong(((const int32_t *)p)[i]);
+	case py_rx_record_uint8:
+		return PyLong_FromUnsignedLong(((const uint8_t *)p)[i]);
+	case py_rx_record_uint16:
+		return PyLong_FromUnsignedLong(((const uint16_t *)p)[i]);
+	case py_rx_record_uint32:
+		return PyLong_FromUnsignedLong(((const uint32_t *)p)[i]);
+	case py_rx_record_structs:
+		return field->data_to_record(p + i * field->size);
+	default:
+		PyErr_SetString(PyExc_SystemError, "Unsupported record field");
+		return NULL;
+	}
+}
+
+/*
+ * Get the value of a record member that can't be handled by a PyMemberDef.
+ * The closure describes where the member lies in the record and what it
+ * holds.  Strings come back as str, embedded structs as records and arrays as
+ * tuples.  Nothing is cached as the record can't be changed.
+ */
+PyObject *py_rxgen_record_get(PyObject *self, void *closure)
+{
+	const struct py_rx_record_field *field = closure;
+	const void *p = (const void *)self + field->offset;
+	PyObject *tuple, *item;
+	size_t i;
+
+	switch (field->kind) {
+	case py_rx_record_string:
+		return py_rxgen_get_string(p, field->num);
+	case py_rx_record_struct:
+		return field->data_to_record(p);
+	default:
+		break;
+	}
+
+	tuple = PyTuple_New(field->num);
+	if (!tuple)
+		return NULL;
+
+	for (i = 0; i < field->num; i++) {
+		item = py_rxgen_record_get_elem(field, p, i);
+		if (!item) {
+			Py_DECREF(tuple);
+			return NULL;
+		}
+		PyTuple_SET_ITEM(tuple, i, item);
+	}
+
+	return tuple;
+}
@@ -12,6 +12,7 @@
 #include <Python.h>
 #include "structmember.h"
 #include <poll.h>
+#include <unistd.h>
 #include <arpa/inet.h>
 #include <assert.h>
 #include "py_rxgen.h"
@@ -34,15 +35,18 @@ static int py_rx_split_do_recv(struct rx_call *call,
 	return 0;
 }
 
+/*
+ * Transmit any encoded data followed by the caller's data, which is sent
+ * directly from where it lies rather than being copied into the call buffers.
+ */
 static int py_rx_split_do_send_recv(struct rx_call *call,
 				    struct py_rx_split_info *split_info,
+				    const void *data, size_t size,
 				    bool more)
 {
-	if (!more) {
-		call->more_send = 0;
+	if (!more)
 		split_info->split_state = split_idle;
-	}
-	if (rxrpc_send_data(call) == -1)
+	if (rxrpc_send_buffer(call, data, size, more) == -1)
 		return -1;
 
 	return py_rx_split_do_recv(call, split_info);
@@ -50,13 +54,16 @@ static int py_rx_split_do_send_recv(struct rx_call *call,
 
 /*
  * Send an RPC call: split_info.send(data, more)
+ *
+ * The data can be any contiguous object that supports the buffer protocol,
+ * such as bytes, a memoryview or an mmap of a file.
  */
 static PyObject *py_rx_split_send(PyObject *_self, PyObject *args)
 {
 	struct py_rx_split_info *split_info = (struct py_rx_split_info *)_self;
 	struct rx_call *call = split_info->call;
 	Py_buffer data;
-	int more = 0;
+	int more = 0, ret;
 
 	if (!call)
 		abort();
@@ -64,13 +71,12 @@ static PyObject *py_rx_split_send(PyObject *_self, PyObject *args)
 	if (split_info->split_state != split_transmitting)
 		abort();
 
-	if (!PyArg_ParseTuple(args, "y*p", &data, &more))
+	if (!PyArg_ParseTuple(args, "y*|p", &data, &more))
 		return NULL;
 
-	if (py_enc_buffer_raw(call, &data, UINT_MAX) == -1)
-		return PyErr_SetFromErrno(PyExc_OSError);
-
-	if (py_rx_split_do_send_recv(call, split_info, more) < 0)
+	ret = py_rx_split_do_send_recv(call, split_info, data.buf, data.len, more);
+	PyBuffer_Release(&data);
+	if (ret < 0)
 		return PyErr_SetFromErrno(PyExc_OSError);
 
 	Py_RETURN_NONE;
@@ -126,6 +132,126 @@ static PyObject *py_rx_split_begin_recv(PyObject *_self, PyObject *args)
 	}
 }
 
+/*
+ * Receive data straight into a file: ret = split_info.recv_into_fd(fd[, size[, padded]])
+ *
+ * The received data is written directly from the call's buffers to the given
+ * file descriptor (or object with a fileno() method) without passing through
+ * any Python objects.  If size is given, that much data is written and the
+ * split handler is reentered with the state incremented when it's done; if it
+ * isn't, everything remaining in the call is written, which has the same
+ * restrictions as will_recv_all().
+ *
+ * Returns NULL on error; True on success.
+ */
+static PyObject *py_rx_split_recv_into_fd(PyObject *_self, PyObject *args)
+{
+	struct py_rx_split_info *split_info = (struct py_rx_split_info *)_self;
+	struct rx_call *call = split_info->call;
+	PyObject *file, *size = Py_None;
+	unsigned long long n;
+	int fd, padded = 1;
+
+	if (!call)
+		abort();
+	if (split_info->split_state != split_receiving)
+		abort();
+
+	if (!PyArg_ParseTuple(args, "O|Op", &file, &size, &padded))
+		return NULL;
+
+	fd = PyObject_AsFileDescriptor(file);
+	if (fd == -1)
+		return NULL;
+
+	if (size == Py_None) {
+		n = ULLONG_MAX;
+		call->need_size = UINT_MAX;
+		padded = 0;
+	} else {
+		n = PyLong_AsUnsignedLongLong(size);
+		if (n == (unsigned long long)-1 && PyErr_Occurred())
+			return NULL;
+		if (n == 0) {
+			split_info->state++;
+			Py_RETURN_TRUE;
+		}
+		call->need_size = 1;
+		rxrpc_expect(call, n);
+	}
+
+	split_info->sink_fd = fd;
+	split_info->sink_size = n;
+	split_info->sink_remaining = n;
+	split_info->sink_padded = padded;
+	split_info->receiving_data = true;
+	Py_RETURN_TRUE;
+}
+
+/*
+ * Write received data to the sink file.
+ *
+ * Returns -1 on error, 0 if all the data has been written and 1 if more data
+ * is needed.
+ */
+static int py_rx_split_write_to_fd(struct rx_call *call,
+				   struct py_rx_split_info *split_info)
+{
+	unsigned long long size = split_info->sink_size;
+	ssize_t done;
+	size_t seg;
+
+	if (call->error_code)
+		return -1;
+
+	for (;;) {
+		seg = call->data_stop - call->data_cursor;
+		if (seg > split_info->sink_remaining)
+			seg = split_info->sink_remaining;
+		if (seg > 0) {
+			Py_BEGIN_ALLOW_THREADS;
+			done = write(split_info->sink_fd, call->data_cursor, seg);
+			Py_END_ALLOW_THREADS;
+			if (done == -1) {
+				if (errno == EINTR) {
+					if (PyErr_CheckSignals() < 0)
+						return -1;
+					continue;
+				}
+				PyErr_SetFromErrno(PyExc_OSError);
+				return -1;
+			}
+
+			call->data_cursor += done;
+			call->data_count -= done;
+			call->data_start = call->data_cursor;
+			call->blob_decoded += done;
+			split_info->sink_remaining -= done;
+			continue;
+		}
+
+		if (split_info->sink_remaining == 0)
+			break;
+		if (call->data_count == 0) {
+			if (!call->more_recv && size == ULLONG_MAX)
+				break;
+			return 1;
+		}
+		rxrpc_dec_advance_buffer(call);
+	}
+
+	split_info->sink_fd = -1;
+	if (split_info->sink_padded && (size & 3)) {
+		/* Soak up the padding to a 32-bit boundary */
+		call->blob = &rxgen_dec_padding_sink;
+		call->blob_size = 4 - (size & 3);
+		call->blob_offset = 0;
+		call->need_size = call->blob_size;
+		return 1;
+	}
+	return 0;
+}
+
 /*
  * Query how much data is in the Rx buffers of an RPC call: n = split_info.data_available()
  */
@@ -162,6 +288,8 @@ static PyMethodDef py_rx_split_info_methods[] = {
 	 "" },
 	{"begin_recv", (PyCFunction)py_rx_split_begin_recv, METH_VARARGS,
 	 "" },
+	{"recv_into_fd", (PyCFunction)py_rx_split_recv_into_fd, METH_VARARGS,
+	 "" },
 	{"data_available", (PyCFunction)py_rx_split_data_available, METH_NOARGS,
 	 "" },
 	{}
@@ -185,6 +313,7 @@ py_rx_split_init(PyObject *_self, PyObject *args, PyObject *kwds)
 	self->split_state = split_idle;
 	self->state = 0;
 	self->receiving_data = false;
+	self->sink_fd = -1;
 	return 0;
 }
 
@@ -269,7 +398,7 @@ int py_rxgen_split_transmit(struct rx_call *call)
 	result = PyObject_CallMethod(callback, "transmit",
 				     "O", call->decoder_split_info);
 	if (result == Py_None) {
-		ret = py_rx_split_do_send_recv(call, split_info, false);
+		ret = py_rx_split_do_send_recv(call, split_info, NULL, 0, false);
 	} else if (result) {
 		ret = PyObject_IsTrue(result) ? 0 : -1;
 		Py_DECREF(result);
@@ -300,8 +429,13 @@ int py_rxgen_split_receive(struct rx_call *call, bool init)
 
 again:
 	if (split_info->receiving_data) {
-		switch (py_dec_into_buffer(call)) {
+		if (split_info->sink_fd != -1)
+			ret = py_rx_split_write_to_fd(call, split_info);
+		else
+			ret = py_dec_into_buffer(call);
+		switch (ret) {
 		case -1:
+			split_info->sink_fd = -1;
 			result = PyObject_CallMethod(callback, "receive_failed",
 						     "O", call->decoder_split_info);
 			Py_XDECREF(result);
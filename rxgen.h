@@ -14,22 +14,74 @@
 
 #include "af_rxrpc.h"
 #include <stdbool.h>
+#include <pthread.h>
+#include <time.h>
 #include <errno.h>
 #include <stdlib.h>
+#include <string.h>
+#include <limits.h>
 
 typedef uint32_t net_xdr_t;
 
+/*
+ * Buffers come in power-of-two sizes from RXGEN_BUFFER_SIZE up to
+ * RXGEN_BUFFER_MAX.  A call starts off with small buffers and uses larger ones
+ * as more data is transferred or as the decoder reports that it's expecting a
+ * large amount of data.
+ */
+#define RXGEN_BUFFER_SIZE	1024
+#define RXGEN_BUFFER_MAX	(64 * 1024)
+#define RXGEN_BUF_NR_SIZES	7	/* log2(RXGEN_BUFFER_MAX / RXGEN_BUFFER_SIZE) + 1 */
+#define RXGEN_BUF_POOL_MAX	(256 * 1024) /* Max spare buffer space per connection */
+#define RXGEN_SEND_IOV_MAX	64	/* Max segments handed to each sendmsg() */
+
+struct rx_buf_stats {
+	unsigned long long allocated;	/* Buffers obtained from malloc */
+	unsigned long long reused;	/* Buffers obtained from the pool */
+	unsigned long long released;	/* Buffers returned to the pool */
+	unsigned long long freed;	/* Buffers freed as the pool was full */
+	unsigned	pooled;		/* Number of buffers currently in the pool */
+	unsigned	pooled_bytes;	/* Amount of buffer space in the pool */
+};
+
 struct rx_connection {
 	struct sockaddr_rxrpc peer;
 	uint32_t	last_abort_code;
 	int fd;
-};
+	int		call_timeout;	/* Default call timeout in ms (0 for none) */
 
-#define RXGEN_BUFFER_SIZE	1024
+	/* Receive-side serialisation.  Only one thread at a time may claim the
+	 * socket to wait on it; others wait on the condition for it to
+	 * dispatch replies.  The lock only guards the claim: calls are only
+	 * changed under the caller's lock, which is never taken whilst the
+	 * receive lock is held.
+	 */
+	pthread_mutex_t	recv_lock;
+	pthread_cond_t	recv_wait;
+	bool		polling;
+
+	/* Hooks to drop and retake the caller's lock (such as the Python GIL)
+	 * around blocking socket operations.
+	 */
+	void *(*unlock_caller)(void);
+	void (*relock_caller)(void *cookie);
+
+	/* Pool of spare buffers for calls made on this connection */
+	pthread_mutex_t	pool_lock;
+	struct rx_buf	*pool[RXGEN_BUF_NR_SIZES];
+	struct rx_buf_stats pool_stats;
+	unsigned	recv_buf_size;	/* Size of buffers to receive into */
+
+	/* Calls that have been terminated, but that can't be freed until the
+	 * kernel has given us their final messages.
+	 */
+	struct rx_call	*zombies;
+};
 
 struct rx_buf {
 	uint32_t	magic;
-	unsigned short	io_cursor;
+	unsigned	io_cursor;
+	unsigned	size;		/* Size of the data buffer */
 	//unsigned short	enc_cursor;
 	uint8_t		*buf;
 	struct rx_buf	*next;
@@ -62,14 +114,19 @@ enum rx_call_state {
 struct rx_call {
 	uint32_t	magic;
 	struct rx_connection *conn;
+	struct rx_call	*next_zombie;
 	enum rx_call_state state;
 	unsigned	known_to_kernel : 1;
+	unsigned	dead : 1;	/* Terminated; on conn->zombies */
 	unsigned	secured : 1;
 	unsigned	more_send : 1;
 	unsigned	more_recv : 1;
 	int		error_code;
 	uint32_t	abort_code;
 	unsigned	need_size;
+	unsigned	buffer_size;	/* Size of the next buffer to allocate */
+	unsigned	size_hint;	/* Amount of data the decoder still expects */
+	struct timespec	deadline;	/* When the call times out (0 for never) */
 
 	unsigned long long bytes_sent, bytes_received, blob_decoded;
 
@@ -102,6 +159,7 @@ struct rx_call {
 	};
 	int (*decoder)(struct rx_call *call);
 	void		*decoder_private;
+	unsigned	decoder_flags;	/* Wrapper-specific decode options */
 	void		*decoder_manager;
 	void		*decoder_split_callback;
 	void		*decoder_split_info;
@@ -124,6 +182,28 @@ static inline void rxrpc_enc(struct rx_call *call, uint32_t data)
 	}
 }
 
+/*
+ * Encode a block of 32-bit words in one go if there's room for all of them in
+ * the current buffer.  Returns false if there isn't, in which case the caller
+ * must encode them individually.
+ */
+static inline bool rxrpc_enc_words(struct rx_call *call, const void *p, unsigned n)
+{
+	const uint32_t *w = p;
+	uint8_t *cursor = call->data_cursor;
+	unsigned i;
+
+	if (call->data_stop - cursor < (long)n * 4)
+		return false;
+
+	for (i = 0; i < n; i++) {
+		net_xdr_t x = htonl(w[i]);
+		memcpy(cursor + i * 4, &x, sizeof(x));
+	}
+	call->data_cursor = cursor + n * 4;
+	return true;
+}
+
 static inline void rxrpc_enc_align(struct rx_call *call)
 {
 	abort(); // Can't assume data_cursor is 4-byte aligned
@@ -149,8 +229,11 @@ extern void rxrpc_dec_blob(struct rx_call *call);
 extern uint32_t rxrpc_dec_slow(struct rx_call *call);
 static inline uint32_t rxrpc_dec(struct rx_call *call)
 {
+	/* Each received message goes into a buffer of its own, so a buffer
+	 * may end part way through a word.
+	 */
 	if (__builtin_expect(((unsigned long)call->data_cursor & 3) == 0 &&
-			     call->data_cursor < call->data_stop, 1)) {
+			     call->data_stop - call->data_cursor >= 4, 1)) {
 		net_xdr_t x = *(net_xdr_t *)call->data_cursor;
 		call->data_cursor += sizeof(x);
 		return ntohl(x);
@@ -159,6 +242,26 @@ static inline uint32_t rxrpc_dec(struct rx_call *call)
 	}
 }
 
+/*
+ * Decode a block of 32-bit words in one go if they all lie within the current
+ * buffer.  Returns false if they don't, in which case the caller must decode
+ * them individually.
+ */
+static inline bool rxrpc_dec_words(struct rx_call *call, void *p, unsigned n)
+{
+	uint32_t *w = p;
+	unsigned i;
+
+	if (call->data_stop - call->data_cursor < (long)n * 4)
+		return false;
+
+	memcpy(w, call->data_cursor, n * 4);
+	for (i = 0; i < n; i++)
+		w[i] = ntohl(w[i]);
+	call->data_cursor += n * 4;
+	return true;
+}
+
 static inline void rxrpc_dec_align(struct rx_call *call)
 {
 	unsigned long cursor = (unsigned long)call->data_cursor;
@@ -181,6 +284,20 @@ static inline int rxrpc_post_dec(struct rx_call *call)
 	}
 }
 
+/*
+ * Note how much data a call's decoder is expecting, including anything already
+ * received, so that the receive buffers can be sized to suit.
+ */
+static inline void rxrpc_expect(struct rx_call *call, unsigned long long size)
+{
+	if (size <= call->data_count)
+		call->size_hint = 0;
+	else if (size - call->data_count > UINT_MAX)
+		call->size_hint = UINT_MAX;
+	else
+		call->size_hint = size - call->data_count;
+}
+
 extern void rxrpc_dec_advance_buffer(struct rx_call *call);
 extern int rxgen_dec_discard_excess(struct rx_call *call);
 
@@ -194,13 +311,26 @@ extern struct rx_connection *rx_new_connection(const struct sockaddr *sa,
 					       int security);
 
 extern void rx_close_connection(struct rx_connection *z_conn);
+extern void rx_get_buf_stats(struct rx_connection *z_conn,
+			     struct rx_buf_stats *stats);
 
 extern struct rx_call *rxrpc_alloc_call(struct rx_connection *z_conn, int incoming_call);
 extern void rxrpc_abort_call(struct rx_call *call, uint32_t abort_code);
 extern void rxrpc_terminate_call(struct rx_call *call, uint32_t abort_code);
 
 extern int rxrpc_send_data(struct rx_call *call);
+extern int rxrpc_send_buffer(struct rx_call *call, const void *data, size_t size,
+			     bool more);
 extern int rxrpc_recv_data(struct rx_connection *z_conn, bool nowait);
+extern int rxrpc_poll_connection(struct rx_connection *z_conn, int timeout);
+extern bool rxrpc_call_is_complete(const struct rx_call *call);
+extern int rxrpc_call_outcome(struct rx_call *call);
+extern void rxrpc_set_call_timeout(struct rx_call *call, int timeout);
+extern int rxrpc_call_time_remaining(const struct rx_call *call);
+extern void rxrpc_time_out_call(struct rx_call *call);
+extern int rxrpc_wait_for_call(struct rx_call *call);
+extern int rxrpc_wait_for_calls(struct rx_call **calls, unsigned nr);
+extern int rxrpc_wait_for_any_call(struct rx_call **calls, unsigned nr);
 extern int rxrpc_run_sync_call(struct rx_call *call);
 
 #endif /* _RXGEN_H */
@@ -31,6 +31,51 @@ from rxgen_bits import *
 def emit_struct_encdec_decl(o, struct):
     o.rxsrc("/* ", struct.name, " XDR size ", struct.xdr_size, " */\n")
 
+###############################################################################
+#
+# Determine whether a member is laid out in C exactly as it is in XDR: as a
+# sequence of 32-bit words in the same order.  Returns the number of words if
+# so and None otherwise.
+#
+###############################################################################
+def member_xdr_words(ty):
+    if ty.is_struct():
+        for m in ty.members:
+            if member_xdr_words(m.typespec) == None:
+                return None
+    elif ty.name != "int32_t" and ty.name != "uint32_t":
+        return None
+    elif not ty.is_single() and not ty.is_array():
+        return None
+    return ty.xdr_size // 4
+
+###############################################################################
+#
+# Divide the members of a struct into runs, where each run is either a single
+# member or a sequence of members that together form a block of 32-bit words.
+# Blocks can be copied en masse and byteswapped when the buffer holds enough
+# data, only falling back to handling each word individually if it doesn't.
+#
+###############################################################################
+def struct_member_runs(struct):
+    runs = list()
+    block = list()
+    words = 0
+    for m in struct.members:
+        n = member_xdr_words(m.typespec)
+        if n != None:
+            block.append(m)
+            words += n
+            continue
+        if block:
+            runs.append((block, words))
+            block = list()
+            words = 0
+        runs.append(([m], None))
+    if block:
+        runs.append((block, words))
+    return runs
+
 ###############################################################################
 #
 # Emit structure encoders and decoders
@@ -65,23 +110,30 @@ def emit_struct_encdec(o, struct):
             o.rxsrc("\tint i;\n\n")
             break
 
-    for m in struct.members:
-        ty = m.typespec
-        o.where(struct.name + "::" + m.name)
-        if ty.is_single_int32():
-            o.rxsrc("\trxrpc_enc(call, p->", m.name, ");\n")
-        elif ty.is_single_struct():
-            o.rxsrc("\trxgen_encode_", ty.name, "(call, &p->", m.name, ");\n")
-        elif ty.is_array():
-            o.rxsrc("\tfor (i = 0; i < ", ty.dim.name, "; i++)\n")
-            if ty.is_int32_array():
-                o.rxsrc("\t\trxrpc_enc(call, p->", m.name, "[i]);\n")
-            elif ty.is_struct_array():
-                o.rxsrc("\t\trxgen_encode_", ty.name, "(call, &p->", m.name, "[i]);\n")
+    for members, words in struct_member_runs(struct):
+        ind = "\t"
+        if words != None and words > 1:
+            o.rxsrc("\tif (!rxrpc_enc_words(call, &p->", members[0].name, ", ", words, ")) {\n")
+            ind = "\t\t"
+        for m in members:
+            ty = m.typespec
+            o.where(struct.name + "::" + m.name)
+            if ty.is_single_int32():
+                o.rxsrc(ind, "rxrpc_enc(call, p->", m.name, ");\n")
+            elif ty.is_single_struct():
+                o.rxsrc(ind, "rxgen_encode_", ty.name, "(call, &p->", m.name, ");\n")
+            elif ty.is_array():
+                o.rxsrc(ind, "for (i = 0; i < ", ty.dim.name, "; i++)\n")
+                if ty.is_int32_array():
+                    o.rxsrc(ind, "\trxrpc_enc(call, p->", m.name, "[i]);\n")
+                elif ty.is_struct_array():
+                    o.rxsrc(ind, "\trxgen_encode_", ty.name, "(call, &p->", m.name, "[i]);\n")
+                else:
+                    o.error("No encoding for array type '", ty, "'")
             else:
-                o.error("No encoding for array type '", ty, "'")
-        else:
-            o.error("No encoding for type '", ty, "'")
+                o.error("No encoding for type '", ty, "'")
+        if ind != "\t":
+            o.rxsrc("\t}\n")
 
     o.rxsrc("}\n")
     o.rxsrc("\n")
@@ -100,22 +152,29 @@ def emit_struct_encdec(o, struct):
             o.rxsrc("\tint i;\n\n")
             break
 
-    for m in struct.members:
-        ty = m.typespec
-        o.where(struct.name + "::" + m.name)
-        if ty.is_single_int32():
-            o.rxsrc("\tp->", m.name, " = rxrpc_dec(call);\n")
-        elif ty.is_single_struct():
-            o.rxsrc("\trxgen_decode_", ty.name, "(call, &p->", m.name, ");\n")
-        elif ty.is_array():
-            o.rxsrc("\tfor (i = 0; i < ", ty.dim.name, "; i++)\n")
-            if ty.is_int32_array():
-                o.rxsrc("\t\tp->", m.name, "[i] = rxrpc_dec(call);\n")
-            elif ty.is_struct_array():
-                o.rxsrc("\t\trxgen_decode_", ty.name, "(call, &p->", m.name, "[i]);\n")
+    for members, words in struct_member_runs(struct):
+        ind = "\t"
+        if words != None and words > 1:
+            o.rxsrc("\tif (!rxrpc_dec_words(call, &p->", members[0].name, ", ", words, ")) {\n")
+            ind = "\t\t"
+        for m in members:
+            ty = m.typespec
+            o.where(struct.name + "::" + m.name)
+            if ty.is_single_int32():
+                o.rxsrc(ind, "p->", m.name, " = rxrpc_dec(call);\n")
+            elif ty.is_single_struct():
+                o.rxsrc(ind, "rxgen_decode_", ty.name, "(call, &p->", m.name, ");\n")
+            elif ty.is_array():
+                o.rxsrc(ind, "for (i = 0; i < ", ty.dim.name, "; i++)\n")
+                if ty.is_int32_array():
+                    o.rxsrc(ind, "\tp->", m.name, "[i] = rxrpc_dec(call);\n")
+                elif ty.is_struct_array():
+                    o.rxsrc(ind, "\trxgen_decode_", ty.name, "(call, &p->", m.name, "[i]);\n")
+                else:
+                    o.error("No decoding for array type '", ty, "'")
             else:
-                o.error("No decoding for array type '", ty, "'")
-        else:
-            o.error("No decoding for type '", ty, "'")
+                o.error("No decoding for type '", ty, "'")
+        if ind != "\t":
+            o.rxsrc("\t}\n")
 
     o.rxsrc("}\n")
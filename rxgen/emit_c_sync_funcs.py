@@ -287,9 +287,11 @@ def emit_func_decode(o, func, side, subname, params):
             o.rxsrc("\t\tif (call->blob_size == 0)\n")
             o.rxsrc("\t\t\tgoto phase_", phase_id + 1, ";\n")
             phase_goto_label = phase_id + 1
+            o.rxsrc("\t\trxrpc_expect(call, call->blob_size);\n")
             o.rxsrc("\t\tcall->blob_offset = 0;\n")
         elif phase.form == "bulk":
             p = phase.params[0]
+            ty = p.typespec
             o.rxsrc("\t\tcall->bulk_count = obj->nr__", p.name, ";\n")
             o.rxsrc("\t\tcall->bulk_index = UINT_MAX;\n")
 
@@ -302,6 +304,7 @@ def emit_func_decode(o, func, side, subname, params):
             o.rxsrc("\t\tif (call->bulk_count == 0)\n")
             o.rxsrc("\t\t\tgoto phase_", phase_id + 1, ";\n")
             phase_goto_label = phase_id + 1
+            o.rxsrc("\t\trxrpc_expect(call, (unsigned long long)call->bulk_count * ", phase.xdr_size, ");\n")
             o.rxsrc("\t\tcall->bulk_index = 0;\n")
         else:
             o.rxsrc("\t\tcall->need_size = ", phase.size, ";\n")
@@ -0,0 +1,513 @@
+# Emission of a pure-Python XDR codec module
+# -*- coding: utf-8 -*-
+
+__copyright__ = """
+Copyright (C) 2015 Red Hat, Inc. All Rights Reserved.
+Written by David Howells (dhowells@redhat.com)
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public Licence version 2 as
+published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public Licence for more details.
+
+You should have received a copy of the GNU General Public Licence
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""
+
+from rxgen_bits import *
+import keyword
+
+# Support code placed at the top of every generated codec module.  Each struct
+# and each fixed run of RPC parameters gets a precompiled struct.Struct plan
+# that packs or unpacks the whole thing in one go; these helpers deal with the
+# variable-length bits in between.
+codec_support = '''
+import struct as _struct
+
+class XDRError(ValueError):
+    """Raised if data can't be encoded to or decoded from XDR"""
+
+class _record(object):
+    __slots__ = ()
+
+    def __repr__(self):
+        return "{:s}({:s})".format(
+            type(self).__name__,
+            ", ".join("{:s}={!r}".format(n, getattr(self, n)) for n in self.__slots__))
+
+    def __eq__(self, other):
+        return (type(self) is type(other) and
+                all(getattr(self, n) == getattr(other, n) for n in self.__slots__))
+
+_u32 = _struct.Struct(">I")
+
+def _string(v):
+    return bytes(v).split(b"\\0", 1)[0].decode("utf-8")
+
+def _chars(s, n):
+    b = s.encode("utf-8")
+    if len(b) > n - 1:
+        raise XDRError("String too long for char[{:d}]".format(n))
+    return b + bytes(n - len(b))
+
+def _array(a, n):
+    if len(a) != n:
+        raise XDRError("Expected {:d} elements, got {:d}".format(n, len(a)))
+    return a
+
+def _dec_count(buf, i, max_size):
+    n, = _u32.unpack_from(buf, i)
+    if max_size is not None and n > max_size:
+        raise XDRError("Count {:d} exceeds limit {:d}".format(n, max_size))
+    return n, i + 4
+
+def _dec_opaque(buf, i, max_size):
+    n, i = _dec_count(buf, i, max_size)
+    end = i + n
+    if end > len(buf):
+        raise XDRError("Truncated blob")
+    return bytes(buf[i:end]), (end + 3) & ~3
+
+def _dec_string(buf, i, max_size):
+    b, i = _dec_opaque(buf, i, max_size)
+    return b.decode("utf-8"), i
+
+def _dec_bulk_ints(buf, i, code, max_size):
+    n, i = _dec_count(buf, i, max_size)
+    plan = _struct.Struct(">{:d}{:s}".format(n, code))
+    return list(plan.unpack_from(buf, i)), i + plan.size
+
+def _dec_bulk(buf, i, plan, from_x, max_size):
+    n, i = _dec_count(buf, i, max_size)
+    end = i + n * plan.size
+    if end > len(buf):
+        raise XDRError("Truncated array")
+    return [from_x(v, 0) for v in plan.iter_unpack(memoryview(buf)[i:end])], end
+
+def _enc_count(n, max_size):
+    if max_size is not None and n > max_size:
+        raise XDRError("Count {:d} exceeds limit {:d}".format(n, max_size))
+    return _u32.pack(n)
+
+def _enc_opaque(b, max_size):
+    b = bytes(b)
+    return _enc_count(len(b), max_size) + b + bytes(-len(b) & 3)
+
+def _enc_string(s, max_size):
+    return _enc_opaque(s.encode("utf-8"), max_size)
+
+def _enc_bulk_ints(a, code, max_size):
+    return (_enc_count(len(a), max_size) +
+            _struct.pack(">{:d}{:s}".format(len(a), code), *a))
+
+def _enc_bulk(a, plan, to_x, max_size):
+    parts = [_enc_count(len(a), max_size)]
+    for p in a:
+        out = []
+        to_x(p, out)
+        parts.append(plan.pack(*out))
+    return b"".join(parts)
+
+def _check_end(buf, i):
+    if i != len(buf):
+        raise XDRError("{:d} bytes of excess data".format(len(buf) - i))
+'''
+
+###############################################################################
+#
+# Convert a C integer literal as found in the API definitions into a Python
+# integer.
+#
+###############################################################################
+def codec_constant_value(xdr, value):
+    value = str(value)
+    if value in xdr.constants:
+        return codec_constant_value(xdr, xdr.constants[value].value)
+    value = value.rstrip("LlUu")
+    if len(value) > 1 and value.startswith("0") and value.isdigit():
+        return int(value, 8)
+    return int(value, 0)
+
+def codec_name(name):
+    if keyword.iskeyword(name):
+        return name + "_"
+    return name
+
+###############################################################################
+#
+# Work out the struct module format for an integer.  All integers smaller
+# than 64 bits occupy a 32-bit XDR word.
+#
+###############################################################################
+def codec_int_code(ty):
+    if ty.is_int64():
+        code = "q"
+    else:
+        code = "i"
+    if ty.name.startswith("u"):
+        code = code.upper()
+    return code
+
+###############################################################################
+#
+# Flatten a fixed-size type into a list of (count, code) format tokens, also
+# returning the number of values it unpacks to.
+#
+###############################################################################
+def codec_flatten(xdr, ty, plans):
+    if ty.is_array():
+        n = codec_constant_value(xdr, ty.dim.name)
+    else:
+        n = 1
+
+    if ty.is_struct():
+        tokens, nvals = plans[ty.name]
+        return tokens * n, nvals * n
+    if ty.name == "char":
+        # Each char sits in the bottom byte of a word of its own
+        return [(3, "x"), (1, "B")] * n, n
+    if ty.is_int():
+        return [(n, codec_int_code(ty))], n
+    raise RuntimeError("Unsupported fixed type \"" + str(ty) + "\"")
+
+def codec_format(tokens):
+    merged = list()
+    for count, code in tokens:
+        if merged and merged[-1][1] == code and code != "x":
+            merged[-1] = (merged[-1][0] + count, code)
+        else:
+            merged.append((count, code))
+
+    fmt = ">"
+    for count, code in merged:
+        if count == 1:
+            fmt += code
+        else:
+            fmt += str(count) + code
+    return fmt
+
+###############################################################################
+#
+# Produce the expression that builds a member's value from the unpacked value
+# tuple v, where the member's values start at index base + k.
+#
+###############################################################################
+def codec_index(base, k):
+    if not base:
+        return str(k)
+    if k == 0:
+        return base
+    return base + " + " + str(k)
+
+def codec_from_expr(xdr, ty, base, k, plans):
+    if ty.is_array():
+        n = codec_constant_value(xdr, ty.dim.name)
+    if ty.is_single_struct():
+        return "_from_" + ty.name + "(v, " + codec_index(base, k) + ")"
+    if ty.is_single_int():
+        return "v[" + codec_index(base, k) + "]"
+    if ty.is_char_array():
+        return "_string(v[" + codec_index(base, k) + ":" + codec_index(base, k + n) + "])"
+    if ty.is_int_array():
+        return "list(v[" + codec_index(base, k) + ":" + codec_index(base, k + n) + "])"
+    if ty.is_struct_array():
+        sz = plans[ty.name][1]
+        return ("[_from_" + ty.name + "(v, j) for j in range(" + codec_index(base, k) +
+                ", " + codec_index(base, k + n * sz) + ", " + str(sz) + ")]")
+    raise RuntimeError("Unsupported fixed type \"" + str(ty) + "\"")
+
+###############################################################################
+#
+# Emit the statements that append a fixed-size value's unpacked form to the
+# list "out".
+#
+###############################################################################
+def codec_emit_to(o, xdr, ty, val, indent):
+    if ty.is_single_struct():
+        o.codec(indent, "_to_", ty.name, "(", val, ", out)\n")
+    elif ty.is_single_int():
+        o.codec(indent, "out.append(", val, ")\n")
+    elif ty.is_char_array():
+        o.codec(indent, "out += _chars(", val, ", ", ty.dim.name, ")\n")
+    elif ty.is_int_array():
+        o.codec(indent, "out += _array(", val, ", ", ty.dim.name, ")\n")
+    elif ty.is_struct_array():
+        o.codec(indent, "for e in _array(", val, ", ", ty.dim.name, "):\n")
+        o.codec(indent, "    _to_", ty.name, "(e, out)\n")
+    else:
+        raise RuntimeError("Unsupported fixed type \"" + str(ty) + "\"")
+
+###############################################################################
+#
+# Emit a record class with the given members
+#
+###############################################################################
+def codec_default(ty):
+    if ty.is_single_struct():
+        return ty.name + "()"
+    if ty.is_char_array() or ty.is_single_string():
+        return "\"\""
+    if ty.is_single_opaque():
+        return "b\"\""
+    if ty.is_single_int():
+        return "0"
+    if ty.is_int_array():
+        return "[0] * " + ty.dim.name
+    if ty.is_struct_array():
+        return "[" + ty.name + "() for j in range(" + ty.dim.name + ")]"
+    if ty.is_bulk():
+        return "[]"
+    raise RuntimeError("Unsupported type \"" + str(ty) + "\"")
+
+def codec_emit_class(o, name, members, doc):
+    names = [codec_name(m.name) for m in members]
+
+    o.codec("\n")
+    o.codec("class ", name, "(_record):\n")
+    o.codec("    \"\"\"", doc, "\"\"\"\n")
+    o.codec("    __slots__ = (", "".join("\"" + n + "\", " for n in names), ")\n")
+    if not members:
+        return
+
+    o.codec("\n")
+    o.codec("    def __init__(self", "".join(", " + n + "=None" for n in names), "):\n")
+    for m, n in zip(members, names):
+        default = codec_default(m.typespec)
+        if default == "0":
+            o.codec("        self.", n, " = 0 if ", n, " is None else ", n, "\n")
+        else:
+            o.codec("        self.", n, " = ", default, " if ", n, " is None else ", n, "\n")
+
+###############################################################################
+#
+# Emit the class, plan and conversion functions for a struct
+#
+###############################################################################
+def emit_py_codec_struct(o, struct, plans):
+    xdr = o.xdr
+    tokens = list()
+    nvals = 0
+    offsets = list()
+    for m in struct.members:
+        o.where(struct.name + "::" + m.name)
+        t, n = codec_flatten(xdr, m.typespec, plans)
+        offsets.append(nvals)
+        tokens += t
+        nvals += n
+    plans[struct.name] = (tokens, nvals)
+
+    codec_emit_class(o, struct.name, struct.members, "XDR struct " + struct.name)
+
+    o.codec("\n")
+    o.codec("def _from_", struct.name, "(v, i):\n")
+    o.codec("    return ", struct.name, "(")
+    first = True
+    for m, k in zip(struct.members, offsets):
+        if not first:
+            o.codec(",\n        ")
+        first = False
+        o.codec(codec_from_expr(xdr, m.typespec, "i", k, plans))
+    o.codec(")\n")
+
+    o.codec("\n")
+    o.codec("def _to_", struct.name, "(p, out):\n")
+    for m in struct.members:
+        codec_emit_to(o, xdr, m.typespec, "p." + codec_name(m.name), "    ")
+    if not struct.members:
+        o.codec("    pass\n")
+
+    o.codec("\n")
+    o.codec("_plan_", struct.name, " = _struct.Struct(\"", codec_format(tokens), "\")\n")
+    o.codec(struct.name, ".xdr_size = _plan_", struct.name, ".size\n")
+
+    o.codec("\n")
+    o.codec("def decode_", struct.name, "(buf, offset=0):\n")
+    o.codec("    \"\"\"Decode a ", struct.name, " from buf at offset\"\"\"\n")
+    o.codec("    try:\n")
+    o.codec("        return _from_", struct.name, "(_plan_", struct.name, ".unpack_from(buf, offset), 0)\n")
+    o.codec("    except _struct.error as e:\n")
+    o.codec("        raise XDRError(str(e))\n")
+
+    o.codec("\n")
+    o.codec("def encode_", struct.name, "(p):\n")
+    o.codec("    \"\"\"Encode a ", struct.name, " as bytes\"\"\"\n")
+    o.codec("    out = []\n")
+    o.codec("    _to_", struct.name, "(p, out)\n")
+    o.codec("    try:\n")
+    o.codec("        return _plan_", struct.name, ".pack(*out)\n")
+    o.codec("    except _struct.error as e:\n")
+    o.codec("        raise XDRError(str(e))\n")
+
+###############################################################################
+#
+# Divide an RPC message into runs of fixed-size parameters, each of which gets
+# a plan, and variable-length parameters that are handled individually.
+#
+###############################################################################
+def codec_segments(o, func, params, plans):
+    segments = list()
+    run = None
+    for p in params:
+        o.where(func.name + ":" + p.name)
+        ty = p.typespec
+        if ty.is_single_blob() or ty.is_bulk():
+            run = None
+            segments.append(("var", p))
+            continue
+        if not run:
+            run = ("fixed", list(), list())
+            segments.append(run)
+        t, n = codec_flatten(o.xdr, ty, plans)
+        run[1].append(p)
+        run[2].extend(t)
+    return segments
+
+def codec_max_size(ty):
+    if ty.max_size:
+        return ty.max_size.name
+    return "None"
+
+###############################################################################
+#
+# Emit encode and decode functions for one side of an RPC
+#
+###############################################################################
+def emit_py_codec_message(o, func, what, params, plans):
+    xdr = o.xdr
+    cls = func.name + "_" + what
+    codec_emit_class(o, cls, params, func.name + " " + what + " parameters")
+
+    opcode = None
+    if what == "request":
+        opcode = codec_constant_value(xdr, func.opcode.name)
+    segments = codec_segments(o, func, params, plans)
+    if opcode is not None:
+        if segments and segments[0][0] == "fixed":
+            segments[0][2].insert(0, (1, "I"))
+        else:
+            segments.insert(0, ("fixed", list(), [(1, "I")]))
+
+    # Emit the plans for the fixed runs
+    o.codec("\n")
+    for n, seg in enumerate(segments):
+        if seg[0] == "fixed":
+            o.codec("_plan_", cls, "_", n, " = _struct.Struct(\"", codec_format(seg[2]), "\")\n")
+
+    # The decoder
+    o.codec("\n")
+    o.codec("def decode_", cls, "(buf):\n")
+    o.codec("    \"\"\"Decode the marshalled ", func.name, " ", what, " parameters in buf\"\"\"\n")
+    if not segments:
+        o.codec("    _check_end(buf, 0)\n")
+        o.codec("    return ", cls, "()\n")
+        o.codec("\n")
+        o.codec("def encode_", cls, "(p):\n")
+        o.codec("    \"\"\"Marshal the ", func.name, " ", what, " parameters in p as bytes\"\"\"\n")
+        o.codec("    return b\"\"\n")
+        return
+
+    o.codec("    p = ", cls, "()\n")
+    o.codec("    i = 0\n")
+    o.codec("    try:\n")
+    for n, seg in enumerate(segments):
+        if seg[0] == "fixed":
+            plan = "_plan_" + cls + "_" + str(n)
+            o.codec("        v = ", plan, ".unpack_from(buf, i)\n")
+            k = 0
+            if n == 0 and opcode is not None:
+                o.codec("        if v[0] != ", opcode, ":\n")
+                o.codec("            raise XDRError(\"Opcode {:d} is not ", func.name, "\".format(v[0]))\n")
+                k = 1
+            for p in seg[1]:
+                ty = p.typespec
+                o.codec("        p.", codec_name(p.name), " = ", codec_from_expr(xdr, ty, None, k, plans), "\n")
+                k += codec_flatten(xdr, ty, plans)[1]
+            o.codec("        i += ", plan, ".size\n")
+        else:
+            p = seg[1]
+            ty = p.typespec
+            target = "p." + codec_name(p.name) + ", i"
+            if ty.is_single_string():
+                o.codec("        ", target, " = _dec_string(buf, i, ", codec_max_size(ty), ")\n")
+            elif ty.is_single_opaque():
+                o.codec("        ", target, " = _dec_opaque(buf, i, ", codec_max_size(ty), ")\n")
+            elif ty.is_bulk_struct():
+                o.codec("        ", target, " = _dec_bulk(buf, i, _plan_", ty.name, ", _from_", ty.name,
+                        ", ", codec_max_size(ty), ")\n")
+            elif ty.is_bulk_int():
+                o.codec("        ", target, " = _dec_bulk_ints(buf, i, \"", codec_int_code(ty), "\", ",
+                        codec_max_size(ty), ")\n")
+            else:
+                raise RuntimeError("Unsupported variable type \"" + str(ty) + "\"")
+    o.codec("    except _struct.error as e:\n")
+    o.codec("        raise XDRError(str(e))\n")
+    o.codec("    _check_end(buf, i)\n")
+    o.codec("    return p\n")
+
+    # The encoder
+    o.codec("\n")
+    o.codec("def encode_", cls, "(p):\n")
+    o.codec("    \"\"\"Marshal the ", func.name, " ", what, " parameters in p as bytes\"\"\"\n")
+    o.codec("    parts = []\n")
+    o.codec("    try:\n")
+    for n, seg in enumerate(segments):
+        if seg[0] == "fixed":
+            o.codec("        out = []\n")
+            if n == 0 and opcode is not None:
+                o.codec("        out.append(", opcode, ")\n")
+            for p in seg[1]:
+                codec_emit_to(o, xdr, p.typespec, "p." + codec_name(p.name), "        ")
+            o.codec("        parts.append(_plan_", cls, "_", n, ".pack(*out))\n")
+        else:
+            p = seg[1]
+            ty = p.typespec
+            val = "p." + codec_name(p.name)
+            if ty.is_single_string():
+                o.codec("        parts.append(_enc_string(", val, ", ", codec_max_size(ty), "))\n")
+            elif ty.is_single_opaque():
+                o.codec("        parts.append(_enc_opaque(", val, ", ", codec_max_size(ty), "))\n")
+            elif ty.is_bulk_struct():
+                o.codec("        parts.append(_enc_bulk(", val, ", _plan_", ty.name, ", _to_", ty.name,
+                        ", ", codec_max_size(ty), "))\n")
+            elif ty.is_bulk_int():
+                o.codec("        parts.append(_enc_bulk_ints(", val, ", \"", codec_int_code(ty), "\", ",
+                        codec_max_size(ty), "))\n")
+            else:
+                raise RuntimeError("Unsupported variable type \"" + str(ty) + "\"")
+    o.codec("    except _struct.error as e:\n")
+    o.codec("        raise XDRError(str(e))\n")
+    o.codec("    return b\"\".join(parts)\n")
+
+###############################################################################
+#
+# Emit a pure-Python module that can encode and decode all the types and RPC
+# parameter blocks in the API definition without the C extension.
+#
+# The bulk data transferred by split calls isn't part of the parameter blocks
+# and isn't handled here.
+#
+###############################################################################
+def emit_py_codec(o):
+    xdr = o.xdr
+
+    o.codec("# AUTOGENERATED\n")
+    o.codec("\"\"\"Pure-Python XDR codec for the AFS RPC API\"\"\"\n")
+    o.codec(codec_support)
+
+    o.codec("\n")
+    for name in xdr.all_constants:
+        c = xdr.constants[name]
+        o.codec(c.name, " = ", codec_constant_value(xdr, c.value), "\n")
+
+    plans = dict()
+    for s in xdr.all_structs:
+        emit_py_codec_struct(o, s, plans)
+
+    for f in xdr.funcs:
+        emit_py_codec_message(o, f, "request", f.request, plans)
+        emit_py_codec_message(o, f, "response", f.response, plans)
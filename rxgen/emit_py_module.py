@@ -74,9 +74,13 @@ def emit_py_module(o):
 
     o.pysrc("\t{\"rx_new_connection\", (PyCFunction)kafs_py_rx_new_connection, METH_VARARGS, \"\" },\n")
     o.pysrc("\t{\"afs_string_to_key\", (PyCFunction)kafs_py_string_to_key, METH_VARARGS, \"\" },\n")
+    o.pysrc("\t{\"multi\", (PyCFunction)kafs_py_multi, METH_VARARGS | METH_KEYWORDS,\n")
+    o.pysrc("\t \"Make an RPC many times concurrently\" },\n")
+    o.pysrc("\t{\"first\", (PyCFunction)kafs_py_first, METH_VARARGS | METH_KEYWORDS,\n")
+    o.pysrc("\t \"Make an RPC many times concurrently and take the first response\" },\n")
 
     for pyf in o.xdr.py_func_defs:
-        o.pysrc("\t{\"", pyf.name, "\", (PyCFunction)", pyf.c_func, ", METH_VARARGS,")
+        o.pysrc("\t{\"", pyf.name, "\", (PyCFunction)", pyf.c_func, ", ", pyf.flags, ",")
         o.pysrc(" \"", pyf.doc, "\" },\n")
 
     o.pysrc("\t{}\n")
@@ -105,6 +109,8 @@ def emit_py_module(o):
     if o.xdr.py_type_defs:
         o.pysrc("\tif (")
         o.pysrc("PyType_Ready(&py_rx_connectionType) < 0 ||\n\t    ")
+        o.pysrc("PyType_Ready(&py_rx_callType) < 0 ||\n\t    ")
+        o.pysrc("PyType_Ready(&py_rx_struct_arrayType) < 0 ||\n\t    ")
         o.pysrc("PyType_Ready(&py_rx_split_infoType) < 0")
         for pyt in o.xdr.py_type_defs:
             o.pysrc(" ||\n\t    ")
@@ -112,6 +118,12 @@ def emit_py_module(o):
         o.pysrc(")\n")
         o.pysrc("\t\treturn NULL;\n")
 
+    # Describe the structs to NumPy
+    if o.xdr.all_structs:
+        o.pysrc("\n")
+        for s in o.xdr.all_structs:
+            o.pysrc("\tif (py_rxgen_set_dtype(&py_", s.name, "Type, py_", s.name, "_dtype()) < 0)\n")
+            o.pysrc("\t\treturn NULL;\n")
 
     o.pysrc("\n")
     o.pysrc("\tm = PyModule_Create(&kafs_module);\n")
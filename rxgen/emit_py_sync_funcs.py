@@ -35,6 +35,16 @@ class decode_phase:
 bulk_get_helpers = dict();
 bulk_set_helpers = dict();
 
+# Bulk integer types that can be decoded into (or encoded from) an array.array
+# and the type codes of the arrays.
+bulk_array_typecodes = {
+    "int32_t"   : "i",
+    "uint32_t"  : "I",
+}
+
+def is_bulk_array_int(ty):
+    return ty.is_bulk_int32() and ty.name in bulk_array_typecodes
+
 c_to_py_type_map = dict([("char",     "T_CHAR"),
                          ("int8_t",   "T_BYTE"),
                          ("int16_t",  "T_SHORT"),
@@ -96,6 +106,7 @@ def emit_py_func_param_object(o, func, way):
             o.pyhdr("\tPy_buffer dec_buf;\n")
 
     o.pyhdr("};\n")
+    o.pyhdr("extern PyTypeObject ", struct_req, "Type;\n")
 
     # We need to have a new function if the object is to be allocatable by the
     # Python interpreter
@@ -144,7 +155,7 @@ def emit_py_func_param_object(o, func, way):
 
     # Emit the Python type definition
     o.pysrc("\n")
-    o.pysrc("static PyTypeObject ", struct_req, "Type = {\n")
+    o.pysrc("PyTypeObject ", struct_req, "Type = {\n")
     o.pysrc("\tPyVarObject_HEAD_INIT(NULL, 0)\n")
     o.pysrc("\t\"kafs.", func.name, "_", way, "\",\t\t/*tp_name*/\n")
     o.pysrc("\tsizeof(struct ", struct_req, "),\t/*tp_basicsize*/\n")
@@ -202,9 +213,9 @@ def emit_py_func_bulk_helper(o, func):
         if not ty.is_bulk():
             continue
 
-        # Data encoding
-        if ty.name not in bulk_get_helpers:
-            bulk_get_helpers[ty.name] = True
+        # Data encoding.  The helpers are static, so each unit needs its own.
+        if (o.unit.name, ty.name) not in bulk_get_helpers:
+            bulk_get_helpers[(o.unit.name, ty.name)] = True
 
             o.pysrc("\n")
             o.pysrc("static __attribute__((unused))\n")
@@ -213,6 +224,10 @@ def emit_py_func_bulk_helper(o, func):
             o.pysrc("\tPyObject *item;\n")
             o.pysrc("\tunsigned count, i;\n")
             o.pysrc("\n")
+            if is_bulk_array_int(ty):
+                o.pysrc("\tif (!PyList_Check(list))\n")
+                o.pysrc("\t\treturn py_enc_int32_array(call, list);\n")
+                o.pysrc("\n")
             o.pysrc("\tcount = PyList_Size(list);\n")
             o.pysrc("\trxrpc_enc(call, count);\n")
             o.pysrc("\n")
@@ -260,11 +275,70 @@ def emit_py_func_bulk_helper(o, func):
 ###############################################################################
 def emit_py_func_simple_sync_call(o, func):
 
-    o.xdr.py_func_defs.append(py_func_def(func.name, "kafs_" + func.name))
+    # All the wrappers take timeout and bulk_array keyword arguments
+    flags = "METH_VARARGS | METH_KEYWORDS"
+    o.xdr.py_func_defs.append(py_func_def(func.name, "kafs_" + func.name,
+                                          flags=flags))
+    o.xdr.py_func_defs.append(py_func_def(func.name + "_begin",
+                                          "kafs_" + func.name + "_begin",
+                                          flags=flags))
+
+    # The call handle is awaitable, so the asyncio flavour can share the
+    # asynchronous wrapper.
+    o.xdr.py_func_defs.append(py_func_def(func.name + "_async",
+                                          "kafs_" + func.name + "_begin",
+                                          "Awaitable " + func.name,
+                                          flags=flags))
 
+    o.pyhdr("extern PyObject *kafs_", func.name, "(PyObject *, PyObject *, PyObject *);\n")
+    o.pyhdr("extern PyObject *kafs_", func.name, "_begin(PyObject *, PyObject *, PyObject *);\n")
+
+    emit_py_func_begin_call(o, func)
+
+    # The synchronous wrapper waits for the reply before returning
     o.pysrc("\n")
     o.pysrc("PyObject *\n")
-    o.pysrc("kafs_", func.name, "(PyObject *_self, PyObject *args)\n")
+    o.pysrc("kafs_", func.name, "(PyObject *_self, PyObject *args, PyObject *kwds)\n")
+    o.pysrc("{\n")
+    o.pysrc("\tstruct py_rx_connection *z_conn;\n")
+    o.pysrc("\tstruct rx_call *call;\n")
+    o.pysrc("\tPyObject *res;\n")
+    o.pysrc("\n")
+    o.pysrc("\tcall = py_begin_", func.name, "(args, kwds, &z_conn, &res);\n")
+    o.pysrc("\tif (!call)\n")
+    o.pysrc("\t\treturn NULL;\n")
+    o.pysrc("\treturn py_rxgen_run_sync_call(call, res);\n")
+    o.pysrc("}\n")
+
+    # The asynchronous wrapper hands back a call handle so that the reply can
+    # be collected later, allowing many calls to be in flight on a connection.
+    o.pysrc("\n")
+    o.pysrc("PyObject *\n")
+    o.pysrc("kafs_", func.name, "_begin(PyObject *_self, PyObject *args, PyObject *kwds)\n")
+    o.pysrc("{\n")
+    o.pysrc("\tstruct py_rx_connection *z_conn;\n")
+    o.pysrc("\tstruct rx_call *call;\n")
+    o.pysrc("\tPyObject *res;\n")
+    o.pysrc("\n")
+    o.pysrc("\tcall = py_begin_", func.name, "(args, kwds, &z_conn, &res);\n")
+    o.pysrc("\tif (!call)\n")
+    o.pysrc("\t\treturn NULL;\n")
+    o.pysrc("\treturn py_rxgen_new_call(z_conn, call, res);\n")
+    o.pysrc("}\n")
+
+###############################################################################
+#
+# Emit a function to marshal the parameters of a call from python and transmit
+# them, returning the call and the response object it will decode into.
+#
+###############################################################################
+def emit_py_func_begin_call(o, func):
+
+    o.pysrc("\n")
+    o.pysrc("static struct rx_call *\n")
+    o.pysrc("py_begin_", func.name, "(PyObject *args, PyObject *kwds,\n")
+    o.pysrc(" " * len("py_begin_" + func.name + "("),
+            "struct py_rx_connection **_z_conn, PyObject **_res)\n")
     o.pysrc("{\n")
 
     # Local variable declarations representing parameters to send
@@ -289,7 +363,14 @@ def emit_py_func_simple_sync_call(o, func):
     if func.split:
         o.pysrc("\tPyObject *split_callback, *split_info;\n")
     o.pysrc("\tPyObject *res = NULL;\n")
-    o.pysrc("\tint ret;\n")
+    o.pysrc("\tint timeout;\n")
+    o.pysrc("\tunsigned flags;\n")
+    if not func.split:
+        o.pysrc("\tint ret;\n")
+
+    o.pysrc("\n")
+    o.pysrc("\tif (py_rxgen_parse_call_kwds(kwds, &timeout, &flags) < 0)\n")
+    o.pysrc("\t\treturn NULL;\n")
 
     # Make use of the tuple parser to extract the arguments and check their
     # types for us.
@@ -299,7 +380,8 @@ def emit_py_func_simple_sync_call(o, func):
     for p in func.request:
         o.where(func.name + ":" + p.name)
         ty = p.typespec
-        if ty.is_bulk():               o.pysrc("O!")
+        if is_bulk_array_int(ty):      o.pysrc("O")
+        elif ty.is_bulk():             o.pysrc("O!")
         elif ty.is_array():            raise RuntimeError
         elif ty.name == "int8_t":      o.pysrc("B")
         elif ty.name == "int16_t":     o.pysrc("h")
@@ -331,6 +413,8 @@ def emit_py_func_simple_sync_call(o, func):
             o.pysrc("&py_", ty.name, "Type, &param_", p.name)
         elif ty.is_single_blob():
             o.pysrc("&param_", p.name)
+        elif is_bulk_array_int(ty):
+            o.pysrc("&param_", p.name)
         elif ty.is_bulk():
             o.pysrc("&PyList_Type, &param_", p.name)
         else:
@@ -352,9 +436,13 @@ def emit_py_func_simple_sync_call(o, func):
     o.pysrc("\tif (!call) {\n")
     if func.split:
         o.pysrc("\t\tPy_XDECREF(split_info);\n");
-    o.pysrc("\t\treturn PyErr_NoMemory();\n")
+    o.pysrc("\t\tPyErr_NoMemory();\n")
+    o.pysrc("\t\treturn NULL;\n")
     o.pysrc("\t}\n")
     o.pysrc("\tcall->decoder_cleanup = py_rxgen_decoder_cleanup;\n")
+    o.pysrc("\tcall->decoder_flags = flags;\n")
+    o.pysrc("\tif (timeout >= 0)\n")
+    o.pysrc("\t\trxrpc_set_call_timeout(call, timeout);\n")
     if func.split:
         o.pysrc("\tpy_rxgen_split_client_set(call, split_callback, split_info);\n")
 
@@ -406,7 +494,7 @@ def emit_py_func_simple_sync_call(o, func):
     # Transmit the split data
     if func.split:
         o.pysrc("\tif (py_rxgen_split_transmit(call) < 0)\n")
-        o.pysrc("\t\tgoto error_no_res;\n")
+        o.pysrc("\t\tgoto error;\n")
     else:
         o.pysrc("\tcall->more_send = 0;\n")
 
@@ -416,35 +504,21 @@ def emit_py_func_simple_sync_call(o, func):
         o.pysrc("\tif (ret == -1)\n")
         o.pysrc("\t\tgoto error;\n")
 
-    # Wait for the reply
-    #
-    # If we're dealing with a split function or are in asynchronous mode, we
-    # need to return the call here.
-    #
+    # Hand the call back to the caller to wait for the reply
     o.pysrc("\n")
-    o.pysrc("\tret = rxrpc_run_sync_call(call);\n")
-    o.pysrc("\tif (ret == -1)\n")
-    o.pysrc("\t\tgoto error;\n")
-
-    # Successful return
-    o.pysrc("\n")
-    o.pysrc("\trxrpc_terminate_call(call, 0);\n")
-    o.pysrc("\treturn res;\n")
+    o.pysrc("\t*_z_conn = z_conn;\n")
+    o.pysrc("\t*_res = res;\n")
+    o.pysrc("\treturn call;\n")
 
     # Error cleanups
     o.pysrc("\n")
+    o.pysrc("enomem:\n")
+    o.pysrc("\terrno = ENOMEM;\n")
     o.pysrc("error:\n")
     o.pysrc("\tPy_XDECREF(res);\n")
     o.pysrc("error_no_res:\n")
-    o.pysrc("\tif (errno == ENOMEM)\n")
-    o.pysrc("enomem:\n")
-    o.pysrc("\t\tres = PyErr_NoMemory();\n")
-    o.pysrc("\telse if (errno == ECONNABORTED)\n")
-    o.pysrc("\t\tres = py_rxgen_received_abort(call);\n")
-    o.pysrc("\telse\n")
-    o.pysrc("\t\tres = PyErr_SetFromErrno(PyExc_IOError);\n")
-    o.pysrc("\trxrpc_terminate_call(call, ENOMEM);\n")
-    o.pysrc("\treturn res;\n")
+    o.pysrc("\tpy_rxgen_call_failed(call);\n")
+    o.pysrc("\treturn NULL;\n")
 
     # End the function
     o.pysrc("}\n")
@@ -593,6 +667,7 @@ def emit_py_func_decode(o, func, side, subname, params):
         if phase.form == "blob":
             p = phase.params[0]
             ty = p.typespec
+            o.pysrc("\t\trxrpc_expect(call, call->blob_size);\n")
             if ty.is_single_string():
                 o.pysrc("\t\tswitch (py_dec_init_string(call, &obj->x.", p.name, ")) {\n")
             elif ty.is_single_opaque():
@@ -615,7 +690,26 @@ def emit_py_func_decode(o, func, side, subname, params):
         elif phase.form == "bulk":
             p = phase.params[0]
             ty = p.typespec
-            if ty.is_bulk_int() or ty.is_bulk_struct():
+            if is_bulk_array_int(ty):
+                o.pysrc("\t\tif (call->decoder_flags & PY_RXGEN_BULK_ARRAY)\n")
+                o.pysrc("\t\t\tobj->x.", p.name, " = py_rxgen_new_int_array(\"",
+                        bulk_array_typecodes[ty.name], "\", call->bulk_count);\n")
+                o.pysrc("\t\telse\n")
+                o.pysrc("\t\t\tobj->x.", p.name, " = PyList_New(call->bulk_count);\n")
+                o.pysrc("\t\tif (!obj->x.", p.name, ")\n")
+                o.pysrc("\t\t\treturn -1;\n")
+            elif ty.is_bulk_struct():
+                o.pysrc("\t\tif (call->decoder_flags & PY_RXGEN_BULK_ARRAY)\n")
+                o.pysrc("\t\t\tobj->x.", p.name, " = py_rxgen_new_struct_array(call->bulk_count,\n")
+                o.pysrc("\t\t\t\t\t\t\t\t  sizeof(struct ", ty.name, "),\n")
+                o.pysrc("\t\t\t\t\t\t\t\t  call->decoder_flags & PY_RXGEN_RECORDS ?\n")
+                o.pysrc("\t\t\t\t\t\t\t\t  py_data_to_", ty.name, "_record :\n")
+                o.pysrc("\t\t\t\t\t\t\t\t  py_data_to_", ty.name, ");\n")
+                o.pysrc("\t\telse\n")
+                o.pysrc("\t\t\tobj->x.", p.name, " = PyList_New(call->bulk_count);\n")
+                o.pysrc("\t\tif (!obj->x.", p.name, ")\n")
+                o.pysrc("\t\t\treturn -1;\n")
+            elif ty.is_bulk_int():
                 o.pysrc("\t\tobj->x.", p.name, " = PyList_New(call->bulk_count);\n")
                 o.pysrc("\t\tif (!obj->x.", p.name, ")\n")
                 o.pysrc("\t\t\treturn -1;\n")
@@ -625,6 +719,7 @@ def emit_py_func_decode(o, func, side, subname, params):
             o.pysrc("\t\tif (call->bulk_count == 0)\n")
             o.pysrc("\t\t\tgoto phase_", phase_id + 1, ";\n")
             phase_goto_label = phase_id + 1
+            o.pysrc("\t\trxrpc_expect(call, (unsigned long long)call->bulk_count * ", phase.xdr_size, ");\n")
             o.pysrc("\t\tcall->bulk_index = 0;\n")
 
         # Entry point for a phase
@@ -643,7 +738,9 @@ def emit_py_func_decode(o, func, side, subname, params):
             o.pysrc("\t\tif (count < call->need_size)\n")
             o.pysrc("\t\t\treturn 1;\n")
         else:
-            o.pysrc("\t\tif (call->need_size == UINT_MAX ? count == 0 : count < call->need_size) {\n")
+            o.pysrc("\t\tif (call->need_size == UINT_MAX ?\n")
+            o.pysrc("\t\t    count == 0 && call->more_recv :\n")
+            o.pysrc("\t\t    count < call->need_size) {\n")
             #o.pysrc("\t\t\tprintf(\"NEED %u (phase %u)\\n\", call->need_size, phase);\n")
             o.pysrc("\t\t\treturn 1;\n")
             o.pysrc("\t\t}\n")
@@ -664,9 +761,31 @@ def emit_py_func_decode(o, func, side, subname, params):
             else:
                 raise RuntimeError
 
+            if is_bulk_array_int(ty):
+                o.pysrc("\t\tif (call->decoder_flags & PY_RXGEN_BULK_ARRAY) {\n")
+                o.pysrc("\t\t\tswitch (py_dec_into_int32_array(call, obj->x.", p.name, ")) {\n")
+                o.pysrc("\t\t\tcase -1: return -1;\n")
+                o.pysrc("\t\t\tcase  0: goto phase_", phase_id + 1, ";\n")
+                o.pysrc("\t\t\tcase  1: phase = ", phase_id, "; goto select_phase;\n")
+                o.pysrc("\t\t\t}\n")
+                o.pysrc("\t\t}\n")
+                o.pysrc("\n")
+
+            if ty.is_bulk_struct():
+                o.pysrc("\t\tif (call->decoder_flags & PY_RXGEN_BULK_ARRAY) {\n")
+                o.pysrc("\t\t\trxgen_decode_", ty.name, "(call, py_rxgen_struct_array_elem(obj->x.", p.name, ",\n")
+                o.pysrc("\t\t\t\t\t\t\t\t\t\t  call->bulk_index));\n")
+                o.pysrc("\t\t\tcall->bulk_index++;\n")
+                o.pysrc("\t\t\tgoto bulk_next_", p.name, ";\n")
+                o.pysrc("\t\t}\n")
+                o.pysrc("\n")
+
             if ty.is_bulk():
                 if ty.is_bulk_struct():
-                    o.pysrc("\t\titem = py_decode_", ty.name, "(call);\n")
+                    o.pysrc("\t\tif (call->decoder_flags & PY_RXGEN_RECORDS)\n")
+                    o.pysrc("\t\t\titem = py_decode_", ty.name, "_record(call);\n")
+                    o.pysrc("\t\telse\n")
+                    o.pysrc("\t\t\titem = py_decode_", ty.name, "(call);\n")
                 elif ty.is_bulk_int32() and ty.name.startswith("u"):
                     o.pysrc("\t\titem = PyLong_FromUnsignedLong((", ty.name, ")rxrpc_dec(call));\n")
                 elif ty.is_bulk_int32():
@@ -703,7 +822,10 @@ def emit_py_func_decode(o, func, side, subname, params):
                 o.pysrc("\t\tobj->x.", p.name, " = (", ty.name, ")rxrpc_dec(call) << 32;\n")
                 o.pysrc("\t\tobj->x.", p.name, " |= (", ty.name, ")rxrpc_dec(call) << 32;\n")
             elif ty.is_single_struct():
-                o.pysrc("\t\tobj->x.", p.name, " = py_decode_", ty.name, "(call);\n")
+                o.pysrc("\t\tif (call->decoder_flags & PY_RXGEN_RECORDS)\n")
+                o.pysrc("\t\t\tobj->x.", p.name, " = py_decode_", ty.name, "_record(call);\n")
+                o.pysrc("\t\telse\n")
+                o.pysrc("\t\t\tobj->x.", p.name, " = py_decode_", ty.name, "(call);\n")
             else:
                 raise RuntimeError("Unsupported type in decode")
 
@@ -714,6 +836,8 @@ def emit_py_func_decode(o, func, side, subname, params):
                 o.pysrc("\t\t\tphase = ", phase_id, ";\n")
                 o.pysrc("\t\t\tgoto select_phase;\n")
                 o.pysrc("\t\t}\n")
+            if ty.is_bulk_struct():
+                o.pysrc("\tbulk_next_", p.name, ":\n")
             if ty.is_bulk():
                 o.pysrc("\t\tif (rxrpc_post_dec(call) < 0)\n")
                 o.pysrc("\t\t\treturn -1;\n")
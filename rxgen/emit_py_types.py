@@ -27,7 +27,30 @@ from rxgen_bits import *
 #
 ###############################################################################
 def emit_py_type_wrapper_decls(o, s):
-    o.pysrc("static PyTypeObject py_", s.name, "Type;\n")
+    o.pyhdr("extern PyTypeObject py_", s.name, "Type;\n")
+    o.pyhdr("extern PyTypeObject py_", s.name, "_recordType;\n")
+    o.pyhdr("extern PyObject *py_", s.name, "_dtype(void);\n")
+
+###############################################################################
+#
+# Get the PyMemberDef type code for a single integer struct member
+#
+###############################################################################
+def py_member_type(ty):
+    member_types = {
+        "char"          : "T_CHAR",
+        "int8_t"        : "T_BYTE",
+        "int16_t"       : "T_SHORT",
+        "int32_t"       : "T_INT",
+        "int64_t"       : "T_LONGLONG",
+        "uint8_t"       : "T_UBYTE",
+        "uint16_t"      : "T_USHORT",
+        "uint32_t"      : "T_UINT",
+        "uint64_t"      : "T_ULONGLONG",
+    }
+    if ty.name not in member_types:
+        raise RuntimeError("Unsupported type \"" + ty.name + "\"")
+    return member_types[ty.name]
 
 
 ###############################################################################
@@ -91,6 +114,8 @@ def emit_py_type_wrapper(o, struct):
     o.pysrc("py_", struct.name, "_dealloc(struct py_", struct.name, " *self)\n")
     o.pysrc("{\n")
     for m in single_structs + arrays:
+        if m.typespec.is_struct_array():
+            o.pysrc("\tpy_rxgen_detach_structs(self->c.", m.name, ");\n")
         o.pysrc("\tPy_XDECREF(self->c.", m.name, ");\n")
     o.pysrc("\tPy_TYPE(self)->tp_free((PyObject *)self);\n")
     o.pysrc("}\n")
@@ -103,27 +128,7 @@ def emit_py_type_wrapper(o, struct):
         for m in single_ints:
             ty = m.typespec
             o.where(struct.name + "::" + m.name)
-            o.pysrc("\t{ \"", m.name, "\", ")
-            if ty.name == "char":
-                o.pysrc("T_CHAR")
-            elif ty.name == "int8_t":
-                o.pysrc("T_BYTE")
-            elif ty.name == "int16_t":
-                o.pysrc("T_SHORT")
-            elif ty.name == "int32_t":
-                o.pysrc("T_INT")
-            elif ty.name == "int64_t":
-                o.pysrc("T_LONGLONG")
-            elif ty.name == "uint8_t":
-                o.pysrc("T_UBYTE")
-            elif ty.name == "uint16_t":
-                o.pysrc("T_USHORT")
-            elif ty.name == "uint32_t":
-                o.pysrc("T_UINT")
-            elif ty.name == "uint64_t":
-                o.pysrc("T_ULONGLONG")
-            else:
-                o.error(": Unsupported type \"", ty.name, "\"")
+            o.pysrc("\t{ \"", m.name, "\", ", py_member_type(ty))
             o.pysrc(", offsetof(struct py_", struct.name, ", x.", m.name, "), 0, \"\"},\n")
         o.pysrc("\t{}\n")
         o.pysrc("};\n")
@@ -222,7 +227,7 @@ def emit_py_type_wrapper(o, struct):
         o.pysrc("\n")
 
     # Emit the Python type definition
-    o.pysrc("static PyTypeObject py_", struct.name, "Type = {\n")
+    o.pysrc("PyTypeObject py_", struct.name, "Type = {\n")
     o.pysrc("\tPyVarObject_HEAD_INIT(NULL, 0)\n")
     o.pysrc("\t\"kafs.", struct.name, "\",\t\t/*tp_name*/\n")
     o.pysrc("\tsizeof(struct py_", struct.name, "),\t/*tp_basicsize*/\n")
@@ -304,6 +309,8 @@ def emit_py_type_wrapper(o, struct):
     o.pysrc("}\n")
 
     # Emit a function to unmarshal on object of this type.
+    o.pyhdr("extern PyObject *py_decode_", struct.name, "(struct rx_call *);\n")
+
     o.pysrc("\n")
     o.pysrc("PyObject *py_decode_", struct.name, "(struct rx_call *call)\n")
     o.pysrc("{\n")
@@ -385,3 +392,217 @@ def emit_py_type_wrapper(o, struct):
     o.pysrc("\treturn 0;\n")
     o.pysrc("}\n")
 
+
+###############################################################################
+#
+# Emit an immutable Python record type for a C struct.
+#
+# A record holds nothing but a copy of the raw struct.  Integer members are
+# read directly through PyMemberDefs and everything else is converted on each
+# access through a table of field descriptors, so there are no per-member
+# caches to allocate and the record can't be altered.
+#
+###############################################################################
+record_kinds = {
+    "int8_t"    : "py_rx_record_int8",
+    "int16_t"   : "py_rx_record_int16",
+    "int32_t"   : "py_rx_record_int32",
+    "uint8_t"   : "py_rx_record_uint8",
+    "uint16_t"  : "py_rx_record_uint16",
+    "uint32_t"  : "py_rx_record_uint32",
+}
+
+def emit_py_record_type(o, struct):
+    rec = "py_" + struct.name + "_record"
+    o.xdr.py_type_defs.append(py_type_def(struct.name + "_record", rec + "Type"))
+
+    single_ints = list();
+    fields = list();
+    for m in struct.members:
+        ty = m.typespec
+        o.where(struct.name + "::" + m.name)
+        if ty.is_single_basic():
+            single_ints.append(m)
+        elif ty.is_char_array() or ty.is_single_struct() or ty.is_array():
+            fields.append(m)
+        else:
+            o.error(": Unsupported struct member type")
+
+    o.pyhdr("\n")
+    o.pyhdr("struct ", rec, " {\n")
+    o.pyhdr("\tPyObject_HEAD\n")
+    o.pyhdr("\tstruct ", struct.name, " x;\n")
+    o.pyhdr("};\n")
+
+    if single_ints:
+        o.pysrc("\n")
+        o.pysrc("static PyMemberDef ", rec, "_members[] = {\n")
+        for m in single_ints:
+            o.where(struct.name + "::" + m.name)
+            o.pysrc("\t{ \"", m.name, "\", ", py_member_type(m.typespec))
+            o.pysrc(", offsetof(struct ", rec, ", x.", m.name, "), READONLY, \"\"},\n")
+        o.pysrc("\t{}\n")
+        o.pysrc("};\n")
+
+    if fields:
+        o.pysrc("\n")
+        o.pysrc("static struct py_rx_record_field ", rec, "_fields[] = {\n")
+        for m in fields:
+            ty = m.typespec
+            o.where(struct.name + "::" + m.name)
+            o.pysrc("\t{ offsetof(struct ", rec, ", x.", m.name, "), ")
+            if ty.is_single_struct():
+                o.pysrc("1, sizeof(struct ", ty.name, "),\n")
+                o.pysrc("\t  py_rx_record_struct, py_data_to_", ty.name, "_record },\n")
+            elif ty.is_char_array():
+                o.pysrc(ty.dim.name, ", 1,\n")
+                o.pysrc("\t  py_rx_record_string, NULL },\n")
+            elif ty.is_struct_array():
+                o.pysrc(ty.dim.name, ", sizeof(struct ", ty.name, "),\n")
+                o.pysrc("\t  py_rx_record_structs, py_data_to_", ty.name, "_record },\n")
+            elif ty.is_int_array() and ty.name in record_kinds:
+                o.pysrc(ty.dim.name, ", sizeof(", ty.name, "),\n")
+                o.pysrc("\t  ", record_kinds[ty.name], ", NULL },\n")
+            else:
+                raise RuntimeError("Unsupported array type \"" + str(ty) + "\"")
+        o.pysrc("};\n")
+
+        o.pysrc("\n")
+        o.pysrc("static PyGetSetDef ", rec, "_getset[] = {\n")
+        for i, m in enumerate(fields):
+            o.pysrc("\t{ \"", m.name, "\", py_rxgen_record_get, NULL, \"\", &", rec, "_fields[", i, "] },\n")
+        o.pysrc("\t{}\n")
+        o.pysrc("};\n")
+
+    # Emit the Python type definition.  There's no tp_new as records only come
+    # into being by decoding.
+    o.pysrc("\n")
+    o.pysrc("PyTypeObject ", rec, "Type = {\n")
+    o.pysrc("\tPyVarObject_HEAD_INIT(NULL, 0)\n")
+    o.pysrc("\t\"kafs.", struct.name, "_record\",\t/*tp_name*/\n")
+    o.pysrc("\tsizeof(struct ", rec, "),\t/*tp_basicsize*/\n")
+    o.pysrc("\t0,\t\t\t\t/*tp_itemsize*/\n")
+    o.pysrc("\tpy_rxgen_record_dealloc,\t/*tp_dealloc*/\n")
+    o.pysrc("\t0,\t\t\t\t/*tp_print*/\n")
+    o.pysrc("\t0,\t\t\t\t/*tp_getattr*/\n")
+    o.pysrc("\t0,\t\t\t\t/*tp_setattr*/\n")
+    o.pysrc("\t0,\t\t\t\t/*tp_compare*/\n")
+    o.pysrc("\t0,\t\t\t\t/*tp_repr*/\n")
+    o.pysrc("\t0,\t\t\t\t/*tp_as_number*/\n")
+    o.pysrc("\t0,\t\t\t\t/*tp_as_sequence*/\n")
+    o.pysrc("\t0,\t\t\t\t/*tp_as_mapping*/\n")
+    o.pysrc("\t0,\t\t\t\t/*tp_hash */\n")
+    o.pysrc("\t0,\t\t\t\t/*tp_call*/\n")
+    o.pysrc("\t0,\t\t\t\t/*tp_str*/\n")
+    o.pysrc("\t0,\t\t\t\t/*tp_getattro*/\n")
+    o.pysrc("\t0,\t\t\t\t/*tp_setattro*/\n")
+    o.pysrc("\t0,\t\t\t\t/*tp_as_buffer*/\n")
+    o.pysrc("\tPy_TPFLAGS_DEFAULT,\t\t/*tp_flags*/\n")
+    o.pysrc("\t\"\",\t\t\t/* tp_doc */\n")
+    o.pysrc("\t0,\t\t\t\t/* tp_traverse */\n")
+    o.pysrc("\t0,\t\t\t\t/* tp_clear */\n")
+    o.pysrc("\t0,\t\t\t\t/* tp_richcompare */\n")
+    o.pysrc("\t0,\t\t\t\t/* tp_weaklistoffset */\n")
+    o.pysrc("\t0,\t\t\t\t/* tp_iter */\n")
+    o.pysrc("\t0,\t\t\t\t/* tp_iternext */\n")
+    o.pysrc("\t0,\t\t\t\t/* tp_methods */\n")
+    if single_ints:
+        o.pysrc("\t", rec, "_members,\n")
+    else:
+        o.pysrc("\t0,\t\t\t/* tp_members */\n")
+    if fields:
+        o.pysrc("\t", rec, "_getset,\n")
+    else:
+        o.pysrc("\t0,\t\t\t\t/* tp_getset */\n")
+    o.pysrc("};\n")
+
+    # Emit functions to create a record from raw data and by unmarshalling
+    o.pyhdr("extern PyObject *py_data_to_", struct.name, "_record(const void *);\n")
+    o.pyhdr("extern PyObject *py_decode_", struct.name, "_record(struct rx_call *);\n")
+
+    o.pysrc("\n")
+    o.pysrc("PyObject *py_data_to_", struct.name, "_record(const void *data)\n")
+    o.pysrc("{\n")
+    o.pysrc("\tstruct ", rec, " *self = PyObject_New(struct ", rec, ", &", rec, "Type);\n")
+    o.pysrc("\tif (!self)\n")
+    o.pysrc("\t\treturn NULL;\n")
+    o.pysrc("\tmemcpy(&self->x, data, sizeof(self->x));\n")
+    o.pysrc("\treturn (PyObject *)self;\n")
+    o.pysrc("}\n")
+
+    o.pysrc("\n")
+    o.pysrc("PyObject *py_decode_", struct.name, "_record(struct rx_call *call)\n")
+    o.pysrc("{\n")
+    o.pysrc("\tstruct ", rec, " *self = PyObject_New(struct ", rec, ", &", rec, "Type);\n")
+    o.pysrc("\tif (!self)\n")
+    o.pysrc("\t\treturn NULL;\n")
+    o.pysrc("\trxgen_decode_", struct.name, "(call, &self->x);\n")
+    o.pysrc("\treturn (PyObject *)self;\n")
+    o.pysrc("}\n")
+
+###############################################################################
+#
+# Emit a function to build a NumPy dtype description of a C struct.
+#
+# The description is a dict of names, formats, offsets and itemsize that
+# matches the layout of the raw struct, so a bulk struct_array can be viewed
+# as a NumPy structured array without copying.  Char arrays become fixed-width
+# byte strings.
+#
+###############################################################################
+dtype_formats = {
+    "char"      : "S1",
+    "int8_t"    : "i1",
+    "int16_t"   : "i2",
+    "int32_t"   : "i4",
+    "int64_t"   : "i8",
+    "uint8_t"   : "u1",
+    "uint16_t"  : "u2",
+    "uint32_t"  : "u4",
+    "uint64_t"  : "u8",
+}
+
+def emit_py_dtype(o, struct):
+    names = list()
+    formats = list()
+    args = list()
+    for m in struct.members:
+        ty = m.typespec
+        o.where(struct.name + "::" + m.name)
+        names.append("s")
+        if ty.is_char_array():
+            formats.append("(si)")
+            args.append("\"S\", " + ty.dim.name)
+        elif ty.is_single_basic():
+            formats.append("s")
+            args.append("\"" + dtype_formats[ty.name] + "\"")
+        elif ty.is_single_struct():
+            formats.append("N")
+            args.append("py_" + ty.name + "_dtype()")
+        elif ty.is_struct_array():
+            formats.append("(N(i))")
+            args.append("py_" + ty.name + "_dtype(), " + ty.dim.name)
+        elif ty.is_int_array() and ty.name in dtype_formats:
+            formats.append("(s(i))")
+            args.append("\"" + dtype_formats[ty.name] + "\", " + ty.dim.name)
+        else:
+            raise RuntimeError("Unsupported member type \"" + str(ty) + "\"")
+
+    fmt = ("{s:[" + "".join(names) + "],s:[" + "".join(formats) +
+           "],s:[" + "n" * len(names) + "],s:n}")
+
+    o.pysrc("\n")
+    o.pysrc("PyObject *py_", struct.name, "_dtype(void)\n")
+    o.pysrc("{\n")
+    o.pysrc("\treturn Py_BuildValue(\"", fmt, "\",\n")
+    o.pysrc("\t\t\t     \"names\"")
+    for m in struct.members:
+        o.pysrc(",\n\t\t\t     \"", m.name, "\"")
+    o.pysrc(",\n\t\t\t     \"formats\"")
+    for a in args:
+        o.pysrc(",\n\t\t\t     ", a)
+    o.pysrc(",\n\t\t\t     \"offsets\"")
+    for m in struct.members:
+        o.pysrc(",\n\t\t\t     (Py_ssize_t)offsetof(struct ", struct.name, ", ", m.name, ")")
+    o.pysrc(",\n\t\t\t     \"itemsize\", (Py_ssize_t)sizeof(struct ", struct.name, "));\n")
+    o.pysrc("}\n")
@@ -34,15 +34,19 @@ Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
 """
 
 import sys
+import getopt
 import keyword
 import time
 import os
+import hashlib
+import pickle
 from rxgen_bits import *
 from emit_c_struct import *
 from emit_c_sync_funcs import *
 from emit_py_types import *
 from emit_py_sync_funcs import *
 from emit_py_module import *
+from emit_py_codec import *
 
 xdr = None              # Current context
 
@@ -613,6 +617,7 @@ def parse(infile, debug=False):
     global xdr
     xdr.source = infile
     xdr.lineno = 0
+    xdr.pkg = None
 
     f = open(infile)
     data = f.read()
@@ -630,28 +635,118 @@ def parse(infile, debug=False):
         return False
     return True
 
+##########################################################################
+#                                                                        #
+#                          Parse Cache                                   #
+#                                                                        #
+##########################################################################
 #
-# Section: main
+# The parser builds its definitions straight into the XDR context, so what
+# gets cached is a snapshot of the context after each input file.  The key
+# for a file is a hash of its name and contents chained onto the key of the
+# file before it (and ultimately onto the parser itself), so editing one file
+# only requires that file and those after it to be parsed again.
 #
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: {:s} <filename>*".format(sys.argv[0]))
-        sys.exit(1)
+def parse_cache_keys(infiles):
+    h = hashlib.sha256()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for src in ("rxgen.py", "rxgen_bits.py"):
+        with open(os.path.join(here, src), "rb") as f:
+            h.update(f.read())
+
+    keys = list()
+    for infile in infiles:
+        with open(infile, "rb") as f:
+            data = f.read()
+        h.update(infile.encode("utf-8") + b"\0")
+        h.update(hashlib.sha256(data).digest())
+        keys.append(h.hexdigest())
+    return keys
+
+def load_cached_parse(cache_dir, key):
+    try:
+        with open(os.path.join(cache_dir, key + ".pickle"), "rb") as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError):
+        return None
+
+def save_cached_parse(cache_dir, key):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, key + ".pickle")
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump(xdr, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+
+def prune_parse_cache(cache_dir, keys):
+    if not os.path.isdir(cache_dir):
+        return
+    wanted = set([key + ".pickle" for key in keys])
+    for name in os.listdir(cache_dir):
+        if name.endswith(".pickle") and name not in wanted:
+            os.remove(os.path.join(cache_dir, name))
 
-    for f in sys.argv[1:]:
-        if not parse(f):
-            break
+##########################################################################
+#                                                                        #
+#                          Generated Units                               #
+#                                                                        #
+##########################################################################
+#
+# Work out which other units a unit's code refers to, be it for the
+# definition of a struct or for a named constant used as a dimension, size
+# limit or opcode.  Things can only refer to things declared before them, so
+# the dependencies always lie in earlier units.
+#
+def unit_dependencies(o, unit):
+    xdr = o.xdr
+    deps = set()
+
+    def note_constant(c):
+        if isinstance(c, xdr_constant) and c.name in xdr.constants:
+            deps.add(unit_name(xdr.constants[c.name].pkg))
+
+    def note_type(ty):
+        if ty.is_struct():
+            deps.add(unit_name(xdr.structs[ty.name].pkg))
+        note_constant(ty.dim)
+        note_constant(ty.max_size)
+
+    for s in unit.structs:
+        for m in s.members:
+            note_type(m.typespec)
+    for f in unit.funcs:
+        note_constant(f.opcode)
+        for p in f.params:
+            note_type(p.typespec)
 
-    xdr.finished_parsing()
+    deps.discard(unit.name)
+    return [name for name in o.units if name in deps]
 
-    o = file_generator(xdr)
+def emit_unit_prologue(o, unit):
+    guard = "_AFS_XG_" + unit.name.upper() + "_H"
     o.rxhdr("/* AUTOGENERATED */\n")
+    o.rxhdr("#ifndef ", guard, "\n")
+    o.rxhdr("#define ", guard, "\n")
     #o.rxhdr("#define _XOPEN_SOURCE\n";
     o.rxhdr("#include <stdint.h>\n")
     o.rxhdr("#include \"rxgen.h\"\n")
+    for dep in unit.deps:
+        o.rxhdr("#include \"", o.units[dep].files["rxhdr"], "\"\n")
+
+    guard = "_AFS_PY_" + unit.name.upper() + "_H"
+    o.pyhdr("/* AUTOGENERATED */\n")
+    o.pyhdr("#ifndef ", guard, "\n")
+    o.pyhdr("#define ", guard, "\n")
+    o.pyhdr("#include <Python.h>\n")
+    o.pyhdr("#include \"", unit.files["rxhdr"], "\"\n")
+    o.pyhdr("#include \"py_rxgen.h\"\n")
+    for dep in unit.deps:
+        o.pyhdr("#include \"", o.units[dep].files["pyhdr"], "\"\n")
+
+    if not unit.has_code():
+        return
 
     o.rxsrc("/* AUTOGENERATED */\n")
-    o.rxsrc("#include \"afs_xg.h\"\n")
+    o.rxsrc("#include \"", unit.files["rxhdr"], "\"\n")
     o.rxsrc("#include <stdio.h>\n")
     o.rxsrc("#include <stdlib.h>\n")
     o.rxsrc("#include <string.h>\n")
@@ -662,84 +757,191 @@ if __name__ == "__main__":
     o.rxsrc("#include <arpa/inet.h>\n")
     o.rxsrc("\n")
 
-    o.pyhdr("/* AUTOGENERATED */\n")
-    o.pyhdr("#include <Python.h>\n")
-    o.pyhdr("#include \"afs_xg.h\"\n")
-    o.pyhdr("#include \"py_rxgen.h\"\n")
-
     o.pysrc("/* AUTOGENERATED */\n")
     o.pysrc("#include <Python.h>\n")
     o.pysrc("#include \"structmember.h\"\n")
-    o.pysrc("#include \"afs_py.h\"\n")
+    o.pysrc("#include \"", unit.files["pyhdr"], "\"\n")
     o.pysrc("#include <arpa/inet.h>\n")
     o.pysrc("\n")
 
-    # Declare constants
-    o.rxhdr("\n")
-    for name in xdr.all_constants:
-        c = xdr.constants[name]
-        o.rxhdr("#define ", c.name, " ", c.value, "\n")
+#
+# Section: main
+#
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "",
+                               [ "python-codec", "cache-dir=", "no-cache" ])
+    if len(args) < 1:
+        print("Usage: {:s} [--python-codec] [--cache-dir=<dir>|--no-cache] <filename>*".format(sys.argv[0]))
+        sys.exit(1)
 
-    # Declare structure types
-    for s in xdr.all_structs:
-        emit_struct_encdec_decl(o, s)
-        emit_py_type_wrapper_decls(o, s)
+    python_codec = False
+    cache_dir = ".rxgen-cache"
+    for opt, arg in opts:
+        if opt == "--python-codec":
+            python_codec = True
+        elif opt == "--cache-dir":
+            cache_dir = arg
+        elif opt == "--no-cache":
+            cache_dir = None
+
+    # Pick up from the last file for which we have a cached parse
+    keys = parse_cache_keys(args)
+    parsed = 0
+    if cache_dir:
+        for i in reversed(range(len(args))):
+            cached = load_cached_parse(cache_dir, keys[i])
+            if cached:
+                xdr = cached
+                parsed = i + 1
+                break
+
+    for f in args[:parsed]:
+        print("Using cached parse of", f)
+
+    for i in range(parsed, len(args)):
+        if not parse(args[i]):
+            break
+        if cache_dir:
+            save_cached_parse(cache_dir, keys[i])
 
-    for s in xdr.all_structs:
-        emit_struct_encdec(o, s);
-        emit_py_type_wrapper(o, s);
+    if cache_dir:
+        prune_parse_cache(cache_dir, keys)
 
-    # Emit RPC call functions.  For this we need to classify parameters according
-    # to input and output usage and work out how big the RPC messages will be.
-    #
-    for f in xdr.funcs:
-        # Dump the banner comment block
-        o.rxsrc("/*\n")
-        o.rxsrc(" * RPC Call ", f.name, "\n")
-        o.rxsrc(" */\n")
+    xdr.finished_parsing()
 
-        # Find the Operation ID
-        if not f.opcode:
-            raise RuntimeError("Operation ID unspecified for " + f.name)
+    o = file_generator(xdr)
+    if python_codec:
+        o.open_codec()
 
-        # Filter the parameters into request and response
-        f.request = list()
-        f.response = list()
+    # Sort the constants, structures and RPC calls into units by package
+    o.set_unit("common")
+    for pkg in xdr.packages.values():
+        o.set_unit(pkg.unit)
 
-        for p in f.params:
-            o.where(f.name + ":" + p.name)
-            ty = p.typespec
-            if ty.is_single_basic():
-                pass
-            elif ty.is_struct():
-                assert(ty.xdr_size)
-            elif ty.is_single_blob():
-                # Could validate max_size attribute
-                pass
-            elif ty.is_bulk():
-                assert(ty.xdr_size)
-            else:
-                raise RuntimeError("Unsupported param type \"" + str(ty) + "\"")
-
-            if p.direction == xdr_direction.IN:
-                f.request.append(p)
-            elif p.direction == xdr_direction.OUT:
-                f.response.append(p)
-            elif p.direction == xdr_direction.INOUT:
-                f.request.append(p)
-                f.response.append(p)
-
-        emit_func_prototype(o, f)
-        emit_func_decode(o, f, "client", "response", f.response)
-        emit_func_send(o, f, "request")
-        #emit_func_decode(f, "server", "request", request)
-        #emit_func_send(f, "response")
-
-        emit_py_func_param_object(o, f, "request")
-        emit_py_func_param_object(o, f, "response")
-        emit_py_func_bulk_helper(o, f)
-        emit_py_func_decode(o, f, "client", "response", f.response)
-        emit_py_func_decode(o, f, "server", "request", f.request)
-        emit_py_func_simple_sync_call(o, f)
+    for name in xdr.all_constants:
+        c = xdr.constants[name]
+        o.units[unit_name(c.pkg)].constants.append(c)
+    for s in xdr.all_structs:
+        o.units[unit_name(s.pkg)].structs.append(s)
+    for f in xdr.funcs:
+        o.units[unit_name(f.pkg)].funcs.append(f)
+
+    units = list(o.units.values())
+    for unit in units:
+        unit.deps = unit_dependencies(o, unit)
+
+    for unit in units:
+        o.set_unit(unit.name)
+        emit_unit_prologue(o, unit)
+
+        # Declare constants
+        o.rxhdr("\n")
+        for c in unit.constants:
+            o.rxhdr("#define ", c.name, " ", c.value, "\n")
+
+        # Declare structure types
+        for s in unit.structs:
+            emit_struct_encdec_decl(o, s)
+            emit_py_type_wrapper_decls(o, s)
+
+        for s in unit.structs:
+            emit_struct_encdec(o, s);
+            emit_py_type_wrapper(o, s);
+            emit_py_record_type(o, s);
+            emit_py_dtype(o, s);
+
+        # Emit RPC call functions.  For this we need to classify parameters
+        # according to input and output usage and work out how big the RPC
+        # messages will be.
+        #
+        for f in unit.funcs:
+            # Dump the banner comment block
+            o.rxsrc("/*\n")
+            o.rxsrc(" * RPC Call ", f.name, "\n")
+            o.rxsrc(" */\n")
+
+            # Find the Operation ID
+            if not f.opcode:
+                raise RuntimeError("Operation ID unspecified for " + f.name)
+
+            # Filter the parameters into request and response
+            f.request = list()
+            f.response = list()
+
+            for p in f.params:
+                o.where(f.name + ":" + p.name)
+                ty = p.typespec
+                if ty.is_single_basic():
+                    pass
+                elif ty.is_struct():
+                    assert(ty.xdr_size)
+                elif ty.is_single_blob():
+                    # Could validate max_size attribute
+                    pass
+                elif ty.is_bulk():
+                    assert(ty.xdr_size)
+                else:
+                    raise RuntimeError("Unsupported param type \"" + str(ty) + "\"")
+
+                if p.direction == xdr_direction.IN:
+                    f.request.append(p)
+                elif p.direction == xdr_direction.OUT:
+                    f.response.append(p)
+                elif p.direction == xdr_direction.INOUT:
+                    f.request.append(p)
+                    f.response.append(p)
+
+            emit_func_prototype(o, f)
+            emit_func_decode(o, f, "client", "response", f.response)
+            emit_func_send(o, f, "request")
+            #emit_func_decode(f, "server", "request", request)
+            #emit_func_send(f, "response")
+
+            emit_py_func_param_object(o, f, "request")
+            emit_py_func_param_object(o, f, "response")
+            emit_py_func_bulk_helper(o, f)
+            emit_py_func_decode(o, f, "client", "response", f.response)
+            emit_py_func_decode(o, f, "server", "request", f.request)
+            emit_py_func_simple_sync_call(o, f)
+
+        o.rxhdr("\n")
+        o.rxhdr("#endif\n")
+        o.pyhdr("\n")
+        o.pyhdr("#endif\n")
+
+    # The module unit pulls everything together
+    o.set_unit(None)
+    o.rxhdr("/* AUTOGENERATED */\n")
+    o.rxhdr("#ifndef _AFS_XG_H\n")
+    o.rxhdr("#define _AFS_XG_H\n")
+    for unit in units:
+        o.rxhdr("#include \"", unit.files["rxhdr"], "\"\n")
+
+    o.pyhdr("/* AUTOGENERATED */\n")
+    o.pyhdr("#ifndef _AFS_PY_H\n")
+    o.pyhdr("#define _AFS_PY_H\n")
+    o.pyhdr("#include <Python.h>\n")
+    o.pyhdr("#include \"afs_xg.h\"\n")
+    for unit in units:
+        o.pyhdr("#include \"", unit.files["pyhdr"], "\"\n")
+    o.pyhdr("\n")
+
+    o.pysrc("/* AUTOGENERATED */\n")
+    o.pysrc("#include <Python.h>\n")
+    o.pysrc("#include \"structmember.h\"\n")
+    o.pysrc("#include \"afs_py.h\"\n")
+    o.pysrc("#include <arpa/inet.h>\n")
+    o.pysrc("\n")
 
     emit_py_module(o);
+
+    o.rxhdr("\n")
+    o.rxhdr("#endif\n")
+    o.pyhdr("\n")
+    o.pyhdr("#endif\n")
+    o.write_out()
+
+    # Emit a pure-Python codec if requested
+    if python_codec:
+        emit_py_codec(o)
+        o.close_codec()
@@ -20,6 +20,9 @@ Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
 """
 
 import sys
+import os
+import io
+import glob
 from enum import Enum
 
 class xdr_basic(Enum):
@@ -197,6 +200,7 @@ class xdr_package(token_base):
         self.lineno = xdr.lineno
         self.prefix = prefix
         self.abort_codes = list()
+        self.unit = name.lower()
 
 ###############################################################################
 #
@@ -211,6 +215,7 @@ class xdr_constant(token_base):
         self.value = value
         self.source = xdr.source
         self.lineno = xdr.lineno
+        self.pkg = xdr.pkg
         if not isinstance(value, str):
             raise RuntimeError("Value should be a string");
 
@@ -270,6 +275,7 @@ class xdr_type(token_base):
 
         self.source = xdr.source
         self.lineno = xdr.lineno
+        self.pkg = xdr.pkg
         self.referenced = False
 
         if base:
@@ -469,6 +475,7 @@ class xdr_proc(token_base):
     """An XDR procedure"""
     def __init__(self, name, xdr, params, opcode, multi=False, split=False):
         self.name = xdr.pkg.name + "_" + name
+        self.pkg = xdr.pkg
         self.source = xdr.source
         self.lineno = xdr.lineno
         self.params = params
@@ -476,6 +483,63 @@ class xdr_proc(token_base):
         self.multi = multi
         self.split = split
 
+###############################################################################
+#
+# Generated code unit.
+#
+# Each package gets C and Python source files and headers of its own so that a
+# change to one package only causes that package's code to be recompiled.
+# Anything declared outside of a package goes into the common unit and the
+# Python module definition goes into a unit of its own that pulls in all the
+# others.
+#
+###############################################################################
+def unit_name(pkg):
+    if not pkg:
+        return "common"
+    return pkg.unit
+
+class gen_unit:
+    """A set of generated files"""
+    def __init__(self, name):
+        self.name = name
+        self.constants = list()
+        self.structs = list()
+        self.funcs = list()
+        self.deps = list()
+        if name:
+            self.files = { "rxhdr" : "afs_xg_" + name + ".h",
+                           "rxsrc" : "afs_xg_" + name + ".c",
+                           "pyhdr" : "afs_py_" + name + ".h",
+                           "pysrc" : "afs_py_" + name + ".c" }
+        else:
+            self.files = { "rxhdr" : "afs_xg.h",
+                           "rxsrc" : None,
+                           "pyhdr" : "afs_py.h",
+                           "pysrc" : "afs_py.c" }
+        self.out = dict()
+        for i in self.files:
+            self.out[i] = io.StringIO()
+
+    def has_code(self):
+        return self.structs or self.funcs
+
+###############################################################################
+#
+# Write a generated file, leaving it alone if its contents are unchanged
+#
+###############################################################################
+def write_if_changed(filename, text):
+    try:
+        with open(filename, encoding="utf-8") as f:
+            if f.read() == text:
+                return
+    except FileNotFoundError:
+        pass
+    print("Writing", filename)
+    with open(filename, "w", encoding="utf-8") as f:
+        f.write(text)
+
 ###############################################################################
 #
 # Generated file writer class
@@ -485,38 +549,54 @@ class file_generator:
     """File generator class"""
     def __init__(self, xdr):
         self.xdr = xdr
-        self._rxhdr = open("2_afs_xg.h", "w", encoding="utf-8")
-        self._rxsrc = open("2_afs_xg.c", "w", encoding="utf-8")
-        self._pyhdr = open("2_afs_py.h", "w", encoding="utf-8")
-        self._pysrc = open("2_afs_py.c", "w", encoding="utf-8")
+        self.units = dict()
+        self.unit = None
+        self._codec = None
+
+    def set_unit(self, name):
+        if name not in self.units:
+            self.units[name] = gen_unit(name)
+        self.unit = self.units[name]
+        return self.unit
+
+    def open_codec(self):
+        self._codec = io.StringIO()
+
+    def close_codec(self):
+        write_if_changed("afs_xdr.py", self._codec.getvalue())
+        self._codec = None
+
+    def codec(self, *va):
+        for i in va:
+            self._codec.write(str(i))
 
     def rxhdr(self, *va):
         for i in va:
-            self._rxhdr.write(str(i))
+            self.unit.out["rxhdr"].write(str(i))
 
     def rxsrc(self, *va):
         for i in va:
-            self._rxsrc.write(str(i))
+            self.unit.out["rxsrc"].write(str(i))
 
     def pyhdr(self, *va):
         for i in va:
-            self._pyhdr.write(str(i))
+            self.unit.out["pyhdr"].write(str(i))
 
     def pysrc(self, *va):
         for i in va:
-            self._pysrc.write(str(i))
+            self.unit.out["pysrc"].write(str(i))
 
     def rxhdrf(self, fmt, *va):
-        self._rxhdr.write(fmt.format(*va))
+        self.unit.out["rxhdr"].write(fmt.format(*va))
 
     def rxsrcf(self, fmt, *va):
-        self._rxsrc.write(fmt.format(*va))
+        self.unit.out["rxsrc"].write(fmt.format(*va))
 
     def pyhdrf(self, fmt, *va):
-        self._pyhdr.write(fmt.format(*va))
+        self.unit.out["pyhdr"].write(fmt.format(*va))
 
     def pysrcf(self, fmt, *va):
-        self._pysrc.write(fmt.format(*va))
+        self.unit.out["pysrc"].write(fmt.format(*va))
 
     def where(self, loc):
         self._where = loc + ": "
@@ -528,6 +608,26 @@ class file_generator:
             sys.stdout.write(str(i))
         sys.stdout.write("\n")
 
+    # Write out the generated files.  Files whose contents haven't changed are
+    # left alone so that their timestamps don't cause them to be recompiled,
+    # and unit files left over from packages that no longer exist are removed,
+    # as is the single C source file that everything used to be put in.
+    def write_out(self):
+        wanted = set()
+        for unit in self.units.values():
+            for kind, filename in unit.files.items():
+                text = unit.out[kind].getvalue()
+                if not filename or not text:
+                    continue
+                wanted.add(filename)
+                write_if_changed(filename, text)
+
+        stale = glob.glob("afs_xg_*.[ch]") + glob.glob("afs_py_*.[ch]") + glob.glob("afs_xg.c")
+        for filename in stale:
+            if filename not in wanted:
+                print("Removing", filename)
+                os.remove(filename)
+
 ###############################################################################
 #
 # Python type def
@@ -544,7 +644,8 @@ class py_type_def:
 #
 ###############################################################################
 class py_func_def:
-    def __init__(self, name, c_func, doc=""):
+    def __init__(self, name, c_func, doc="", flags="METH_VARARGS"):
         self.name = name
         self.c_func = c_func
         self.doc = doc
+        self.flags = flags
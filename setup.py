@@ -1,25 +1,73 @@
+import os
+import re
+from glob import glob
 from distutils.core import setup, Extension
+from distutils.command.build_ext import build_ext
+from distutils.dep_util import newer_group
 
 # Example that has an rpcgen implementation that is run from setup.py
 #
 # http://git.linux-nfs.org/?p=iisaman/pynfs.git;a=tree;h=14b3085dcce30d941a7839241779639b80e6298b;hb=14b3085dcce30d941a7839241779639b80e6298b
 
+# rxgen emits a C and a Python source file per RPC package plus afs_py.c to
+# hold the module definition.
+generated = sorted(glob("afs_xg_*.c")) + sorted(glob("afs_py_*.c")) + [ "afs_py.c" ]
+
+def local_includes(path, found):
+    """Find the local headers that a source file includes, directly or not"""
+    with open(path) as f:
+        for line in f:
+            m = re.match(r'\s*#\s*include\s+"([^"]+)"', line)
+            if m and m.group(1) not in found and os.path.exists(m.group(1)):
+                found.add(m.group(1))
+                local_includes(m.group(1), found)
+    return found
+
+class incremental_build_ext(build_ext):
+    """Only recompile the sources that have changed since the last build
+
+    distutils rebuilds every source file of an extension if any of them has
+    changed, which makes changing one RPC package needlessly slow.
+    """
+    def build_extension(self, ext):
+        compile = self.compiler.compile
+
+        def compile_changed(sources, output_dir=None, **kw):
+            objects = self.compiler.object_filenames(sources, output_dir=output_dir)
+            stale = [ src for src, obj in zip(sources, objects)
+                      if self.force or
+                      newer_group([ src ] + sorted(local_includes(src, set())), obj) ]
+            if stale:
+                compile(stale, output_dir=output_dir, **kw)
+            return objects
+
+        self.compiler.compile = compile_changed
+        try:
+            build_ext.build_extension(self, ext)
+        finally:
+            self.compiler.compile = compile
+
 setup(name = "kafs",
       version = "0.1",
       description = "AFS filesystem management scripting and commands",
       author = "David Howells",
       author_email = "dhowells@redhat.com",
       license = "GPLv2",
+      cmdclass = { "build_ext" : incremental_build_ext },
+      py_modules = [ "afs_xdr" ],
       ext_modules = [Extension("kafs",
-                               sources = [ "afs_xg.c",
+                               sources = generated + [
                                            "kafs.c",
-                                           "afs_py.c",
                                            "py_passwd.c",
                                            "py_rxgen.c",
                                            "py_rxconn.c",
+                                           "py_rxcall.c",
+                                           "py_rxbulk.c",
                                            "py_rxsplit.c",
+                                           "py_rxrecord.c",
                                            "af_rxrpc.c"
                                        ],
+                               depends = glob("*.h"),
                              extra_compile_args = [
                                  "-O0",
                                  "-Wp,-U_FORTIFY_SOURCE",
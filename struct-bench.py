@@ -0,0 +1,63 @@
+#!/usr/bin/python3
+#
+# Measure the cost of accessing the arrays embedded in VLDB records, as done
+# for every site by display_vldb_site_list().  No server is needed.
+#
+# Copyright (C) 2014 Red Hat, Inc. All Rights Reserved.
+# Written by David Howells (dhowells@redhat.com)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public Licence
+# as published by the Free Software Foundation; either version
+# 2 of the Licence, or (at your option) any later version.
+#
+
+import sys;
+import getopt;
+import time;
+import kafs;
+
+nr_records = 10000;
+
+opts, args = getopt.getopt(sys.argv[1:], "n:", [ "records=" ]);
+for o, a in opts:
+    if o == "-n" or o == "--records":
+        nr_records = int(a);
+
+def bench(title, records, nr_elems, func):
+    start = time.perf_counter();
+    func(records);
+    elapsed = time.perf_counter() - start;
+    per_elem = elapsed * 1e9 / (len(records) * nr_elems);
+    print("{:40s} {:8.1f} ns/element".format(title, per_elem));
+
+# Walk the whole of an embedded struct array in fresh records
+def struct_array_first(records):
+    for vldb in records:
+        servers = vldb.serverNumber;
+        for i in range(0, kafs.NMAXNSERVERS):
+            servers[i];
+
+# Walk it again now that the element wrappers are cached
+def struct_array_again(records):
+    for vldb in records:
+        for i in range(0, kafs.NMAXNSERVERS):
+            vldb.serverNumber[i];
+
+# Walk an embedded integer array in fresh records
+def int_array_first(records):
+    for vldb in records:
+        for i in range(0, kafs.NMAXNSERVERS):
+            vldb.serverFlags[i];
+
+print("-- Embedded array access over", nr_records, "records --");
+
+uvldb = [ kafs.uvldbentry() for i in range(0, nr_records) ];
+bench("uvldbentry.serverNumber[i] (first)", uvldb, kafs.NMAXNSERVERS,
+      struct_array_first);
+bench("uvldbentry.serverNumber[i] (cached)", uvldb, kafs.NMAXNSERVERS,
+      struct_array_again);
+
+nvldb = [ kafs.nvldbentry() for i in range(0, nr_records) ];
+bench("nvldbentry.serverFlags[i]", nvldb, kafs.NMAXNSERVERS,
+      int_array_first);
@@ -24,6 +24,7 @@ Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
 import sys, os
 
 import afs.commands
+import afs.lib.cellservdb
 from afs.argparse import *
 from afs.lib.output import *
 
@@ -46,24 +47,7 @@ def log(*args):
 #
 ###############################################################################
 def expand_cell_list(prefix):
-    cells = []
-    for line in open("/etc/openafs/CellServDB", "r", encoding="iso8859_1"):
-        line = str(line.rstrip())
-        if line == "":
-            continue
-        comment_ix = line.find("#")
-        if comment_ix == 0:
-            continue
-        comment = ""
-        if comment_ix > 0:
-            comment = line[comment_ix + 1:].lstrip()
-            line = line[:comment_ix].rstrip()
-        if line[0] == ">":
-            # New cell name
-            if line[1:].startswith(prefix):
-                if line[1:] not in cells:
-                    cells.append(line[1:])
-    return cells
+    return afs.lib.cellservdb.complete_cell(prefix)
 
 ###############################################################################
 #
@@ -26,6 +26,7 @@ from afs.argparse import *
 from afs.lib.output import *
 import kafs
 import os
+import sys
 
 help = "Print a server process's log file"
 
@@ -63,6 +64,10 @@ class split_handler:
     # or another state must be transited to and False if the operation is now
     # complete.
     #
+    # The log is written straight from the call's buffers to stdout, bar the
+    # last byte available at each point.  That is read separately as it may be
+    # the NUL that the server sends to terminate the log.
+    #
     def receive(self, split_info):
         # We want to receive everything we can - the entire response phase
         # belongs to the split handler
@@ -80,34 +85,36 @@ class split_handler:
                 split_info.will_recv_all()
                 return True
 
-            if avail > 4096:
-                avail = 4096
-            buf = bytearray(avail)
-            split_info.target = buf
-            split_info.state = 2
-
             # Request reception start.  This function will be reentered with
-            # phase incremented when it's done.  receive_failed() will be
+            # state incremented when it's done.  receive_failed() will be
             # called instead upon failure.
+            if avail > 1:
+                output_flush()
+                split_info.state = 2
+                return split_info.recv_into_fd(sys.stdout, avail - 1, False)
+
+            buf = bytearray(1)
+            split_info.target = buf
+            split_info.state = 4
             return split_info.begin_recv(buf, False)
 
         if split_info.state == 3:
+            split_info.state = 1
+            return True
+
+        if split_info.state == 5:
             buf = split_info.target
             split_info.target = None
-
-            # Strip any terminal NUL chars
-            buf = buf.rstrip(b"\0")
-            output_raw(buf)
-            del buf
-
+            if buf != b"\0":
+                output_raw(buf)
             split_info.state = 1
             return True
 
-        raise AFSException("Unexpected receive phase ", split_info.phase,
+        raise AFSException("Unexpected receive state ", split_info.state,
                            " in getlog() split.receive()")
 
     def receive_failed(self, split_info):
-        print("Receive failed in phase", split_info.phase)
+        print("Receive failed in state", split_info.state)
         split_info.target = None
 
 def main(params):
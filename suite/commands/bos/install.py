@@ -25,6 +25,7 @@ from afs.exception import AFSException
 from afs.argparse import *
 from afs.lib.output import *
 import kafs
+import mmap
 import os
 
 help = "Revert to the former version of a process's binary file"
@@ -54,28 +55,37 @@ description = r"""
 Revert to the former version of a process's binary file
 """
 
+# Transmit the file in chunks straight out of an mmap of it.  The chunks are
+# just views on the mapping, so nothing gets copied through Python.
+xmit_chunk_size = 4 * 1024 * 1024
+
 class split_handler:
     def __init__(self, name, fd, size):
-        self.__name = fd
+        self.__name = name
         self.__fd = fd
         self.__size = size
         self.__pos = 0
 
     def transmit(self, split_info):
-        while self.__pos < self.__size:
-            verbose("--- XMIT ", self.__pos, "/", self.__size, "\n")
-            size = self.__size - self.__pos
-            if size > 4096:
-                size = 4096
-            self.__pos += size
-
-            buf = self.__fd.read(size)
-            if len(buf) < size:
+        if self.__size == 0:
+            # An empty file can't be mapped; there's nothing to send anyway
+            return None
+
+        with mmap.mmap(self.__fd.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            if len(m) < self.__size:
                 raise IOError("Short read on file " + self.__name)
-            split_info.send(buf, self.__pos < self.__size)
+            with memoryview(m) as data:
+                while self.__pos < self.__size:
+                    verbose("--- XMIT ", self.__pos, "/", self.__size, "\n")
+                    size = self.__size - self.__pos
+                    if size > xmit_chunk_size:
+                        size = xmit_chunk_size
+                    with data[self.__pos:self.__pos + size] as chunk:
+                        self.__pos += size
+                        split_info.send(chunk, self.__pos < self.__size)
         return True
 
-    def receive(self, split_info, inited):
+    def receive(self, split_info):
         return None
 
 def main(params):
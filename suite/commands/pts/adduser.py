@@ -79,7 +79,8 @@ def main(params):
                     continue
 
             try:
-                ret = cell.call_pt_server(params, kafs.PR_AddToGroup, uid, gid)
+                ret = cell.call_pt_server(params, kafs.PR_AddToGroup, uid, gid,
+                                          write=True)
                 prcache.evict_groups()
             except kafs.AbortPRIDEXIST:
                 error("Entry for id already exists ; unable to add user ", user, " to group ", group, ignored, "\n")
@@ -71,7 +71,8 @@ def main(params):
 
     try:
         verbose("Chowning ", gid, " to ", owner, "\n")
-        ret = cell.call_pt_server(params, kafs.PR_ChangeEntry, gid, "", owner, 0)
+        ret = cell.call_pt_server(params, kafs.PR_ChangeEntry, gid, "", owner, 0,
+                                  write=True)
         # The name is changed by the act of chowning (group names are prefixed
         # by the owner user name and a colon, and the prefix gets changed)
         prcache.evict_id(gid)
@@ -74,9 +74,11 @@ def main(params):
             verbose("Adding group ", name, "\n")
             if i < len(ids):
                 new_id = int(ids[i])
-                ret = cell.call_pt_server(params, kafs.PR_INewEntry, name, new_id, oid)
+                ret = cell.call_pt_server(params, kafs.PR_INewEntry, name, new_id, oid,
+                                          write=True)
             else:
-                ret = cell.call_pt_server(params, kafs.PR_NewEntry, name, kafs.PRGRP, oid)
+                ret = cell.call_pt_server(params, kafs.PR_NewEntry, name, kafs.PRGRP, oid,
+                                          write=True)
                 new_id = ret.id
             output("Group ", name, " has id ", new_id, "\n")
             prcache.evict_name(name)
@@ -68,9 +68,11 @@ def main(params):
             verbose("Adding user ", name, "\n")
             if i < len(ids):
                 new_id = int(ids[i])
-                ret = cell.call_pt_server(params, kafs.PR_NewEntry, name, new_id, 0)
+                ret = cell.call_pt_server(params, kafs.PR_NewEntry, name, new_id, 0,
+                                          write=True)
             else:
-                ret = cell.call_pt_server(params, kafs.PR_NewEntry, name, 0, 0)
+                ret = cell.call_pt_server(params, kafs.PR_NewEntry, name, 0, 0,
+                                          write=True)
                 new_id = ret.id
             output("User ", name, " has id ", new_id, "\n")
             prcache.evict_name(name)
@@ -68,7 +68,7 @@ def main(params):
 
         try:
             verbose("Deleting user ", uid, " (", prcache.id_to_name(uid), ")\n")
-            ret = cell.call_pt_server(params, kafs.PR_Delete, uid)
+            ret = cell.call_pt_server(params, kafs.PR_Delete, uid, write=True)
             prcache.evict_id(uid)
             prcache.evict_groups()
         except kafs.AbortPRNOENT:
@@ -79,7 +79,8 @@ def main(params):
                     continue
 
             try:
-                ret = cell.call_pt_server(params, kafs.PR_RemoveFromGroup, uid, gid)
+                ret = cell.call_pt_server(params, kafs.PR_RemoveFromGroup, uid, gid,
+                                          write=True)
                 prcache.evict_groups()
             except kafs.AbortPRNOENT:
                 error("User or group doesn't exist ; unable to remove user ", user, " from group ", group, ignored, "\n")
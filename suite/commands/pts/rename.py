@@ -67,7 +67,8 @@ def main(params):
 
     try:
         verbose("Renaming ", uid, " to ", newname, "\n")
-        ret = cell.call_pt_server(params, kafs.PR_ChangeEntry, uid, newname, 0, 0)
+        ret = cell.call_pt_server(params, kafs.PR_ChangeEntry, uid, newname, 0, 0,
+                                  write=True)
         prcache.evict_id(uid)
         prcache.evict_groups()
     except kafs.AbortPREXIST:
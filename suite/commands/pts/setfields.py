@@ -136,7 +136,8 @@ def main(params):
         try:
             verbose("Altering entry for ", uid, " (", name, ")\n")
             ret = cell.call_pt_server(params,  kafs.PR_SetFieldsEntry,
-                                      uid, mask, flags, ngroups, 0, 0, 0)
+                                      uid, mask, flags, ngroups, 0, 0, 0,
+                                      write=True)
         except kafs.AbortPRNOENT:
             error("User or group doesn't exist examining ", name, " (id ", uid, ")\n")
             prcache.id_is_unknown(uid)
@@ -55,7 +55,8 @@ def main(params):
         try:
             uid = params["user"]
             verbose("Set max UID to ", uid, "\n")
-            ret = cell.call_pt_server(params, kafs.PR_SetMax, uid, kafs.PRUSER)
+            ret = cell.call_pt_server(params, kafs.PR_SetMax, uid, kafs.PRUSER,
+                                      write=True)
         except kafs.AbortPRPERM:
             error("Permission denied ; unable to change max user id\n")
             if "force" not in params:
@@ -65,7 +66,8 @@ def main(params):
         try:
             gid = params["group"]
             verbose("Set max GID to ", gid, "\n")
-            ret = cell.call_pt_server(params, kafs.PR_SetMax, gid, kafs.PRGRP)
+            ret = cell.call_pt_server(params, kafs.PR_SetMax, gid, kafs.PRGRP,
+                                      write=True)
         except kafs.AbortPRPERM:
             error("Permission denied ; unable to change max group id\n")
             
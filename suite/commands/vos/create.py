@@ -74,11 +74,11 @@ def main(params):
 
     # We need three volume IDs for the R/W, R/O and backup volumes
     volume_ids = [ 0, 0, 0 ]
-    ret = kafs.VL_GetNewVolumeId(vldb_conn, 1)
+    ret = cell.call_vl_server(params, kafs.VL_GetNewVolumeId, 1, write=True)
     volume_ids[kafs.RWVOL] = ret.newvolumid
-    ret = kafs.VL_GetNewVolumeId(vldb_conn, 1)
+    ret = cell.call_vl_server(params, kafs.VL_GetNewVolumeId, 1, write=True)
     volume_ids[kafs.ROVOL] = ret.newvolumid
-    ret = kafs.VL_GetNewVolumeId(vldb_conn, 1)
+    ret = cell.call_vl_server(params, kafs.VL_GetNewVolumeId, 1, write=True)
     volume_ids[kafs.BACKVOL] = ret.newvolumid
 
     # Begin a volume creation transaction and configure the volume
@@ -128,7 +128,7 @@ def main(params):
         vldb.cloneId = 0
         vldb.flags = kafs.VLF_RWEXISTS
 
-        ret = kafs.VL_CreateEntryN(vldb_conn, vldb)
+        ret = cell.call_vl_server(params, kafs.VL_CreateEntryN, vldb, write=True)
 
     except Exception as e:
         # If we can't create a VLDB entry, we should probably clean up the
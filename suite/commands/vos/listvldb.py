@@ -99,14 +99,15 @@ def main(params):
         attributes.Mask |= kafs.VLLIST_FLAG
         attributes.flag = kafs.VLOP_MOVE | kafs.VLOP_RELEASE | kafs.VLOP_BACKUP | kafs.VLOP_DELETE | kafs.VLOP_DUMP
 
-    ret = kafs.VL_ListAttributes(z_conn, attributes)
+    # The entries are only wrapped as Python objects as we get to them
+    ret = kafs.VL_ListAttributes(z_conn, attributes, bulk_array=True)
     blkentries = ret.blkentries
 
     if not quiet and "server" in params:
         output("VLDB entries for server ", params["server"], "\n")
 
     if "nosort" not in params:
-        blkentries.sort(key=lambda vldb: vldb.name)
+        blkentries = sorted(blkentries, key=lambda vldb: vldb.name)
 
     for vldb in blkentries:
         print_record(params, vldb)
@@ -100,12 +100,12 @@ def display_format_extended(params, vol):
 # Display the records for a single partition in the appropriate format
 #
 ###############################################################################
-def display_one_partition(params, vol_conn, partition):
+def list_volumes_rpc(params):
     if "extended" in params:
-        ret = kafs.VOLSER_XListVolumes(vol_conn, partition, 1)
-    else:
-        ret = kafs.VOLSER_ListVolumes(vol_conn, partition, 1)
+        return kafs.VOLSER_XListVolumes
+    return kafs.VOLSER_ListVolumes
 
+def display_one_partition(params, partition, ret):
     params["_partname"] = partname = id2part(partition)
     if "quiet" not in params:
         output("Total number of volumes on server ", params["server"], " partition ",
@@ -155,13 +155,22 @@ def main(params):
     cell = params["cell"]
     vol_conn = cell.open_volume_server(params["server"], params)
 
+    rpc = list_volumes_rpc(params)
     if "partition" in params:
         try:
-            display_one_partition(params, vol_conn, params["partition"])
+            ret = rpc(vol_conn, params["partition"], 1)
         except kafs.AbortVOLSERILLEGAL_PARTITION:
             error("vos : partition ", params["raw.partition"][0],
                   " does not exist on the server")
+            return
+        display_one_partition(params, params["partition"], ret)
     else:
         ret = kafs.VOLSER_XListPartitions(vol_conn)
-        for p in ret.ent:
-            one_partition(params, vol_conn, p)
+        partitions = ret.ent
+
+        # Ask for the contents of all the partitions at once
+        results = kafs.multi(rpc, vol_conn, [(p, 1) for p in partitions])
+        for p, ret in zip(partitions, results):
+            if isinstance(ret, Exception):
+                raise ret
+            display_one_partition(params, p, ret)
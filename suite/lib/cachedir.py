@@ -0,0 +1,56 @@
+#
+# AFS Volume management toolkit: Location of cached data
+# -*- coding: utf-8 -*-
+#
+
+__copyright__ = """
+Copyright (C) 2014 Red Hat, Inc. All Rights Reserved.
+Written by David Howells (dhowells@redhat.com)
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public Licence version 2 as
+published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public Licence for more details.
+
+You should have received a copy of the GNU General Public Licence
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""
+
+import os
+
+###############################################################################
+#
+# Get the path of a file in which we keep information between invocations.
+#
+###############################################################################
+def cache_path(*components):
+    d = os.environ.get("XDG_CACHE_HOME")
+    if not d:
+        d = os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(d, "kafs-utils", *components)
+
+###############################################################################
+#
+# Atomically replace a cache file with the data written by writer(f).  Failure
+# isn't fatal as the cache will just be rebuilt next time.
+#
+###############################################################################
+def write_cache_file(path, mode, writer):
+    tmp = path + "." + str(os.getpid())
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, mode) as f:
+            writer(f)
+        os.replace(tmp, path)
+        return True
+    except OSError:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        return False
@@ -26,10 +26,89 @@ from afs.lib.vlserver import vlserver
 from afs.lib.server import ServerError
 from afs.lib.prcache import prcache
 from afs.lib.output import *
-import dns.resolver
+import afs.lib.addrcache as addrcache
+import afs.lib.dnscache as dnscache
+import afs.lib.cellservdb as cellservdb
+from afs.lib.cachedir import cache_path, write_cache_file
+from collections import OrderedDict
+import atexit
+import ipaddress
 import linecache
+import json
+import time
 import kafs
 
+# How long to wait, in seconds, for a VL server to answer a probe before moving
+# on to the next one
+VL_PROBE_TIMEOUT = 10
+
+# Limits on the pool of open connections: the maximum number kept and how long,
+# in seconds, an unused one is kept for
+CONN_POOL_MAX = 32
+CONN_POOL_IDLE = 60
+
+# How long, in seconds, what we learn about a cell's servers is remembered on
+# disk for
+SERVER_CACHE_EXPIRY = 60 * 60
+
+# How long, in seconds, to believe a Ubik database's sync site is where we
+# found it
+SYNC_SITE_TTL = 60
+
+# Open connections, keyed by (address, port, service, key, security) and kept
+# in least-recently-used order.  Each value is a (connection, last_used) tuple.
+conn_pool = OrderedDict()
+
+###############################################################################
+#
+# Get a connection to a server, reusing a pooled one if we have it.  This
+# saves setting up a new socket and security context each time.
+#
+###############################################################################
+def get_connection(addr, port, service, key, security):
+    global conn_pool
+
+    now = time.monotonic()
+    while conn_pool:
+        k, (conn, last_used) = next(iter(conn_pool.items()))
+        if now - last_used < CONN_POOL_IDLE:
+            break
+        verbose("Evicting idle connection to ", k[0], "\n")
+        del conn_pool[k]
+
+    k = (str(addr), port, service, key, security)
+    if k in conn_pool:
+        conn = conn_pool.pop(k)[0]
+    else:
+        conn = kafs.rx_new_connection(str(addr), port, service, key, security)
+        if len(conn_pool) >= CONN_POOL_MAX:
+            conn_pool.popitem(last=False)
+
+    conn_pool[k] = (conn, now)
+    return conn
+
+###############################################################################
+#
+# Get the path of the file in which we remember things about a cell's servers
+# between invocations.
+#
+###############################################################################
+def server_cache_path(name):
+    return cache_path("servers", name.lower().replace("/", "_"))
+
+###############################################################################
+#
+# Remove a connection from the pool, say because the server didn't respond on
+# it.  It is closed when the last reference to it goes away.
+#
+###############################################################################
+def discard_connection(conn):
+    global conn_pool
+
+    for k, v in list(conn_pool.items()):
+        if v[0] is conn:
+            del conn_pool[k]
+
 class CellError(exception.AFSException):
     """Error raised by L{cell} objects."""
 
@@ -52,6 +131,9 @@ class cell:
         self.__vlserver_names = dict()
         self.__vlservers = []
         self.__vlconn = None
+        self.__server_cache = None
+        self.__server_cache_dirty = False
+        self.__sync_sites = dict()
         self.__ptserver_index = None
         self.__ptconn = None
         self.__prcache = None
@@ -73,50 +155,38 @@ class cell:
     def look_up_vl_servers(self):
         verbose("-- Find VL servers for cell: ", self.__name, " --\n")
 
-        # Start by looking for SRV records in the DNS
-        try:
-            for SRV in dns.resolver.query("_afs3-vlserver._udp." + self.__name, "SRV"):
-                self.add_server("SRV", SRV.target)
-        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+        # Start by looking for SRV and AFSDB records in the DNS, asking for
+        # both at once
+        srv_query = ("_afs3-vlserver._udp." + self.__name, "SRV")
+        afsdb_query = (self.__name, "AFSDB")
+        results = dnscache.lookup_all([ srv_query, afsdb_query ])
+
+        hosts = []
+        for SRV in results[srv_query]:
+            self.add_server("SRV", SRV.target)
+            hosts.append(SRV.target)
+        if not results[srv_query]:
             verbose("Couldn't find any SRV records\n")
 
-        # Then we look for AFSDB records in the DNS
-        try:
-            for AFSDB in dns.resolver.query(self.__name, "AFSDB"):
-                self.add_server("AFSDB", AFSDB.hostname)
-        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+        for AFSDB in results[afsdb_query]:
+            self.add_server("AFSDB", AFSDB.hostname)
+            hosts.append(AFSDB.hostname)
+        if not results[afsdb_query]:
             verbose("Couldn't find any AFSDB records\n")
 
-        # Then parse the local afsdb file
-        #
-        # There is a problem here: the CellServDB file is liable to contain
-        # accented characters that aren't UTF-8, so we *have* to be set an
-        # appropriate encoding otherwise Python will raise an exception.
-        # Unfortunately, the character set for this file has not been
-        # standardised...
-        #
+        # Then resolve all the servers we found at once too, priming the
+        # address cache so that they don't get looked up one at a time.
+        # IPv6 isn't supported by the rest of the suite yet, so we only ask
+        # for A records.
+        queries = [ (str(host).lower().rstrip("."), "A") for host in hosts ]
+        for query, records in dnscache.lookup_all(queries).items():
+            for A in records:
+                addrcache.add(query[0], ipaddress.IPv4Address(A.address))
+
+        # Then look in the local afsdb file
         verbose("-- Searching CellServDB for cell: ", self.__name, " --\n")
-        found_cell = False
-        for line in open("/etc/openafs/CellServDB", "r", encoding="iso8859_1"):
-            line = str(line.rstrip())
-            if line == "":
-                continue
-            comment_ix = line.find("#")
-            if comment_ix == 0:
-                continue
-            comment = ""
-            if comment_ix > 0:
-                comment = line[comment_ix + 1:].lstrip()
-                line = line[:comment_ix].rstrip()
-            if line[0] == ">":
-                # New cell name
-                if found_cell:
-                    break
-                if line[1:] == self.__name:
-                    found_cell = True
-                continue
-            if found_cell:
-                self.add_server("CellServDB", comment, line)
+        for addr, comment in cellservdb.look_up_cell(self.__name):
+            self.add_server("CellServDB", comment, addr)
 
         self.__looked_up = True
 
@@ -149,7 +219,91 @@ class cell:
         if len(addrs) == 0:
             raise CellError("Couldn't find any VL servers in cell")
 
-        return addrs
+        # Prefer the servers that have been seen to respond fastest.  Those
+        # that we haven't measured are kept in their original order after
+        # them.
+        return sorted(addrs, key=lambda addr: self.server_rtt("vl", addr))
+
+    # Get the PT server addresses for the cell.  These are on the same
+    # machines as the VL servers, but we prefer the ones that were
+    # synchronised and then those that answered the VL probe fastest.
+    def query_pt_addrs(self):
+        return sorted(self.query_vl_addrs(),
+                      key=lambda addr: (not self.server_synced(addr),
+                                        self.server_rtt("vl", addr)))
+
+    # Load what we remembered about the cell's servers from a previous
+    # invocation, discarding anything that's too old
+    def load_server_cache(self):
+        if self.__server_cache != None:
+            return self.__server_cache
+
+        cache = { "vl" : dict(), "pt" : dict() }
+        path = server_cache_path(self.__name)
+        try:
+            with open(path, "r") as f:
+                saved = json.load(f)
+            now = time.time()
+            for service in cache:
+                for addr, entry in saved.get(service, dict()).items():
+                    if now - entry["time"] < SERVER_CACHE_EXPIRY:
+                        cache[service][addr] = entry
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            verbose("Ignoring server cache ", path, ": ", e, "\n")
+
+        self.__server_cache = cache
+        return cache
+
+    def save_server_cache(self):
+        path = server_cache_path(self.__name)
+        cache = self.load_server_cache()
+        if not write_cache_file(path, "w", lambda f: json.dump(cache, f)):
+            verbose("Couldn't save server cache ", path, "\n")
+
+    # Update what we remember about a server.  The cache is written back just
+    # the once, when we exit, rather than on every change.
+    def note_server(self, service, addr, **info):
+        entry = self.load_server_cache()[service].setdefault(str(addr), dict())
+        entry.update(info)
+        entry["time"] = time.time()
+        if not self.__server_cache_dirty:
+            self.__server_cache_dirty = True
+            atexit.register(self.save_server_cache)
+
+    # Note how long a VL server took to answer a probe, in seconds.  Only the
+    # probe is timed as other RPCs mostly measure how long the server spent
+    # working on them.
+    def record_rtt(self, addr, rtt):
+        self.note_server("vl", addr, rtt=rtt)
+
+    # Note whether a PT server claimed to be synchronised
+    def record_synced(self, addr, synced):
+        self.note_server("pt", addr, synced=synced)
+
+    # Get a server's recorded probe time, or infinity if we don't know it
+    def server_rtt(self, service, addr):
+        entry = self.load_server_cache()[service].get(str(addr))
+        if entry == None:
+            return float("inf")
+        return entry.get("rtt", float("inf"))
+
+    # Determine whether a PT server isn't known to be unsynchronised
+    def server_synced(self, addr):
+        entry = self.load_server_cache()["pt"].get(str(addr))
+        if entry == None:
+            return True
+        return entry.get("synced", True)
+
+    # Get the addresses of the servers that answered last time, fastest to
+    # answer the VL probe first.  The cache is keyed by string, so turn them
+    # back into address objects to match those that the lookups produce.
+    def cached_addrs(self, service):
+        cache = self.load_server_cache()[service]
+        addrs = [ addr for addr in cache if cache[addr].get("synced", True) ]
+        addrs.sort(key=lambda addr: self.server_rtt("vl", addr))
+        return [ ipaddress.ip_address(addr) for addr in addrs ]
 
     # Determine the cell security
     def determine_security(self, params):
@@ -171,36 +325,126 @@ class cell:
     # Open a VL Server connection
     def open_vl_server(self, params=None):
         if self.__vlconn:
-            return
+            return self.__vlconn
 
         key, security = self.determine_security(params)
 
-        for vladdr in self.query_vl_addrs():
+        # Try the servers that answered last time before going to the trouble
+        # of looking the cell up
+        if not self.__looked_up:
+            vladdrs = self.cached_addrs("vl")
+            if vladdrs:
+                verbose("Trying cached vlservers\n")
+                self.__vlconn = self.probe_vl_servers(vladdrs, key, security)
+                if self.__vlconn:
+                    return self.__vlconn
+
+        self.__vlconn = self.probe_vl_servers(self.query_vl_addrs(), key, security)
+        if not self.__vlconn:
+            raise CellError("Couldn't connect to a VL server")
+        return self.__vlconn
+
+    # Probe a set of VL servers all at once and get a connection to whichever
+    # answers first
+    def probe_vl_servers(self, vladdrs, key, security):
+        z_conns = []
+        for vladdr in vladdrs:
             verbose("Trying vlserver ", vladdr, "\n")
+            z_conns.append(get_connection(vladdr, kafs.VL_PORT, kafs.VL_SERVICE,
+                                          key, security))
 
-            z_conn = kafs.rx_new_connection(str(vladdr), kafs.VL_PORT, kafs.VL_SERVICE,
-                                            key, security)
-            try:
-                ret = kafs.VL_Probe(z_conn)
-                self.__vlconn = z_conn
-                break
-            except ConnectionRefusedError:
-                pass
-            del z_conn
-        else:
-            raise CellError("Couldn't connect to a VL server")
+        start = time.monotonic()
+        try:
+            i, ret = kafs.first(kafs.VL_Probe, z_conns, (),
+                                timeout=VL_PROBE_TIMEOUT)
+        except OSError as e:
+            verbose("No VL server responded: ", e, "\n")
+            for z_conn in z_conns:
+                discard_connection(z_conn)
+            return None
+
+        rtt = time.monotonic() - start
+        verbose("VL server ", vladdrs[i], " responded in ", int(rtt * 1000), "ms\n")
+        self.record_rtt(vladdrs[i], rtt)
+        return z_conns[i]
+
+    # Find the sync site of the Ubik database served on the given port, asking
+    # the database servers' vote service.  The answer is remembered for a while.
+    def find_sync_site(self, port):
+        if port in self.__sync_sites:
+            site, expiry = self.__sync_sites[port]
+            if time.monotonic() < expiry:
+                return site
+
+        addrs = self.query_vl_addrs()
+        conns = [ get_connection(addr, port, kafs.UBIK_VOTE_SERVICE, None, 0)
+                  for addr in addrs ]
+        try:
+            i, ret = kafs.first(kafs.Ubik_GetSyncSite, conns, (),
+                                timeout=VL_PROBE_TIMEOUT)
+            site = None
+            if ret.site != 0:
+                site = ipaddress.IPv4Address(ret.site)
+            else:
+                # The server doesn't know or is the sync site itself
+                ret = kafs.Ubik_Debug(conns[i], timeout=VL_PROBE_TIMEOUT)
+                if ret.db.amSyncSite:
+                    site = addrs[i]
+                elif ret.db.syncHost != 0:
+                    site = ipaddress.IPv4Address(ret.db.syncHost)
+        except (OSError, kafs.RemoteAbort) as e:
+            verbose("Couldn't find sync site: ", e, "\n")
+            site = None
+
+        verbose("Sync site for port ", port, " is ", site, "\n")
+        self.__sync_sites[port] = (site, time.monotonic() + SYNC_SITE_TTL)
+        return site
+
+    # Try to make a database-modifying call directly to the database's sync
+    # site.  Returns a (done, result) tuple; done is False if the sync site
+    # couldn't be found or didn't take the call.  The call is only given up on
+    # if we know it wasn't applied: anything else, such as a timeout, is
+    # raised as the write may have been done and mustn't be sent again.
+    def call_sync_site(self, params, port, service, rpc, *args, **kwargs):
+        site = self.find_sync_site(port)
+        if site == None:
+            return (False, None)
 
-        return self.__vlconn
+        key, security = self.determine_security(params)
+        try:
+            conn = get_connection(site, port, service, key, security)
+        except OSError as e:
+            verbose("Couldn't connect to sync site ", site, ": ", e, "\n")
+            del self.__sync_sites[port]
+            return (False, None)
+
+        try:
+            return (True, rpc(conn, *args, **kwargs))
+        except (ConnectionRefusedError, kafs.AbortUNOTSYNC) as e:
+            verbose("Sync site ", site, " didn't take call: ", e, "\n")
+            del self.__sync_sites[port]
+            discard_connection(conn)
+            return (False, None)
+
+    # Call out to the VL server.  Database writes must be marked with write=True
+    # so that they're sent to the sync site.
+    def call_vl_server(self, params, rpc, *args, write=False, **kwargs):
+        if write:
+            done, ret = self.call_sync_site(params, kafs.VL_PORT, kafs.VL_SERVICE,
+                                            rpc, *args, **kwargs)
+            if done:
+                return ret
+        return rpc(self.open_vl_server(params), *args, **kwargs)
 
     # Open a Volume Server connection
     def open_volume_server(self, server, params=None):
         key, security = self.determine_security(params)
 
         verbose("Trying volserver ", server.addr(), "\n")
-        vol_conn = kafs.rx_new_connection(str(server.addr()),
-                                          kafs.VOLSERVICE_PORT,
-                                          kafs.VOLSERVICE_ID,
-                                          key, security)
+        vol_conn = get_connection(server.addr(),
+                                  kafs.VOLSERVICE_PORT,
+                                  kafs.VOLSERVICE_ID,
+                                  key, security)
         return vol_conn
 
     # Open a BOS Server connection
@@ -208,46 +452,73 @@ class cell:
         key, security = self.determine_security(params)
 
         verbose("Trying bosserver ", server.addr(), "\n")
-        bos_conn = kafs.rx_new_connection(str(server.addr()),
-                                          kafs.BOSSERVICE_PORT,
-                                          kafs.BOSSERVICE_ID,
-                                          key, security)
+        bos_conn = get_connection(server.addr(),
+                                  kafs.BOSSERVICE_PORT,
+                                  kafs.BOSSERVICE_ID,
+                                  key, security)
         return bos_conn
 
     # Open a Protection Server connection
     def open_pt_server(self, params=None):
         if self.__ptserver_index == None:
-            self.__ptservers = self.query_vl_addrs()
+            # Start with the servers that answered last time, if any
+            self.__ptservers = self.cached_addrs("pt")
+            self.__ptservers_complete = False
             self.__ptserver_index = 0
 
+        if (self.__ptserver_index >= len(self.__ptservers) and
+            not self.__ptservers_complete):
+            for addr in self.query_pt_addrs():
+                if addr not in self.__ptservers:
+                    self.__ptservers.append(addr)
+            self.__ptservers_complete = True
+
         if self.__ptserver_index >= len(self.__ptservers):
             raise CellError("Couldn't connect to a PT server")
         server = self.__ptservers[self.__ptserver_index]
+        self.__ptserver_recorded = False
 
         key, security = self.determine_security(params)
 
         verbose("Trying ptserver ", server, "\n")
 
-        pt_conn = kafs.rx_new_connection(str(server),
-                                         kafs.PR_PORT,
-                                         kafs.PR_SERVICE,
-                                         key, security)
+        pt_conn = get_connection(server,
+                                 kafs.PR_PORT,
+                                 kafs.PR_SERVICE,
+                                 key, security)
         return pt_conn
 
-    # Find and call out to a working protection server
-    def call_pt_server(self, params, rpc, *args):
+    # Find and call out to a working protection server.  Database writes must be
+    # marked with write=True so that they're sent to the sync site, and are only
+    # tried on another server if they can't have been applied.
+    def call_pt_server(self, params, rpc, *args, write=False, **kwargs):
+        if write:
+            done, ret = self.call_sync_site(params, kafs.PR_PORT, kafs.PR_SERVICE,
+                                            rpc, *args, **kwargs)
+            if done:
+                return ret
+
         while True:
             if not self.__ptconn:
                 self.__ptconn = self.open_pt_server(params)
+            server = self.__ptservers[self.__ptserver_index]
             try:
-                return rpc(self.__ptconn, *args)
+                ret = rpc(self.__ptconn, *args, **kwargs)
+                if not self.__ptserver_recorded:
+                    self.record_synced(server, True)
+                    self.__ptserver_recorded = True
+                return ret
             except ConnectionRefusedError:
                 # Move on to the next server
                 verbose("Connection refused\n");
             except kafs.AbortUNOTSYNC:
                 verbose("Server is not synchronised\n");
+                self.record_synced(server, False)
             except OSError as e:
+                if write:
+                    raise
                 verbose(e, "\n");
+            discard_connection(self.__ptconn)
             self.__ptconn = None
             self.__ptserver_index += 1
 
@@ -0,0 +1,137 @@
+#
+# AFS Volume management toolkit: CellServDB index
+# -*- coding: utf-8 -*-
+#
+
+__copyright__ = """
+Copyright (C) 2014 Red Hat, Inc. All Rights Reserved.
+Written by David Howells (dhowells@redhat.com)
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public Licence version 2 as
+published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public Licence for more details.
+
+You should have received a copy of the GNU General Public Licence
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""
+
+from afs.lib.cachedir import cache_path, write_cache_file
+import bisect
+import json
+import os
+
+CELLSERVDB = "/etc/openafs/CellServDB"
+
+# Bump this if the layout of the saved index changes
+INDEX_VERSION = 2
+
+# The index of the file, once loaded: a dictionary with the file's identity,
+# the server list for each cell and a sorted list of cell names.
+index = None
+
+###############################################################################
+#
+# Parse the CellServDB file into a dictionary mapping each cell name to a list
+# of (address, comment) tuples.  If a cell is listed more than once, the first
+# entry wins.
+#
+# There is a problem here: the CellServDB file is liable to contain accented
+# characters that aren't UTF-8, so we *have* to be set an appropriate encoding
+# otherwise Python will raise an exception.  Unfortunately, the character set
+# for this file has not been standardised...
+#
+###############################################################################
+def parse(path):
+    cells = dict()
+    servers = None
+    for line in open(path, "r", encoding="iso8859_1"):
+        line = str(line.rstrip())
+        if line == "":
+            continue
+        comment_ix = line.find("#")
+        if comment_ix == 0:
+            continue
+        comment = ""
+        if comment_ix > 0:
+            comment = line[comment_ix + 1:].lstrip()
+            line = line[:comment_ix].rstrip()
+        if line[0] == ">":
+            # New cell name
+            name = line[1:]
+            if name in cells:
+                servers = None
+            else:
+                servers = []
+                cells[name] = servers
+            continue
+        if servers != None:
+            servers.append((line, comment))
+    return cells
+
+###############################################################################
+#
+# Get the index of the CellServDB file.  The index is saved in the cache
+# directory and reused for as long as the file's modification time and size
+# don't change, so the file is only reparsed when it gets updated.
+#
+# The saved index is JSON rather than a pickle as loading a pickle can run
+# arbitrary code, and anything that doesn't look like an index is discarded.
+#
+###############################################################################
+def get_index(path=CELLSERVDB):
+    global index
+
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return { "cells" : dict(), "names" : [] }
+    ident = [ INDEX_VERSION, os.path.abspath(path), st.st_mtime_ns, st.st_size ]
+
+    if index != None and index["ident"] == ident:
+        return index
+
+    saved = cache_path("CellServDB.index")
+    try:
+        with open(saved, "r") as f:
+            loaded = json.load(f)
+        if (loaded["ident"] == ident and
+            isinstance(loaded["cells"], dict) and
+            isinstance(loaded["names"], list)):
+            index = loaded
+            return index
+    except Exception:
+        pass
+
+    cells = parse(path)
+    index = { "ident" : ident, "cells" : cells, "names" : sorted(cells) }
+    write_cache_file(saved, "w", lambda f: json.dump(index, f))
+    return index
+
+###############################################################################
+#
+# Get the list of (address, comment) tuples for a cell's servers.  An empty
+# list is returned if the cell isn't listed.
+#
+###############################################################################
+def look_up_cell(name, path=CELLSERVDB):
+    return get_index(path)["cells"].get(name, [])
+
+###############################################################################
+#
+# Get the names of the cells that begin with the given prefix.
+#
+###############################################################################
+def complete_cell(prefix, path=CELLSERVDB):
+    names = get_index(path)["names"]
+    matches = []
+    i = bisect.bisect_left(names, prefix)
+    while i < len(names) and names[i].startswith(prefix):
+        matches.append(names[i])
+        i += 1
+    return matches
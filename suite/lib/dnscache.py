@@ -0,0 +1,83 @@
+#
+# AFS Volume management toolkit: DNS record cache
+# -*- coding: utf-8 -*-
+#
+
+__copyright__ = """
+Copyright (C) 2014 Red Hat, Inc. All Rights Reserved.
+Written by David Howells (dhowells@redhat.com)
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public Licence version 2 as
+published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public Licence for more details.
+
+You should have received a copy of the GNU General Public Licence
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+"""
+
+from afs.lib.output import *
+from concurrent.futures import ThreadPoolExecutor
+import dns.exception
+import dns.resolver
+import time
+
+# How long, in seconds, to remember that a record doesn't exist
+NEGATIVE_TTL = 60
+
+# Records, keyed by (name, type).  Each value is an (expiry, records) tuple.
+cache = dict()
+
+###############################################################################
+#
+# Look up the records of a particular type for a name, using the cached result
+# if it hasn't outlived its TTL.  A list of records is returned, which will be
+# empty if there aren't any or if the DNS couldn't be asked, in which case the
+# caller should fall back to other sources.
+#
+###############################################################################
+def lookup(name, rdtype):
+    global cache
+
+    key = (str(name).lower().rstrip("."), rdtype)
+    now = time.monotonic()
+    if key in cache:
+        expiry, records = cache[key]
+        if now < expiry:
+            return records
+
+    verbose("DNS lookup ", key[0], " ", rdtype, "\n")
+    try:
+        answer = dns.resolver.query(key[0], rdtype)
+        records = list(answer)
+        ttl = answer.rrset.ttl
+    except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+        records = []
+        ttl = NEGATIVE_TTL
+    except dns.exception.DNSException as e:
+        # Not an answer, so don't remember it
+        verbose("DNS lookup of ", key[0], " failed: ", e, "\n")
+        return []
+
+    cache[key] = (now + ttl, records)
+    return records
+
+###############################################################################
+#
+# Look up a set of (name, type) queries all at once.  Returns a dictionary
+# mapping each query to its list of records.
+#
+###############################################################################
+def lookup_all(queries):
+    queries = list(dict.fromkeys(queries))
+    if len(queries) <= 1:
+        return { q : lookup(*q) for q in queries }
+
+    with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+        futures = { q : executor.submit(lookup, *q) for q in queries }
+        return { q : futures[q].result() for q in queries }
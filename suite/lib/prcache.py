@@ -270,7 +270,10 @@ class prcache:
     def do_look_up_group(self, gid):
         verbose("Look up group ", gid, "\n")
         assert(gid < 0)
-        ret = self.__cell.call_pt_server(self.__params, kafs.PR_ListElements, gid)
+        # Large groups are returned as an array.array rather than a list of
+        # ints to save allocating an object per member.
+        ret = self.__cell.call_pt_server(self.__params, kafs.PR_ListElements, gid,
+                                         bulk_array=True)
         entries = ret.elist
         self.__groups[gid] = pr_group(gid, entries)
 
@@ -0,0 +1,51 @@
+#
+# Build and load the kafs_test module from tests/kafs_test.c.  It is linked
+# against the kafs module that's being tested so that it can call into the
+# marshalling code without needing a server.
+#
+# Copyright (C) 2014 Red Hat, Inc. All Rights Reserved.
+# Written by David Howells (dhowells@redhat.com)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public Licence
+# as published by the Free Software Foundation; either version
+# 2 of the Licence, or (at your option) any later version.
+#
+
+import atexit
+import importlib.util
+import os
+import shutil
+import subprocess
+import sysconfig
+import tempfile
+
+import kafs
+
+top = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+cc = os.environ.get("CC", "cc")
+
+available = (shutil.which(cc) is not None and
+             os.path.exists(os.path.join(top, "afs_py.h")))
+
+module = None
+
+def load():
+    """Build the kafs_test module if need be and import it"""
+    global module
+    if module:
+        return module
+
+    tmpdir = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree, tmpdir)
+    path = os.path.join(tmpdir, "kafs_test" + sysconfig.get_config_var("EXT_SUFFIX"))
+    subprocess.run([ cc, "-shared", "-fPIC",
+                     "-I", sysconfig.get_paths()["include"], "-I", top,
+                     "-o", path, os.path.join(top, "tests", "kafs_test.c"),
+                     os.path.abspath(kafs.__file__) ],
+                   check=True)
+
+    spec = importlib.util.spec_from_file_location("kafs_test", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,254 @@
+/* Test hooks into the kafs module for things that otherwise need a server
+ *
+ * Copyright (C) 2014 Red Hat, Inc. All Rights Reserved.
+ * Written by David Howells (dhowells@redhat.com)
+ *
+ * This program is free software; you can redistribute it and/or
+ * modify it under the terms of the GNU General Public Licence
+ * as published by the Free Software Foundation; either version
+ * 2 of the Licence, or (at your option) any later version.
+ *
+ * This is built by tests/cext.py and linked against the kafs module so that
+ * it can drive the marshalling code directly.
+ */
+
+#include <Python.h>
+#include "structmember.h"
+#include <arpa/inet.h>
+#include "py_rxgen.h"
+#include "afs_py.h"
+#include "rxgen.h"
+
+static struct rx_connection test_conn;
+
+/*
+ * Get the encoded contents of a call's buffers as a bytes object and then
+ * rewind the call so that those contents can be decoded.
+ */
+static PyObject *test_encoded_data(struct rx_call *call)
+{
+	struct rx_buf *buf;
+	PyObject *data;
+	unsigned remain = call->data_count, n;
+	char *p;
+
+	data = PyBytes_FromStringAndSize(NULL, remain);
+	if (!data)
+		return NULL;
+	p = PyBytes_AS_STRING(data);
+
+	for (buf = call->buffer_head; buf; buf = buf->next) {
+		n = buf->size < remain ? buf->size : remain;
+		memcpy(p, buf->buf, n);
+		p += n;
+		remain -= n;
+		buf->io_cursor = n;
+	}
+
+	call->data_start = call->data_cursor = call->data_stop = call->buffer_head->buf;
+	call->data_count = PyBytes_GET_SIZE(data);
+	call->need_size = call->data_count;
+	rxrpc_dec_advance_buffer(call);
+	return data;
+}
+
+/*
+ * Encode a bulk 32-bit integer array and decode it again into a new array of
+ * the same type: (encoded, decoded) = int32_roundtrip(array)
+ */
+static PyObject *test_int32_roundtrip(PyObject *self, PyObject *args)
+{
+	struct rx_call *call;
+	PyObject *obj, *typecode, *data = NULL, *decoded = NULL, *ret = NULL;
+
+	if (!PyArg_ParseTuple(args, "O", &obj))
+		return NULL;
+
+	typecode = PyObject_GetAttrString(obj, "typecode");
+	if (!typecode)
+		return NULL;
+
+	call = rxrpc_alloc_call(&test_conn, 0);
+	if (!call) {
+		Py_DECREF(typecode);
+		return PyErr_NoMemory();
+	}
+
+	if (py_enc_int32_array(call, obj) < 0) {
+		if (!PyErr_Occurred())
+			PyErr_SetFromErrno(PyExc_OSError);
+		goto out;
+	}
+
+	data = test_encoded_data(call);
+	if (!data)
+		goto out;
+
+	call->bulk_count = rxrpc_dec(call);
+	call->bulk_index = 0;
+	if (rxrpc_post_dec(call) < 0) {
+		PyErr_SetFromErrno(PyExc_OSError);
+		goto out;
+	}
+
+	decoded = py_rxgen_new_int_array(PyUnicode_AsUTF8(typecode), call->bulk_count);
+	if (!decoded)
+		goto out;
+	switch (py_dec_into_int32_array(call, decoded)) {
+	case 0:
+		ret = PyTuple_Pack(2, data, decoded);
+		break;
+	case 1:
+		PyErr_SetString(PyExc_EOFError, "Decoder wanted more data");
+		break;
+	default:
+		if (!PyErr_Occurred())
+			PyErr_SetFromErrno(PyExc_OSError);
+		break;
+	}
+
+out:
+	Py_XDECREF(decoded);
+	Py_XDECREF(data);
+	Py_DECREF(typecode);
+	rxrpc_terminate_call(call, 0);
+	return ret;
+}
+
+/*
+ * The struct types that the tests can turn into records and arrays.
+ */
+struct test_struct_type {
+	PyTypeObject	*type;
+	size_t		size;		/* Size of the C struct */
+	size_t		offset;		/* Offset of the struct in the wrapper */
+	int (*premarshal)(PyObject *obj);
+	PyObject *(*data_to_type)(const void *data);
+	PyObject *(*data_to_record)(const void *data);
+};
+
+#define TEST_STRUCT(T) {					\
+		&py_##T##Type, sizeof(struct T),		\
+		offsetof(struct py_##T, x),			\
+		py_premarshal_##T,				\
+		py_data_to_##T,					\
+		py_data_to_##T##_record,			\
+	}
+
+static const struct test_struct_type test_struct_types[] = {
+	TEST_STRUCT(afsUUID),
+	TEST_STRUCT(uvldbentry),
+	TEST_STRUCT(volintInfo),
+};
+
+/*
+ * Find the description of a wrapper's type and flush the wrapper's cached
+ * members into its C struct.  Returns a pointer to the struct.
+ */
+static const void *test_struct_data(PyObject *obj,
+				    const struct test_struct_type **_st)
+{
+	const struct test_struct_type *st;
+	int i;
+
+	for (i = 0; i < sizeof(test_struct_types) / sizeof(test_struct_types[0]); i++) {
+		st = &test_struct_types[i];
+		if (Py_TYPE(obj) == st->type) {
+			if (st->premarshal(obj) < 0)
+				return NULL;
+			*_st = st;
+			return (const void *)obj + st->offset;
+		}
+	}
+
+	PyErr_Format(PyExc_TypeError, "Unsupported struct type %s",
+		     Py_TYPE(obj)->tp_name);
+	return NULL;
+}
+
+/*
+ * Make an immutable record from a struct wrapper, as would be decoded with
+ * records=True: rec = record(wrapper)
+ */
+static PyObject *test_record(PyObject *self, PyObject *args)
+{
+	const struct test_struct_type *st;
+	const void *data;
+	PyObject *obj;
+
+	if (!PyArg_ParseTuple(args, "O", &obj))
+		return NULL;
+	data = test_struct_data(obj, &st);
+	if (!data)
+		return NULL;
+	return st->data_to_record(data);
+}
+
+/*
+ * Make a bulk struct array holding copies of a list of struct wrappers, as
+ * would be decoded with bulk_array=True: array = struct_array(wrappers[, records])
+ */
+static PyObject *test_struct_array(PyObject *self, PyObject *args)
+{
+	const struct test_struct_type *st = NULL;
+	const void *data;
+	PyObject *list, *array = NULL;
+	Py_ssize_t i, n;
+	int records = 0;
+
+	if (!PyArg_ParseTuple(args, "O!|p", &PyList_Type, &list, &records))
+		return NULL;
+
+	n = PyList_GET_SIZE(list);
+	for (i = 0; i < n; i++) {
+		const struct test_struct_type *type;
+
+		data = test_struct_data(PyList_GET_ITEM(list, i), &type);
+		if (!data)
+			goto error;
+		if (st && type != st) {
+			PyErr_SetString(PyExc_TypeError, "Mixed struct types");
+			goto error;
+		}
+		if (!st) {
+			st = type;
+			array = py_rxgen_new_struct_array(
+				n, st->size,
+				records ? st->data_to_record : st->data_to_type);
+			if (!array)
+				return NULL;
+		}
+		memcpy(py_rxgen_struct_array_elem(array, i), data, st->size);
+	}
+
+	if (!array)
+		PyErr_SetString(PyExc_ValueError, "Empty list");
+	return array;
+
+error:
+	Py_XDECREF(array);
+	return NULL;
+}
+
+static PyMethodDef test_methods[] = {
+	{"int32_roundtrip", test_int32_roundtrip, METH_VARARGS,
+	 "Encode a bulk integer array and decode it again" },
+	{"record", test_record, METH_VARARGS,
+	 "Make an immutable record from a struct wrapper" },
+	{"struct_array", test_struct_array, METH_VARARGS,
+	 "Make a bulk struct array from a list of struct wrappers" },
+	{}
+};
+
+static struct PyModuleDef test_module = {
+	PyModuleDef_HEAD_INIT,
+	.m_name		= "kafs_test",
+	.m_doc		= "Test hooks into the kafs module",
+	.m_size		= -1,
+	.m_methods	= test_methods,
+};
+
+PyMODINIT_FUNC PyInit_kafs_test(void)
+{
+	return PyModule_Create(&test_module);
+}
@@ -0,0 +1,28 @@
+#
+# Make the command suite importable by the tests.  The suite is installed as
+# the "afs" package, so point a package of that name at the suite directory in
+# the source tree.
+#
+# Copyright (C) 2014 Red Hat, Inc. All Rights Reserved.
+# Written by David Howells (dhowells@redhat.com)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public Licence
+# as published by the Free Software Foundation; either version
+# 2 of the Licence, or (at your option) any later version.
+#
+
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+top = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+suite = os.path.join(top, "suite")
+
+if "afs" not in sys.modules:
+    pkgdir = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree, pkgdir)
+    os.symlink(suite, os.path.join(pkgdir, "afs"))
+    sys.path[0:0] = [ pkgdir, suite ]
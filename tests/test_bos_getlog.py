@@ -0,0 +1,104 @@
+#!/usr/bin/python3
+#
+# Check the split receive handler of "bos getlog", which streams the log to
+# stdout with split_info.recv_into_fd().  The handler is driven by a model of
+# the split-call machinery in py_rxsplit.c as there's no server to talk to.
+#
+# Copyright (C) 2014 Red Hat, Inc. All Rights Reserved.
+# Written by David Howells (dhowells@redhat.com)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public Licence
+# as published by the Free Software Foundation; either version
+# 2 of the Licence, or (at your option) any later version.
+#
+
+import suite_env
+import io
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import afs.commands.bos.getlog as getlog
+
+class model_split_info:
+    """Deliver a reply in the given chunks to a split receive handler"""
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.data = b""
+        self.state = 0
+        self.target = None
+        self.sink = None
+        self.python_bytes = 0
+
+    def will_recv_all(self):
+        pass
+
+    def data_available(self):
+        if not self.data and not self.chunks:
+            return None
+        return len(self.data)
+
+    def begin_recv(self, buf, padded=True):
+        self.sink = (buf, len(buf))
+        return True
+
+    def recv_into_fd(self, file, size=None, padded=True):
+        self.sink = (file.fileno(), size)
+        return True
+
+    def run(self, handler):
+        while handler.receive(self):
+            if self.sink:
+                sink, size = self.sink
+                self.sink = None
+                if len(self.data) < size:
+                    raise AssertionError("Handler asked for data not yet received")
+                chunk, self.data = self.data[:size], self.data[size:]
+                if isinstance(sink, int):
+                    os.write(sink, chunk)
+                else:
+                    sink[:] = chunk
+                    self.python_bytes += size
+                self.state += 1
+            elif self.data_available() == 0:
+                self.data += self.chunks.pop(0)
+
+class bos_getlog_receive(unittest.TestCase):
+    def receive(self, chunks):
+        with tempfile.TemporaryFile() as f:
+            stdout = io.TextIOWrapper(f, write_through=True)
+            split_info = model_split_info(chunks)
+            with mock.patch.object(sys, "stdout", stdout):
+                split_info.run(getlog.split_handler())
+                sys.stdout.flush()
+            f.seek(0)
+            data = f.read()
+            stdout.detach()
+        return data, split_info
+
+    def test_log_is_streamed_to_stdout(self):
+        log = b"".join(b"line %d of the log\n" % i for i in range(1000))
+        chunks = [ log[i:i + 4000] for i in range(0, len(log), 4000) ] + [ b"\0" ]
+        data, split_info = self.receive(chunks)
+        self.assertEqual(data, log)
+
+        # Only the last byte of each chunk passes through a Python object
+        self.assertEqual(split_info.python_bytes, len(chunks))
+
+    def test_terminating_nul_attached_to_data(self):
+        data, split_info = self.receive([ b"abc", b"def\0" ])
+        self.assertEqual(data, b"abcdef")
+
+    def test_single_byte_chunks(self):
+        data, split_info = self.receive([ b"a", b"b", b"c", b"\0" ])
+        self.assertEqual(data, b"abc")
+
+    def test_empty_log(self):
+        data, split_info = self.receive([ b"\0" ])
+        self.assertEqual(data, b"")
+
+if __name__ == '__main__':
+    unittest.main()
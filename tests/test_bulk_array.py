@@ -0,0 +1,56 @@
+#!/usr/bin/python3
+#
+# Check the encoding of bulk 32-bit integer arrays from array.array objects and
+# their decoding back into them, as used with bulk_array=True.
+#
+# Copyright (C) 2014 Red Hat, Inc. All Rights Reserved.
+# Written by David Howells (dhowells@redhat.com)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public Licence
+# as published by the Free Software Foundation; either version
+# 2 of the Licence, or (at your option) any later version.
+#
+
+import array
+import struct
+import unittest
+
+import cext
+
+@unittest.skipUnless(cext.available, "needs a C compiler and the generated sources")
+class int32_array_roundtrip(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.kafs_test = cext.load()
+
+    def roundtrip(self, typecode, values):
+        a = array.array(typecode, values)
+        data, decoded = self.kafs_test.int32_roundtrip(a)
+        code = "I" if typecode.isupper() else "i"
+        self.assertEqual(data, struct.pack(">I{:d}{:s}".format(len(a), code),
+                                           len(a), *a))
+        self.assertEqual(type(decoded), array.array)
+        self.assertEqual(decoded.typecode, typecode)
+        self.assertEqual(decoded, a)
+
+    def test_unsigned(self):
+        self.roundtrip("I", [ 0, 1, 0x7fffffff, 0x80000000, 0xffffffff ])
+
+    def test_signed(self):
+        self.roundtrip("i", [ 0, 1, -1, -0x80000000, 0x7fffffff ])
+
+    def test_empty(self):
+        self.roundtrip("I", [])
+
+    def test_spans_buffers(self):
+        # Big enough to be spread over several of the call's buffers
+        self.roundtrip("I", [ (i * 2654435761) & 0xffffffff for i in range(20000) ])
+
+    def test_wrong_element_size(self):
+        for typecode in ("h", "q", "d"):
+            with self.assertRaises(TypeError):
+                self.kafs_test.int32_roundtrip(array.array(typecode, [ 1, 2 ]))
+
+if __name__ == '__main__':
+    unittest.main()
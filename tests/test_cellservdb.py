@@ -0,0 +1,118 @@
+#!/usr/bin/python3
+#
+# Check the CellServDB index in the command suite and that the copy of it that
+# is saved in the cache directory is only used whilst the file is unchanged.
+#
+# Copyright (C) 2014 Red Hat, Inc. All Rights Reserved.
+# Written by David Howells (dhowells@redhat.com)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public Licence
+# as published by the Free Software Foundation; either version
+# 2 of the Licence, or (at your option) any later version.
+#
+
+import suite_env
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import afs.lib.cellservdb as cellservdb
+
+CELLSERVDB = """\
+>example.com	#Example Cell
+192.0.2.1			#afs1.example.com
+192.0.2.2			#afs2.example.com
+>example.org	#Another Cell
+198.51.100.7			#afs.example.org
+>example.com	#Duplicate that should be ignored
+192.0.2.99			#bogus.example.com
+>grand.central.org	#GCO Public CellServDB
+18.9.48.14			#grand.mit.edu
+"""
+
+class cellservdb_index(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        p = mock.patch.dict(os.environ, { "XDG_CACHE_HOME" : self.tmpdir })
+        p.start()
+        self.addCleanup(p.stop)
+        cellservdb.index = None
+
+        self.path = os.path.join(self.tmpdir, "CellServDB")
+        self.write_db(CELLSERVDB)
+        self.saved = cellservdb.cache_path("CellServDB.index")
+
+    def write_db(self, text, mtime=1400000000):
+        with open(self.path, "w", encoding="iso8859_1") as f:
+            f.write(text)
+        os.utime(self.path, (mtime, mtime))
+
+    def servers(self, cell):
+        return [ addr for addr, comment in cellservdb.look_up_cell(cell, self.path) ]
+
+    def test_lookup(self):
+        self.assertEqual(self.servers("example.com"), [ "192.0.2.1", "192.0.2.2" ])
+        self.assertEqual(self.servers("example.org"), [ "198.51.100.7" ])
+        self.assertEqual(self.servers("example.net"), [])
+        self.assertEqual(cellservdb.look_up_cell("example.org", self.path)[0][1],
+                         "afs.example.org")
+
+    def test_complete_cell(self):
+        self.assertEqual(cellservdb.complete_cell("example.", self.path),
+                         [ "example.com", "example.org" ])
+        self.assertEqual(cellservdb.complete_cell("g", self.path),
+                         [ "grand.central.org" ])
+        self.assertEqual(cellservdb.complete_cell("z", self.path), [])
+        self.assertEqual(len(cellservdb.complete_cell("", self.path)), 3)
+
+    def test_missing_file(self):
+        path = os.path.join(self.tmpdir, "nonexistent")
+        self.assertEqual(cellservdb.look_up_cell("example.com", path), [])
+        self.assertEqual(cellservdb.complete_cell("", path), [])
+
+    def test_saved_index_is_reused(self):
+        self.servers("example.com")
+        self.assertTrue(os.path.exists(self.saved))
+
+        cellservdb.index = None
+        with mock.patch.object(cellservdb, "parse") as parse:
+            self.assertEqual(self.servers("example.com"), [ "192.0.2.1", "192.0.2.2" ])
+        parse.assert_not_called()
+
+    def test_rebuilt_when_file_changes(self):
+        self.servers("example.com")
+
+        # The same modification time, but a different size
+        self.write_db(CELLSERVDB.replace("192.0.2.2", "192.0.2.30"))
+        self.assertEqual(self.servers("example.com"), [ "192.0.2.1", "192.0.2.30" ])
+
+        # The same size, but a different modification time
+        self.write_db(CELLSERVDB.replace("192.0.2.2", "192.0.2.40"), mtime=1400000001)
+        cellservdb.index = None
+        self.assertEqual(self.servers("example.com"), [ "192.0.2.1", "192.0.2.40" ])
+
+        with open(self.saved) as f:
+            self.assertEqual(json.load(f)["cells"]["example.com"][1][0], "192.0.2.40")
+
+    def test_bad_saved_index_is_ignored(self):
+        os.makedirs(os.path.dirname(self.saved))
+        bad = [ b"not json",
+                b'{ "ident" : null }',
+                json.dumps({ "ident" : "x", "cells" : [], "names" : [] }).encode(),
+                pickle.dumps({ "cells" : dict(), "names" : [] }) ]
+        for data in bad:
+            with open(self.saved, "wb") as f:
+                f.write(data)
+            cellservdb.index = None
+            self.assertEqual(self.servers("example.org"), [ "198.51.100.7" ])
+            with open(self.saved) as f:
+                self.assertIn("example.org", json.load(f)["names"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+#!/usr/bin/python3
+#
+# Check the DNS record cache in the command suite with the resolver stubbed
+# out, so that no DNS server is needed.
+#
+# Copyright (C) 2014 Red Hat, Inc. All Rights Reserved.
+# Written by David Howells (dhowells@redhat.com)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public Licence
+# as published by the Free Software Foundation; either version
+# 2 of the Licence, or (at your option) any later version.
+#
+
+import suite_env
+import sys
+import threading
+import types
+import unittest
+from unittest import mock
+
+# Provide just enough of dnspython for the cache if it isn't installed.  The
+# resolver itself is replaced by each test.
+try:
+    import dns.exception
+    import dns.resolver
+except ImportError:
+    dns = types.ModuleType("dns")
+    dns.exception = types.ModuleType("dns.exception")
+    dns.resolver = types.ModuleType("dns.resolver")
+    class DNSException(Exception):
+        pass
+    dns.exception.DNSException = DNSException
+    dns.resolver.NXDOMAIN = type("NXDOMAIN", (DNSException,), {})
+    dns.resolver.NoAnswer = type("NoAnswer", (DNSException,), {})
+    dns.resolver.query = None
+    sys.modules.update({ "dns" : dns,
+                         "dns.exception" : dns.exception,
+                         "dns.resolver" : dns.resolver })
+
+import afs.lib.dnscache as dnscache
+
+class answer(list):
+    """Stand-in for a dns.resolver.Answer"""
+    def __init__(self, records, ttl):
+        super().__init__(records)
+        self.rrset = types.SimpleNamespace(ttl=ttl)
+
+class dns_cache(unittest.TestCase):
+    def setUp(self):
+        dnscache.cache.clear()
+        self.now = 1000.0
+        self.queries = []
+        self.replies = dict()
+        self.lock = threading.Lock()
+        clock = types.SimpleNamespace(monotonic=lambda: self.now)
+        for p in (mock.patch.object(dnscache, "time", clock),
+                  mock.patch.object(dns.resolver, "query", self.query)):
+            p.start()
+            self.addCleanup(p.stop)
+
+    def query(self, name, rdtype):
+        with self.lock:
+            self.queries.append((name, rdtype))
+        reply = self.replies[(name, rdtype)]
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    def test_cached_until_ttl_expires(self):
+        self.replies[("example.com", "AFSDB")] = answer([ "rec1", "rec2" ], 300)
+        self.assertEqual(dnscache.lookup("example.com", "AFSDB"), [ "rec1", "rec2" ])
+        self.now += 299
+        self.assertEqual(dnscache.lookup("Example.COM.", "AFSDB"), [ "rec1", "rec2" ])
+        self.assertEqual(len(self.queries), 1)
+
+        self.now += 2
+        self.replies[("example.com", "AFSDB")] = answer([ "rec3" ], 300)
+        self.assertEqual(dnscache.lookup("example.com", "AFSDB"), [ "rec3" ])
+        self.assertEqual(len(self.queries), 2)
+
+    def test_missing_record_is_cached(self):
+        self.replies[("example.com", "SRV")] = dns.resolver.NXDOMAIN()
+        self.replies[("example.org", "SRV")] = dns.resolver.NoAnswer()
+        for name in ("example.com", "example.org"):
+            self.assertEqual(dnscache.lookup(name, "SRV"), [])
+            self.assertEqual(dnscache.lookup(name, "SRV"), [])
+        self.assertEqual(len(self.queries), 2)
+
+        self.now += dnscache.NEGATIVE_TTL
+        self.assertEqual(dnscache.lookup("example.com", "SRV"), [])
+        self.assertEqual(len(self.queries), 3)
+
+    def test_failed_query_is_not_cached(self):
+        self.replies[("example.com", "SRV")] = dns.exception.DNSException("timeout")
+        self.assertEqual(dnscache.lookup("example.com", "SRV"), [])
+        self.assertNotIn(("example.com", "SRV"), dnscache.cache)
+
+        self.replies[("example.com", "SRV")] = answer([ "rec" ], 60)
+        self.assertEqual(dnscache.lookup("example.com", "SRV"), [ "rec" ])
+        self.assertEqual(len(self.queries), 2)
+
+    def test_lookup_all_runs_queries_concurrently(self):
+        queries = [ ("example.com", "SRV"), ("example.com", "AFSDB"),
+                    ("example.org", "SRV") ]
+        for q in queries:
+            self.replies[q] = answer([ q[1] + " for " + q[0] ], 60)
+
+        # Each stub query waits for all the others to have started, which can
+        # only happen if they are issued in parallel.
+        barrier = threading.Barrier(len(queries), timeout=10)
+        def query(name, rdtype):
+            barrier.wait()
+            return self.query(name, rdtype)
+
+        with mock.patch.object(dns.resolver, "query", query):
+            results = dnscache.lookup_all(queries + [ queries[0] ])
+        self.assertEqual(results, { q : [ q[1] + " for " + q[0] ] for q in queries })
+        self.assertEqual(sorted(self.queries), sorted(queries))
+
+    def test_lookup_all_falls_back_on_failure(self):
+        self.replies[("example.com", "SRV")] = dns.exception.DNSException("timeout")
+        self.replies[("example.com", "AFSDB")] = answer([ "rec" ], 60)
+        results = dnscache.lookup_all([ ("example.com", "SRV"),
+                                        ("example.com", "AFSDB") ])
+        self.assertEqual(results, { ("example.com", "SRV") : [],
+                                    ("example.com", "AFSDB") : [ "rec" ] })
+
+if __name__ == '__main__':
+    unittest.main()
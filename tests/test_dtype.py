@@ -0,0 +1,145 @@
+#!/usr/bin/python3
+#
+# Check that the dtype descriptions attached to the struct types match the
+# layout of the C structs that bulk struct arrays export, so that
+# numpy.frombuffer(array, dtype=type.dtype) sees the right values.  NumPy
+# isn't needed: the description is interpreted here with the struct module.
+#
+# Copyright (C) 2014 Red Hat, Inc. All Rights Reserved.
+# Written by David Howells (dhowells@redhat.com)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public Licence
+# as published by the Free Software Foundation; either version
+# 2 of the Licence, or (at your option) any later version.
+#
+
+import kafs
+import struct
+import unittest
+
+import cext
+
+CODES = { "u1" : "B", "u2" : "H", "u4" : "I", "i1" : "b", "i2" : "h", "i4" : "i" }
+
+def field_size(fmt):
+    if isinstance(fmt, dict):
+        return fmt["itemsize"]
+    if isinstance(fmt, tuple):
+        base, shape = fmt
+        if base == "S":
+            return shape
+        return field_size(base) * shape[0]
+    return struct.calcsize("=" + CODES[fmt])
+
+def unpack(fmt, buf, offset):
+    """Extract a value from a buffer as described by a dtype format"""
+    if isinstance(fmt, dict):
+        return { name : unpack(f, buf, offset + o)
+                 for name, f, o in zip(fmt["names"], fmt["formats"], fmt["offsets"]) }
+    if isinstance(fmt, tuple):
+        base, shape = fmt
+        if base == "S":
+            return bytes(buf[offset:offset + shape]).split(b"\0", 1)[0].decode()
+        size = field_size(base)
+        return [ unpack(base, buf, offset + i * size) for i in range(shape[0]) ]
+    return struct.unpack_from("=" + CODES[fmt], buf, offset)[0]
+
+def fill(obj, fmt, counter):
+    """Give every member of a struct wrapper a distinct value"""
+    for name, f in zip(fmt["names"], fmt["formats"]):
+        if isinstance(f, dict):
+            fill(getattr(obj, name), f, counter)
+        elif isinstance(f, tuple) and f[0] == "S":
+            counter[0] += 1
+            setattr(obj, name, "s{:d}".format(counter[0]))
+        elif isinstance(f, tuple) and isinstance(f[0], dict):
+            elems = getattr(obj, name)
+            for i in range(f[1][0]):
+                fill(elems[i], f[0], counter)
+        elif isinstance(f, tuple):
+            bits = field_size(f[0]) * 8
+            values = []
+            for i in range(f[1][0]):
+                counter[0] += 1
+                values.append(counter[0] % (1 << (bits - 1)))
+            setattr(obj, name, values)
+        else:
+            counter[0] += 1
+            setattr(obj, name, counter[0] % (1 << (field_size(f) * 8 - 1)))
+
+def plain(obj, fmt):
+    """Get the members of a struct wrapper in the form unpack() produces"""
+    if isinstance(fmt, dict):
+        return { name : plain(getattr(obj, name), f)
+                 for name, f in zip(fmt["names"], fmt["formats"]) }
+    if isinstance(fmt, tuple) and fmt[0] != "S":
+        return [ plain(obj[i], fmt[0]) for i in range(fmt[1][0]) ]
+    return obj
+
+def struct_types():
+    for name in sorted(dir(kafs)):
+        t = getattr(kafs, name)
+        if isinstance(t, type) and "dtype" in t.__dict__:
+            yield t
+
+class dtype_layout(unittest.TestCase):
+    def test_descriptions_are_consistent(self):
+        types = list(struct_types())
+        self.assertGreater(len(types), 0)
+        for t in types:
+            with self.subTest(type=t.__name__):
+                d = t.dtype
+                obj = t()
+                self.assertEqual(len(d["names"]), len(d["formats"]))
+                self.assertEqual(len(d["names"]), len(d["offsets"]))
+                end = 0
+                for name, f, o in zip(d["names"], d["formats"], d["offsets"]):
+                    self.assertTrue(hasattr(obj, name), name)
+                    self.assertGreaterEqual(o, end, name)
+                    end = o + field_size(f)
+                self.assertLessEqual(end, d["itemsize"])
+
+    @unittest.skipUnless(cext.available, "needs a C compiler and the generated sources")
+    def test_matches_exported_data(self):
+        kafs_test = cext.load()
+        for t in (kafs.afsUUID, kafs.uvldbentry, kafs.volintInfo):
+            with self.subTest(type=t.__name__):
+                counter = [ 0 ]
+                elems = [ t() for i in range(3) ]
+                for e in elems:
+                    fill(e, t.dtype, counter)
+
+                array = kafs_test.struct_array(elems)
+                buf = memoryview(array)
+                itemsize = t.dtype["itemsize"]
+                self.assertEqual(buf.nbytes, itemsize * len(elems))
+                for i, e in enumerate(elems):
+                    self.assertEqual(unpack(t.dtype, buf, i * itemsize),
+                                     plain(e, t.dtype))
+                buf.release()
+
+    @unittest.skipUnless(cext.available, "needs a C compiler and the generated sources")
+    def test_no_export_after_access(self):
+        # Element wrappers are copies, so once any exist the raw array may be
+        # stale and mustn't be exported
+        kafs_test = cext.load()
+        fresh = lambda: kafs_test.struct_array([ kafs.afsUUID() for i in range(2) ])
+
+        array = fresh()
+        array[1].time_low = 3
+        with self.assertRaisesRegex(BufferError, "accessed"):
+            memoryview(array)
+
+        array = fresh()
+        array[0] = kafs.afsUUID()
+        with self.assertRaisesRegex(BufferError, "accessed"):
+            memoryview(array)
+
+        array = fresh()
+        array[0:1]
+        with self.assertRaisesRegex(BufferError, "accessed"):
+            memoryview(array)
+
+if __name__ == '__main__':
+    unittest.main()
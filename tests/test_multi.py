@@ -0,0 +1,37 @@
+#!/usr/bin/python3
+#
+# Check that kafs.multi() and kafs.first() accept each form of RPC wrapper.
+# No connections are given, so no server is needed.
+#
+# Copyright (C) 2014 Red Hat, Inc. All Rights Reserved.
+# Written by David Howells (dhowells@redhat.com)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public Licence
+# as published by the Free Software Foundation; either version
+# 2 of the Licence, or (at your option) any later version.
+#
+
+import unittest
+import kafs
+
+class multi_rpc_forms(unittest.TestCase):
+    forms = [ kafs.VL_Probe, kafs.VL_Probe_begin, kafs.VL_Probe_async ]
+
+    def test_multi_accepts_each_form(self):
+        for rpc in self.forms:
+            with self.subTest(rpc=rpc.__name__):
+                self.assertEqual(kafs.multi(rpc, [], ()), [])
+
+    def test_first_accepts_each_form(self):
+        for rpc in self.forms:
+            with self.subTest(rpc=rpc.__name__):
+                with self.assertRaises(ValueError):
+                    kafs.first(rpc, [], ())
+
+    def test_non_rpc_rejected(self):
+        with self.assertRaises(TypeError):
+            kafs.multi(len, [], ())
+
+if __name__ == "__main__":
+    unittest.main()
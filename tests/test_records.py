@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+#
+# Check the immutable record types that structs are decoded into when an RPC
+# is called with records=True.
+#
+# Copyright (C) 2014 Red Hat, Inc. All Rights Reserved.
+# Written by David Howells (dhowells@redhat.com)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public Licence
+# as published by the Free Software Foundation; either version
+# 2 of the Licence, or (at your option) any later version.
+#
+
+import kafs
+import sys
+import unittest
+
+import cext
+
+def make_uvldbentry():
+    e = kafs.uvldbentry()
+    e.name = "root.cell"
+    e.nServers = 2
+    e.serverNumber[1].time_low = 0x80000001
+    e.serverNumber[1].node = [ 1, 2, 3, 4, 5, 0xff ]
+    e.serverUnique = list(range(kafs.NMAXNSERVERS))
+    e.volumeId = [ 536870912, 536870913, 0xffffffff ]
+    e.flags = 0x7000
+    return e
+
+@unittest.skipUnless(cext.available, "needs a C compiler and the generated sources")
+class immutable_records(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.kafs_test = cext.load()
+
+    def test_values(self):
+        r = self.kafs_test.record(make_uvldbentry())
+        self.assertIs(type(r), kafs.uvldbentry_record)
+        self.assertEqual(r.name, "root.cell")
+        self.assertEqual(r.nServers, 2)
+        self.assertEqual(r.flags, 0x7000)
+        self.assertEqual(r.serverUnique, tuple(range(kafs.NMAXNSERVERS)))
+        self.assertEqual(r.volumeId, (536870912, 536870913, 0xffffffff))
+        self.assertEqual(len(r.serverNumber), kafs.NMAXNSERVERS)
+        self.assertIs(type(r.serverNumber[1]), kafs.afsUUID_record)
+        self.assertEqual(r.serverNumber[1].time_low, 0x80000001)
+        self.assertEqual(r.serverNumber[1].node, (1, 2, 3, 4, 5, 0xff))
+        self.assertEqual(r.serverNumber[0].time_low, 0)
+
+        v = kafs.volintInfo()
+        v.name = "root.cell.readonly"
+        v.inUse = 1
+        v.destroyMe = 0xff
+        r = self.kafs_test.record(v)
+        self.assertEqual((r.name, r.inUse, r.destroyMe, r.spare3),
+                         ("root.cell.readonly", 1, 0xff, 0))
+
+    def test_immutable(self):
+        r = self.kafs_test.record(make_uvldbentry())
+        for name in ("name", "nServers", "serverNumber", "serverUnique", "flags"):
+            with self.subTest(name=name):
+                with self.assertRaises(AttributeError):
+                    setattr(r, name, 1)
+                with self.assertRaises(AttributeError):
+                    delattr(r, name)
+        with self.assertRaises(AttributeError):
+            r.serverNumber[1].time_low = 1
+        with self.assertRaises(AttributeError):
+            r.new_attribute = 1
+        with self.assertRaises(TypeError):
+            r.serverUnique[0] = 1
+        with self.assertRaises(TypeError):
+            kafs.uvldbentry_record()
+
+    def test_independent_of_source(self):
+        e = make_uvldbentry()
+        r = self.kafs_test.record(e)
+        e.nServers = 5
+        e.serverNumber[1].time_low = 7
+        del e
+        self.assertEqual(r.nServers, 2)
+        self.assertEqual(r.serverNumber[1].time_low, 0x80000001)
+
+    def test_compact(self):
+        # A record is just an object header and a copy of the C struct
+        r = self.kafs_test.record(make_uvldbentry())
+        self.assertLessEqual(sys.getsizeof(r),
+                             object.__basicsize__ + kafs.uvldbentry.dtype["itemsize"] + 16)
+        self.assertFalse(hasattr(r, "__dict__"))
+
+if __name__ == '__main__':
+    unittest.main()
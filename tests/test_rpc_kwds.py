@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+#
+# Check the argument handling of the generated RPC stubs.  Everything here is
+# rejected or accepted before a call is allocated, so no server is needed: a
+# call that gets as far as wanting a connection fails on the None passed in
+# place of one.
+#
+# Copyright (C) 2014 Red Hat, Inc. All Rights Reserved.
+# Written by David Howells (dhowells@redhat.com)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public Licence
+# as published by the Free Software Foundation; either version
+# 2 of the Licence, or (at your option) any later version.
+#
+
+import kafs
+import unittest
+
+NO_CONNECTION = "must be kafs.rx_connection"
+
+class bad_bool:
+    def __bool__(self):
+        raise ValueError("No truth here")
+
+class rpc_keywords(unittest.TestCase):
+    forms = [ kafs.VL_GetAddrs, kafs.VL_GetAddrs_begin, kafs.VL_GetAddrs_async ]
+
+    def rejects(self, exc, regex, **kwds):
+        for rpc in self.forms:
+            with self.subTest(rpc=rpc.__name__):
+                with self.assertRaisesRegex(exc, regex):
+                    rpc(None, 0, 0, **kwds)
+
+    def accepts(self, **kwds):
+        for rpc in self.forms:
+            with self.subTest(rpc=rpc.__name__):
+                with self.assertRaisesRegex(TypeError, NO_CONNECTION):
+                    rpc(None, 0, 0, **kwds)
+
+    def test_all_forms_exist(self):
+        for name in dir(kafs):
+            if name.endswith("_async"):
+                base = name[:-len("_async")]
+                self.assertTrue(callable(getattr(kafs, base)), base)
+                self.assertTrue(callable(getattr(kafs, base + "_begin")), base)
+
+    def test_no_keywords(self):
+        self.accepts()
+
+    def test_unknown_keyword(self):
+        self.rejects(TypeError, "only take", bogus=1)
+
+    def test_timeout(self):
+        for timeout in (None, 0, -1, 0.0001, 1, 2.5, 86400):
+            self.accepts(timeout=timeout)
+        self.rejects(TypeError, "real number", timeout="10")
+        self.rejects(OverflowError, "too large", timeout=1e12)
+
+    def test_bulk_array(self):
+        for flag in (True, False, 1, 0, None):
+            self.accepts(bulk_array=flag)
+        self.rejects(ValueError, "No truth", bulk_array=bad_bool())
+
+    def test_records(self):
+        for flag in (True, False, 1, 0, None):
+            self.accepts(records=flag)
+        self.accepts(records=True, bulk_array=True, timeout=5)
+        self.rejects(ValueError, "No truth", records=bad_bool())
+
+    def test_connection_timeout(self):
+        # The timeout is checked before the socket is opened
+        with self.assertRaisesRegex(TypeError, "real number"):
+            kafs.rx_new_connection("192.0.2.1", kafs.VL_PORT, kafs.VL_SERVICE,
+                                   None, 0, 0, 0, False, "10")
+        with self.assertRaisesRegex(OverflowError, "too large"):
+            kafs.rx_new_connection("192.0.2.1", kafs.VL_PORT, kafs.VL_SERVICE,
+                                   None, 0, 0, 0, False, 1e12)
+
+if __name__ == '__main__':
+    unittest.main()
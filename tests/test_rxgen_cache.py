@@ -0,0 +1,147 @@
+#!/usr/bin/python3
+#
+# Check rxgen's incremental regeneration: the parse cache that it keeps in
+# .rxgen-cache, the leaving alone of unchanged output files and the removal of
+# the units of packages that have gone away.
+#
+# Copyright (C) 2014 Red Hat, Inc. All Rights Reserved.
+# Written by David Howells (dhowells@redhat.com)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public Licence
+# as published by the Free Software Foundation; either version
+# 2 of the Licence, or (at your option) any later version.
+#
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from glob import glob
+
+top = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+rxgen = os.path.join(top, "rxgen", "rxgen.py")
+
+TA_XG = """\
+package TA_
+
+const TA_SERVICE = 1;
+
+struct ta_rec {
+	uint32_t	x;
+	uint32_t	y;
+};
+
+Get (IN uint32_t which, OUT ta_rec *rec) = 1;
+"""
+
+TB_XG = """\
+package TB_
+
+struct tb_rec {
+	ta_rec		inner;
+	uint32_t	z;
+};
+
+Put (IN tb_rec *rec) = 2;
+"""
+
+class rxgen_cache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.write("a.xg", TA_XG)
+        self.write("b.xg", TB_XG)
+
+    def write(self, name, text):
+        with open(os.path.join(self.tmpdir, name), "w") as f:
+            f.write(text)
+
+    def rxgen(self, *args):
+        r = subprocess.run([ sys.executable, rxgen ] + list(args), cwd=self.tmpdir,
+                           stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                           universal_newlines=True)
+        self.assertEqual(r.returncode, 0, r.stdout)
+        return r.stdout.splitlines()
+
+    def outputs(self):
+        files = dict()
+        for path in glob(os.path.join(self.tmpdir, "afs_*")):
+            with open(path) as f:
+                files[os.path.basename(path)] = f.read()
+        return files
+
+    def cache(self):
+        return sorted(os.listdir(os.path.join(self.tmpdir, ".rxgen-cache")))
+
+    def test_unchanged_inputs_use_cache(self):
+        out = self.rxgen("a.xg", "b.xg")
+        self.assertIn("Parsing a.xg", out)
+        self.assertIn("Parsing b.xg", out)
+        self.assertEqual(len(self.cache()), 2)
+        files = self.outputs()
+        self.assertIn("afs_xg_ta.c", files)
+        self.assertIn("afs_xg_tb.c", files)
+
+        out = self.rxgen("a.xg", "b.xg")
+        self.assertEqual(out, [ "Using cached parse of a.xg",
+                                "Using cached parse of b.xg" ])
+        self.assertEqual(self.outputs(), files)
+
+    def test_changed_input_is_reparsed(self):
+        self.rxgen("a.xg", "b.xg")
+        before = self.cache()
+
+        self.write("b.xg", TB_XG.replace("= 2;", "= 3;"))
+        out = self.rxgen("a.xg", "b.xg")
+        self.assertIn("Using cached parse of a.xg", out)
+        self.assertIn("Parsing b.xg", out)
+        self.assertNotIn("Parsing a.xg", out)
+        self.assertIn("Writing afs_xg_tb.c", out)
+        self.assertNotIn("Writing afs_xg_ta.c", out)
+
+        # The entry for the old b.xg is pruned
+        after = self.cache()
+        self.assertEqual(len(after), 2)
+        self.assertEqual(len(set(before) & set(after)), 1)
+
+        # Changing an earlier file invalidates the later ones too
+        self.write("a.xg", TA_XG.replace("= 1;", "= 4;"))
+        out = self.rxgen("a.xg", "b.xg")
+        self.assertIn("Parsing a.xg", out)
+        self.assertIn("Parsing b.xg", out)
+
+    def test_cached_output_matches_uncached(self):
+        self.rxgen("a.xg", "b.xg")
+        self.write("b.xg", TB_XG.replace("= 2;", "= 3;"))
+        self.rxgen("a.xg", "b.xg")
+        cached = self.outputs()
+
+        for path in glob(os.path.join(self.tmpdir, "afs_*")):
+            os.remove(path)
+        self.rxgen("--no-cache", "a.xg", "b.xg")
+        self.assertEqual(self.outputs(), cached)
+
+    def test_corrupt_cache_is_ignored(self):
+        self.rxgen("a.xg", "b.xg")
+        for name in self.cache():
+            with open(os.path.join(self.tmpdir, ".rxgen-cache", name), "wb") as f:
+                f.write(b"garbage")
+        out = self.rxgen("a.xg", "b.xg")
+        self.assertIn("Parsing a.xg", out)
+        self.assertIn("Parsing b.xg", out)
+
+    def test_stale_package_units_removed(self):
+        self.rxgen("a.xg", "b.xg")
+        out = self.rxgen("a.xg")
+        files = self.outputs()
+        for name in ("afs_xg_tb.c", "afs_xg_tb.h", "afs_py_tb.c", "afs_py_tb.h"):
+            self.assertIn("Removing " + name, out)
+            self.assertNotIn(name, files)
+        self.assertIn("afs_xg_ta.c", files)
+        self.assertNotIn("afs_xg_tb.h", files["afs_xg.h"])
+
+if __name__ == '__main__':
+    unittest.main()
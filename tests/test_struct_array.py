@@ -0,0 +1,48 @@
+#!/usr/bin/python3
+#
+# Check the lifetime handling of the views onto struct arrays embedded in
+# records.  Each case is run in a child interpreter so that a bad free()
+# aborting the process shows up as a failure rather than killing the run.
+#
+# Copyright (C) 2014 Red Hat, Inc. All Rights Reserved.
+# Written by David Howells (dhowells@redhat.com)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public Licence
+# as published by the Free Software Foundation; either version
+# 2 of the Licence, or (at your option) any later version.
+#
+
+import subprocess
+import sys
+import unittest
+
+def run(code):
+    return subprocess.run([ sys.executable, "-c", "import kafs\n" + code ],
+                          stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                          universal_newlines=True)
+
+class struct_array_lifetime(unittest.TestCase):
+    def check(self, code):
+        r = run(code)
+        self.assertEqual(r.returncode, 0, r.stdout)
+        return r.stdout
+
+    def test_view_dropped_before_owner(self):
+        self.check("e = kafs.uvldbentry()\n"
+                   "s = e.serverNumber\n"
+                   "s[1].time_low = 3\n"
+                   "del s\n"
+                   "del e\n")
+
+    def test_view_dropped_after_owner(self):
+        out = self.check("e = kafs.uvldbentry()\n"
+                         "s = e.serverNumber\n"
+                         "s[1].time_low = 3\n"
+                         "del e\n"
+                         "print(len(s), s[1].time_low)\n"
+                         "del s\n")
+        self.assertEqual(out.split(), [ "13", "3" ])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+#!/usr/bin/python3
+#
+# Check that the pure-Python XDR codec that rxgen writes to afs_xdr.py
+# produces the same encoding as the C encoders that it generates.  The C side
+# is tests/xdr_encode.c, built against the generated sources in the top of the
+# tree.
+#
+# Copyright (C) 2014 Red Hat, Inc. All Rights Reserved.
+# Written by David Howells (dhowells@redhat.com)
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public Licence
+# as published by the Free Software Foundation; either version
+# 2 of the Licence, or (at your option) any later version.
+#
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from glob import glob
+
+import afs_xdr
+
+top = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+cc = os.environ.get("CC", "cc")
+
+###############################################################################
+#
+# The records that xdr_encode.c fills in
+#
+###############################################################################
+def make_uvldbentry():
+    servers = [ afs_xdr.afsUUID(0x01020304 * (i + 1), 0xa000 + i, 0xb000 + i,
+                                0xc0 + i, 0xd0 + i,
+                                [ 0x10 * j + i for j in range(6) ])
+                for i in range(afs_xdr.NMAXNSERVERS) ]
+    return afs_xdr.uvldbentry(
+        name = "root.cell",
+        nServers = 3,
+        serverNumber = servers,
+        serverUnique = [ 0x80000000 + i for i in range(afs_xdr.NMAXNSERVERS) ],
+        serverPartition = list(range(afs_xdr.NMAXNSERVERS)),
+        serverFlags = [ 1 << i for i in range(afs_xdr.NMAXNSERVERS) ],
+        volumeId = [ 0x20000001 + i for i in range(afs_xdr.MAXTYPES) ],
+        cloneId = 0,
+        flags = 0x7000,
+        spares1 = 0xffffffff - 1, spares2 = 0xffffffff - 2,
+        spares3 = 0xffffffff - 3, spares4 = 0xffffffff - 4,
+        spares5 = 0xffffffff - 5, spares6 = 0xffffffff - 6,
+        spares7 = 0xffffffff - 7, spares8 = 0xffffffff - 8,
+        spares9 = 0xffffffff - 9)
+
+def make_volintInfo():
+    return afs_xdr.volintInfo(
+        name = "root.cell.readonly",
+        volid = 536870913, type = 1, backupID = 536870915,
+        parentID = 536870912, cloneID = 536870914, status = 0x4c6,
+        copyDate = 1400000000, inUse = 1, needsSalvaged = 0, destroyMe = 0xff,
+        creationDate = 1400000001, accessDate = 1400000002,
+        updateDate = 1400000003, backupDate = 1400000004,
+        dayUse = 77, filecount = 1234, maxquota = 5000, size = 4096,
+        flags = 0x80000000, spare0 = 0, spare1 = 1, spare2 = 2,
+        spare3 = 0xffffffff)
+
+@unittest.skipUnless(shutil.which(cc) and os.path.exists(os.path.join(top, "afs_xg.h")),
+                     "needs a C compiler and the generated sources")
+class xdr_codec_vs_c(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.prog = os.path.join(cls.tmpdir, "xdr_encode")
+        subprocess.run([ cc, "-I", top, "-o", cls.prog,
+                         os.path.join(top, "tests", "xdr_encode.c"),
+                         os.path.join(top, "af_rxrpc.c") ] +
+                       sorted(glob(os.path.join(top, "afs_xg_*.c"))) +
+                       [ "-lpthread" ],
+                       check=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def c_encode(self, name):
+        return subprocess.run([ self.prog, name ], stdout=subprocess.PIPE,
+                              check=True).stdout
+
+    def check(self, name, rec):
+        cls = getattr(afs_xdr, name)
+        encode = getattr(afs_xdr, "encode_" + name)
+        decode = getattr(afs_xdr, "decode_" + name)
+
+        data = self.c_encode(name)
+        self.assertEqual(len(data), cls.xdr_size)
+        self.assertEqual(encode(rec), data)
+        self.assertEqual(decode(data), rec)
+        self.assertEqual(decode(b"\xff" * 4 + data, 4), rec)
+        with self.assertRaises(afs_xdr.XDRError):
+            decode(data[:-1])
+
+    def test_uvldbentry(self):
+        self.check("uvldbentry", make_uvldbentry())
+
+    def test_volintInfo(self):
+        self.check("volintInfo", make_volintInfo())
+
+    def test_name_too_long(self):
+        rec = make_volintInfo()
+        rec.name = "x" * 32
+        with self.assertRaises(afs_xdr.XDRError):
+            afs_xdr.encode_volintInfo(rec)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+/* Encode some fixed records with the rxgen C encoders for test_xdr_codec.py
+ *
+ * Copyright (C) 2014 Red Hat, Inc. All Rights Reserved.
+ * Written by David Howells (dhowells@redhat.com)
+ *
+ * This program is free software; you can redistribute it and/or
+ * modify it under the terms of the GNU General Public Licence
+ * as published by the Free Software Foundation; either version
+ * 2 of the Licence, or (at your option) any later version.
+ */
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include "afs_xg.h"
+
+/*
+ * The values here must match those built by the test script.
+ */
+static void fill_uvldbentry(struct uvldbentry *p)
+{
+	int i, j;
+
+	strcpy(p->name, "root.cell");
+	p->nServers = 3;
+	for (i = 0; i < NMAXNSERVERS; i++) {
+		p->serverNumber[i].time_low = 0x01020304 * (i + 1);
+		p->serverNumber[i].time_mid = 0xa000 + i;
+		p->serverNumber[i].time_hi_and_version = 0xb000 + i;
+		p->serverNumber[i].clock_seq_hi_and_reserved = 0xc0 + i;
+		p->serverNumber[i].clock_seq_low = 0xd0 + i;
+		for (j = 0; j < 6; j++)
+			p->serverNumber[i].node[j] = 0x10 * j + i;
+		p->serverUnique[i] = 0x80000000 + i;
+		p->serverPartition[i] = i;
+		p->serverFlags[i] = 1 << i;
+	}
+	for (i = 0; i < MAXTYPES; i++)
+		p->volumeId[i] = 0x20000001 + i;
+	p->cloneId = 0;
+	p->flags = 0x7000;
+	p->spares1 = 0xffffffff - 1;
+	p->spares2 = 0xffffffff - 2;
+	p->spares3 = 0xffffffff - 3;
+	p->spares4 = 0xffffffff - 4;
+	p->spares5 = 0xffffffff - 5;
+	p->spares6 = 0xffffffff - 6;
+	p->spares7 = 0xffffffff - 7;
+	p->spares8 = 0xffffffff - 8;
+	p->spares9 = 0xffffffff - 9;
+}
+
+static void fill_volintInfo(struct volintInfo *p)
+{
+	strcpy(p->name, "root.cell.readonly");
+	p->volid = 536870913;
+	p->type = 1;
+	p->backupID = 536870915;
+	p->parentID = 536870912;
+	p->cloneID = 536870914;
+	p->status = 0x4c6;
+	p->copyDate = 1400000000;
+	p->inUse = 1;
+	p->needsSalvaged = 0;
+	p->destroyMe = 0xff;
+	p->creationDate = 1400000001;
+	p->accessDate = 1400000002;
+	p->updateDate = 1400000003;
+	p->backupDate = 1400000004;
+	p->dayUse = 77;
+	p->filecount = 1234;
+	p->maxquota = 5000;
+	p->size = 4096;
+	p->flags = 0x80000000;
+	p->spare0 = 0;
+	p->spare1 = 1;
+	p->spare2 = 2;
+	p->spare3 = 0xffffffff;
+}
+
+/*
+ * Write out the encoded data held in a call's buffers.
+ */
+static int dump_call(struct rx_call *call)
+{
+	struct rx_buf *buf;
+	unsigned remain = call->data_count, n;
+
+	for (buf = call->buffer_head; buf && remain; buf = buf->next) {
+		n = buf->size < remain ? buf->size : remain;
+		if (fwrite(buf->buf, 1, n, stdout) != n)
+			return -1;
+		remain -= n;
+	}
+	return remain ? -1 : 0;
+}
+
+int main(int argc, char *argv[])
+{
+	static struct rx_connection conn;
+	struct rx_call *call;
+	union {
+		struct uvldbentry uvldbentry;
+		struct volintInfo volintInfo;
+	} u;
+
+	if (argc != 2) {
+		fprintf(stderr, "Usage: %s uvldbentry|volintInfo\n", argv[0]);
+		exit(2);
+	}
+
+	call = rxrpc_alloc_call(&conn, 0);
+	if (!call) {
+		perror("rxrpc_alloc_call");
+		exit(1);
+	}
+
+	memset(&u, 0, sizeof(u));
+	if (strcmp(argv[1], "uvldbentry") == 0) {
+		fill_uvldbentry(&u.uvldbentry);
+		rxgen_encode_uvldbentry(call, &u.uvldbentry);
+	} else if (strcmp(argv[1], "volintInfo") == 0) {
+		fill_volintInfo(&u.volintInfo);
+		rxgen_encode_volintInfo(call, &u.volintInfo);
+	} else {
+		fprintf(stderr, "Unknown type %s\n", argv[1]);
+		exit(2);
+	}
+
+	if (rxrpc_post_enc(call) < 0 || dump_call(call) < 0) {
+		perror(argv[1]);
+		exit(1);
+	}
+	return 0;
+}